@@ -0,0 +1,425 @@
+"""
+Synthetic chat load generator for the global message pipeline.
+
+Drives the real GlobalEventHandler (and through it the firsts, watchstreak and
+custom command cogs) with fake twitchio Message/Channel/Author objects against
+a temporary database. Twitch Helix, chat sends and {urlfetch} targets are
+stubbed with configurable latency, and the run reports sustained throughput
+and p50/p99/p999 message latency.
+
+Usage:
+    python benchmarks/chat_load.py --channels 20 --chatters 200 --duration 30
+    python benchmarks/chat_load.py --rate 500 --helix-latency 0.05
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# data.py creates its database in the working directory on import,
+# so move into a temporary directory before anything imports it.
+os.chdir(tempfile.mkdtemp(prefix="luminbot-load-"))
+sys.path.insert(0, REPO_ROOT)
+
+from bot.cogs import global_event_handler, watchstreak  # noqa: E402
+from bot.utilities import ids, metrics, attendance, announcements, command_state, urlfetch  # noqa: E402
+from data import data  # noqa: E402
+
+# Storage operations are timed like in the bot
+data.set_timer(metrics.timer)
+
+# Ratio of each kind of chat line in the generated traffic
+DEFAULT_COMMAND_MIX = {
+    "chatter": 0.83,  # Plain chat lines
+    "command": 0.10,  # Custom commands (including aliases)
+    "phrase": 0.02,  # Chat lines containing a command's trigger phrase
+    "urlfetch": 0.03,  # Custom commands using {urlfetch}
+    "unknown": 0.02,  # Lines starting with ! that are not custom commands
+}
+
+WORDS = ["hello", "pog", "lol", "gg", "nice", "KEKW", "what", "is", "this", "song", "chat", "clip", "that"]
+
+
+class FakeAuthor:
+    """
+    Stand-in for twitchio.Chatter.
+    """
+
+    def __init__(self, user_id, name, is_mod=False, is_subscriber=False):
+        self.id = str(user_id)
+        self.name = name
+        self.display_name = name
+        self.is_mod = is_mod
+        self.is_subscriber = is_subscriber
+        self.is_vip = False
+        self.is_broadcaster = False
+
+
+class FakeChannel:
+    """
+    Stand-in for twitchio.Channel, counting sent messages.
+    """
+
+    def __init__(self, name, send_latency):
+        self.name = name
+        self.send_latency = send_latency
+        self.sent = 0
+
+    async def send(self, content):
+        await asyncio.sleep(self.send_latency)
+        self.sent += 1
+
+
+class FakeMessage:
+    """
+    Stand-in for twitchio.Message.
+    """
+
+    def __init__(self, content, channel, author):
+        self.content = content
+        self.channel = channel
+        self.author = author
+        self.echo = False
+        self.tags = {}
+
+
+class FakeUser:
+    """
+    Stand-in for twitchio.PartialUser.
+    """
+
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+
+
+class FakeStream:
+    """
+    Stand-in for twitchio.Stream.
+    """
+
+    def __init__(self, stream_id, user):
+        self.id = stream_id
+        self.user = user
+        self.game_name = "osu!"
+        self.title = "load test"
+        self.viewer_count = 1000
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+
+
+class FakeBot:
+    """
+    Stand-in for the LuminBot instance with a stubbed Helix API.
+    """
+
+    def __init__(self, channels, helix_latency):
+        self.channels = {channel.name: channel for channel in channels}
+        self.helix_latency = helix_latency
+        self.helix_calls = 0
+        self.nick = "luminbot"
+
+    @property
+    def connected_channels(self):
+        return list(self.channels.values())
+
+    def get_channel(self, name):
+        return self.channels.get(name)
+
+    async def fetch_streams(self, user_logins=None, type="all"):
+        await asyncio.sleep(self.helix_latency)
+        self.helix_calls += 1
+        return [FakeStream(f"stream-{login}", FakeUser(channel_ids[login], login)) for login in user_logins or []]
+
+
+# Channel name -> ID mapping used by the stubbed ids utility
+channel_ids = {}
+
+
+def stub_ids(user_names):
+    """
+    Replace the Helix-backed ID lookups with local dictionary lookups.
+
+    Parameters:
+        user_names (dict): Mapping of user IDs to names for every simulated user.
+    """
+    names_to_ids = {name: user_id for user_id, name in user_names.items()}
+
+    ids.get_id_from_name = lambda name: names_to_ids.get(name.lower(), -1) if name else -1
+    ids.get_name_from_id = lambda user_id: user_names.get(str(user_id), "unknown")
+
+
+async def start_urlfetch_server(latency):
+    """
+    Start a local HTTP server standing in for {urlfetch} targets.
+
+    Parameters:
+        latency (float): Seconds to wait before answering each request.
+
+    Returns:
+        tuple: The aiohttp runner and the base URL of the server.
+    """
+
+    async def handle(request):
+        await asyncio.sleep(latency)
+        return web.Response(text="\n".join(f"line {number}" for number in range(1, 51)))
+
+    app = web.Application()
+    app.router.add_get("/{name}", handle)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def seed_database(args, urlfetch_base):
+    """
+    Fill the temporary database with channels and their custom commands.
+
+    Parameters:
+        args (argparse.Namespace): The benchmark options.
+        urlfetch_base (str): Base URL of the local urlfetch server.
+
+    Returns:
+        tuple: The channel names and, per channel, the plain and urlfetch command triggers and the trigger phrases.
+    """
+    channel_names = [f"channel{index}" for index in range(args.channels)]
+    triggers = {}
+
+    for index, name in enumerate(channel_names):
+        channel_id = str(100000 + index)
+        channel_ids[name] = channel_id
+
+        commands = {}
+        plain, fetching, phrases = [], [], []
+        for command_index in range(args.commands):
+            command_name = f"!cmd{command_index}"
+            aliases = [f"!c{command_index}a{alias}" for alias in range(args.aliases)]
+
+            if command_index < args.commands // 10:
+                message = f"{{user}} -> {{urlfetch {urlfetch_base}/{command_index} line random}}"
+                fetching.extend([command_name] + aliases)
+            else:
+                message = f"{{user}} hugs {{touser}} ({{count}} hugs so far)"
+                plain.extend([command_name] + aliases)
+
+            # Every fifth command also answers a trigger phrase, like an FAQ entry
+            command_phrases = [f"faq {command_index}"] if command_index % 5 == 0 else []
+            phrases.extend(command_phrases)
+
+            commands[command_name] = {
+                "message": message,
+                "usage_count": 0,
+                "user_level": "Everyone",
+                "cooldown": 0,
+                "last_used": 0,
+                "aliases": aliases,
+                "triggers": command_phrases,
+            }
+
+        data.update_data(channel_id, {"commands": commands})
+        triggers[name] = (plain, fetching, phrases)
+
+    return channel_names, triggers
+
+
+def generate_message(args, rng, channels, triggers, chatters):
+    """
+    Build one random chat message following the command mix.
+
+    Parameters:
+        args (argparse.Namespace): The benchmark options.
+        rng (random.Random): The random generator.
+        channels (list): The fake channels.
+        triggers (dict): Per channel, the plain and urlfetch command triggers and the trigger phrases.
+        chatters (list): The fake authors.
+
+    Returns:
+        FakeMessage: The generated message.
+    """
+    channel = rng.choice(channels)
+    author = rng.choice(chatters)
+    kind = rng.choices(list(args.mix), weights=list(args.mix.values()))[0]
+
+    plain, fetching, phrases = triggers[channel.name]
+    chatter_line = " ".join(rng.choices(WORDS, k=rng.randint(1, 8)))
+
+    if kind == "command" and plain:
+        content = f"{rng.choice(plain)} {rng.choice(chatters).name}"
+    elif kind == "urlfetch" and fetching:
+        content = rng.choice(fetching)
+    elif kind == "phrase" and phrases:
+        content = f"{chatter_line} {rng.choice(phrases)} {rng.choice(WORDS)}"
+    elif kind == "unknown":
+        content = f"!{rng.choice(WORDS)} {chatter_line}"
+    else:
+        content = chatter_line
+
+    return FakeMessage(content, channel, author)
+
+
+async def run_benchmark(args):
+    """
+    Run the load test and print the results.
+
+    Parameters:
+        args (argparse.Namespace): The benchmark options.
+    """
+    rng = random.Random(args.seed)
+
+    runner, urlfetch_base = await start_urlfetch_server(args.urlfetch_latency)
+    channel_names, triggers = seed_database(args, urlfetch_base)
+
+    chatters = [FakeAuthor(500000 + index, f"chatter{index}", is_subscriber=index % 3 == 0)
+                for index in range(args.chatters)]
+
+    user_names = {channel_id: name for name, channel_id in channel_ids.items()}
+    user_names.update({author.id: author.name for author in chatters})
+    stub_ids(user_names)
+
+    channels = [FakeChannel(name, args.send_latency) for name in channel_names]
+    bot = FakeBot(channels, args.helix_latency)
+
+    # Build the real cog without running __init__, which would start its 60 second background routine
+    handler = global_event_handler.GlobalEventHandler.__new__(global_event_handler.GlobalEventHandler)
+    handler.bot = bot
+    callbacks = type(handler)._events["event_message"]
+
+    async def dispatch(message):
+        for callback in callbacks:
+            await callback(handler, message)
+
+    latencies = metrics.Histogram()
+    errors = 0
+    processed = 0
+
+    async def process(message, scheduled_at):
+        nonlocal errors, processed
+        try:
+            await dispatch(message)
+        except Exception as error:
+            errors += 1
+            if errors <= 5:
+                print(f"[load] Error while handling '{message.content}': {error!r}")
+        # Latency is measured from the scheduled arrival time to avoid coordinated omission
+        latencies.record(time.perf_counter() - scheduled_at)
+        processed += 1
+
+    # Warm up caches so the measured window reflects steady state
+    for _ in range(args.warmup):
+        await dispatch(generate_message(args, rng, channels, triggers, chatters))
+
+    # Stand-in for the Watchstreak cog's routine, which is not started either
+    async def flush_watchstreaks():
+        while True:
+            await asyncio.sleep(attendance.ATTENDANCE_FLUSH_INTERVAL)
+            await watchstreak.flush_attendance(bot)
+
+    # Stand-in for the GlobalEventHandler's announcement routine
+    async def flush_announcements():
+        while True:
+            await asyncio.sleep(announcements.ANNOUNCEMENT_FLUSH_INTERVAL)
+            await announcements.flush(bot)
+
+    flusher = asyncio.create_task(flush_watchstreaks())
+    announcer = asyncio.create_task(flush_announcements())
+
+    start_time = time.perf_counter()
+    deadline = start_time + args.duration
+
+    if args.rate:
+        # Open loop: messages arrive at a fixed rate whether or not the bot keeps up
+        tasks = set()
+        interval = 1 / args.rate
+        next_arrival = start_time
+        while next_arrival < deadline:
+            now = time.perf_counter()
+            if now < next_arrival:
+                await asyncio.sleep(next_arrival - now)
+            task = asyncio.create_task(process(generate_message(args, rng, channels, triggers, chatters), next_arrival))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_arrival += interval
+        if tasks:
+            await asyncio.wait(tasks)
+    else:
+        # Closed loop: a fixed number of chat connections each send as fast as they are served
+        async def worker():
+            while time.perf_counter() < deadline:
+                await process(generate_message(args, rng, channels, triggers, chatters), time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+    elapsed = time.perf_counter() - start_time
+    flusher.cancel()
+    announcer.cancel()
+    await watchstreak.flush_attendance(bot)
+    await announcements.flush(bot, force=True)
+    command_state.flush()
+    await urlfetch.close_session()
+    await runner.cleanup()
+
+    print("")
+    print(f"Channels: {args.channels} | Chatters: {args.chatters} | Commands per channel: {args.commands}")
+    print(f"Helix latency: {args.helix_latency * 1000:.1f} ms | Send latency: {args.send_latency * 1000:.1f} ms | "
+          f"urlfetch latency: {args.urlfetch_latency * 1000:.1f} ms")
+    print(f"Messages: {processed} in {elapsed:.2f} s ({processed / elapsed:.1f} msg/s) | Errors: {errors}")
+    print(f"Latency: p50 {latencies.quantile(0.5) * 1000:.2f} ms | p99 {latencies.quantile(0.99) * 1000:.2f} ms | "
+          f"p999 {latencies.quantile(0.999) * 1000:.2f} ms")
+    print(f"Helix calls: {bot.helix_calls} | Chat messages sent: {sum(channel.sent for channel in channels)}")
+
+    print("")
+    print("Per stage:")
+    for (name, labels), histogram in sorted(metrics._histograms.items()):
+        if name == "luminbot_pipeline_stage_seconds":
+            stage = dict(labels)["stage"]
+            print(f" - {stage}: p50 {histogram.quantile(0.5) * 1000:.2f} ms | "
+                  f"p99 {histogram.quantile(0.99) * 1000:.2f} ms | count {histogram.count}")
+
+
+def parse_mix(value):
+    """
+    Parse a command mix such as 'chatter=0.8,command=0.2'.
+    """
+    mix = {}
+    for item in value.split(","):
+        kind, weight = item.split("=")
+        if kind not in DEFAULT_COMMAND_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown message kind: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic chat load test for the LuminBot message pipeline.")
+    parser.add_argument("--channels", type=int, default=10, help="Number of simulated channels.")
+    parser.add_argument("--chatters", type=int, default=100, help="Number of simulated chatters.")
+    parser.add_argument("--commands", type=int, default=50, help="Custom commands per channel.")
+    parser.add_argument("--aliases", type=int, default=2, help="Aliases per custom command.")
+    parser.add_argument("--duration", type=float, default=10, help="Measured duration in seconds.")
+    parser.add_argument("--warmup", type=int, default=200, help="Messages sent before measuring.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent senders in closed-loop mode.")
+    parser.add_argument("--rate", type=float, default=0, help="Fixed arrival rate in msg/s (open loop).")
+    parser.add_argument("--helix-latency", type=float, default=0.0, help="Stubbed Helix latency in seconds.")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="Stubbed chat send latency in seconds.")
+    parser.add_argument("--urlfetch-latency", type=float, default=0.0, help="Stubbed urlfetch latency in seconds.")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_COMMAND_MIX, help="Message mix, e.g. chatter=0.9,command=0.1")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed.")
+
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import time
 from twitchio.ext import commands
-from bot.utilities import ids
+from bot.cogs import watchstreak
+from bot.utilities import ids, metrics, announcements, command_state, osu_api, urlfetch
 from data import data
 
+# Storage operations are timed with the bot's metrics
+data.set_timer(metrics.timer)
+
 
 class LuminBot(commands.Bot):
     """
@@ -87,6 +91,55 @@ class LuminBot(commands.Bot):
 
         print(f" + Channels: {formatted_channel_names}")
 
+        # Expose the Prometheus metrics endpoint (only started once, even on reconnects)
+        await metrics.start_server()
+
+    async def close(self):
+        """
+        Closes the bot after writing pending command usage and watchstreak
+        attendance to the database, sending every queued announcement and
+        closing the shared HTTP sessions.
+        """
+
+        command_state.flush()
+        await watchstreak.flush_attendance(self)
+
+        # A failed send must not keep the HTTP sessions from being closed
+        try:
+            await announcements.flush(self, force=True)
+        except Exception as error:
+            print(f"[announcements] Failed to send the queued announcements: {error}")
+
+        await urlfetch.close_session()
+        await osu_api.client.close()
+        await super().close()
+
+    async def global_before_invoke(self, ctx):
+        """
+        Hook called before any command is invoked.
+
+        Records the invocation start time for the command latency metrics.
+
+        Parameters:
+            ctx (commands.Context): The command context.
+        """
+
+        ctx.invoked_at = time.perf_counter()
+
+    async def global_after_invoke(self, ctx):
+        """
+        Hook called after a command has successfully been invoked.
+
+        Records the command latency metrics.
+
+        Parameters:
+            ctx (commands.Context): The command context.
+        """
+
+        invoked_at = getattr(ctx, "invoked_at", None)
+        if invoked_at is not None:
+            metrics.observe("luminbot_command_seconds", time.perf_counter() - invoked_at, command=ctx.command.name)
+
     async def event_command_error(self, ctx, error):
         """
         Event handler for command errors.
@@ -101,5 +154,8 @@ class LuminBot(commands.Bot):
         if isinstance(error, commands.CommandNotFound) or isinstance(error, commands.CommandOnCooldown):
             pass  # Ignore CommandNotFound and CommandOnCooldown errors
         else:
+            if ctx.command is not None:
+                metrics.increment("luminbot_command_errors_total", command=ctx.command.name)
+
             # Print other errors
             print(f"Ignoring exception in command: {error}")
\ No newline at end of file
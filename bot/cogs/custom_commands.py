@@ -1,16 +1,14 @@
 from twitchio.ext import commands
+from twitchio.ext import routines
 from typing import Optional
-import shlex
-import re
-import aiohttp
 import asyncio
+import shlex
 import json
-import random
-from collections import defaultdict
-
+import math
 import time
 
-from bot.utilities import ids
+from bot.utilities import (ids, features, metrics, aho_corasick, command_templates, command_state, json_path,
+                           rate_limiter, timing_wheel, urlfetch)
 from data import data
 
 USER_LEVELS = ["Everyone",
@@ -19,21 +17,31 @@ USER_LEVELS = ["Everyone",
                "Moderator",
                "Streamer"]
 
-# Constants for token buckets
-URLFETCH_RATE_LIMIT = 3  # Number of urlfetches allowed per minute
-URLFETCH_TOKEN_REFILL_RATE = 60  # Refill rate in seconds (tokens per second)
+# Constants for the urlfetch rate limits
+URLFETCH_RATE_LIMIT = 3  # Number of urlfetches allowed per minute in each channel
+URLFETCH_GLOBAL_RATE_LIMIT = 120  # Number of urlfetches allowed per minute across all channels
+URLFETCH_TOKEN_REFILL_RATE = 60  # Seconds in which the rate limits refill completely
+
+# Maximum length of a Twitch chat message
+CHAT_MESSAGE_MAX_LENGTH = 500
 
 # Constants for custom command cooldowns
 DEFAULT_COMMAND_COOLDOWN = 5  # Default cooldown in seconds
+COOLDOWN_MODES = ["global", "user"]
 
-# Mutex for thread safety
-token_bucket_lock = asyncio.Lock()
+# Rate limiter for urlfetches, keyed by channel ID
+urlfetch_limiter = rate_limiter.RateLimiter(URLFETCH_RATE_LIMIT, URLFETCH_TOKEN_REFILL_RATE,
+                                            global_rate=URLFETCH_GLOBAL_RATE_LIMIT)
 
-# Dictionary to store token buckets for each channel
-channel_buckets = defaultdict(lambda: {"tokens": 3, "last_refill": None})
+# Cached command name and alias index for each channel, keyed by channel ID
+command_indexes = {}
 
-# Token bucket dictionary to store token information for each channel
-urlfetch_token_buckets = defaultdict(lambda: {"tokens": URLFETCH_RATE_LIMIT, "last_refill": None})
+# Cached trigger automaton for each channel, keyed by channel ID (None when the channel has no triggers)
+trigger_automata = {}
+
+# Running command cooldowns, keyed by (channel ID, command) for global cooldowns
+# and by (channel ID, command, user ID) for per-user cooldowns
+command_cooldowns = timing_wheel.TimingWheel()
 
 
 class CustomCommands(commands.Cog):
@@ -50,6 +58,16 @@ class CustomCommands(commands.Cog):
         """
         self.bot = bot
 
+        # Starting the routine writing command usage to the database
+        self.flush_command_state.start()
+
+    @routines.routine(seconds=command_state.COMMAND_STATE_FLUSH_INTERVAL)
+    async def flush_command_state(self):
+        """
+        Writes the in-memory usage counts and last used timestamps of custom commands to the database.
+        """
+        command_state.flush()
+
     async def add_command(self, ctx: commands.Context, args: list, channel_id, channel_data):
         """
         Add a new custom command.
@@ -97,7 +115,11 @@ class CustomCommands(commands.Cog):
             'aliases': []
         }
 
-        data.update_data(channel_id, channel_data)
+        data.update_data(channel_id, command_state.apply(channel_id, channel_data))
+        invalidate_command_index(channel_id)
+
+        # Compile the message template ahead of its first use
+        command_templates.parse(command_message)
 
         await ctx.reply(f"Command '{command_name}' added with the message: '{command_message}'")
 
@@ -138,7 +160,9 @@ class CustomCommands(commands.Cog):
                 f"Message: {command_data['message']} | "
                 f"User Level: {command_data['user_level']} | "
                 f"Cooldown: {command_data['cooldown']} seconds | "
-                f"Aliases: {', '.join(command_data['aliases'])}"
+                f"User Cooldown: {command_data.get('user_cooldown', 0)} seconds | "
+                f"Aliases: {', '.join(command_data['aliases'])} | "
+                f"Triggers: {', '.join(command_data.get('triggers', []))}"
             )
             return
 
@@ -146,7 +170,7 @@ class CustomCommands(commands.Cog):
         sub_command_args = shlex.split(args[2])
 
         if not sub_command_args:
-            await ctx.reply("Invalid sub-command. Supported sub-commands: message, userlevel, cooldown, aliases.")
+            await ctx.reply("Invalid sub-command. Supported sub-commands: message, userlevel, cooldown, cache, aliases, triggers.")
             return
 
         sub_command = sub_command_args[0].lower()
@@ -158,6 +182,9 @@ class CustomCommands(commands.Cog):
                 return
             new_message = " ".join(map(str, sub_command_args[1:]))
             command_data['message'] = new_message
+
+            # Compile the message template ahead of its first use
+            command_templates.parse(new_message)
             await ctx.reply(f"Message for '{command_name}' updated.")
 
         elif sub_command == "userlevel":
@@ -172,15 +199,35 @@ class CustomCommands(commands.Cog):
             await ctx.reply(f"User level for '{command_name}' updated.")
 
         elif sub_command == "cooldown":
+            # The cooldown mode is optional, a bare duration sets the global cooldown
+            cooldown_mode = "global"
+            if len(sub_command_args) > 1 and sub_command_args[1].lower() in COOLDOWN_MODES:
+                cooldown_mode = sub_command_args.pop(1).lower()
+            cooldown_key = "cooldown" if cooldown_mode == "global" else "user_cooldown"
+
             if len(sub_command_args) < 2:
                 await ctx.reply(
-                    f"You did not specify a new cooldown value. (Current cooldown for '{command_name}': {command_data['cooldown']} seconds)")
+                    f"You did not specify a new cooldown value. (Current cooldowns for '{command_name}': "
+                    f"{command_data['cooldown']} seconds global, {command_data.get('user_cooldown', 0)} seconds per user)")
                 return
             if not sub_command_args[1].isdigit():
-                await ctx.reply("You must provide a valid cooldown duration in seconds.")
+                await ctx.reply("You must provide a valid cooldown duration in seconds, optionally "
+                                "preceded by the cooldown mode: global or user.")
                 return
-            command_data['cooldown'] = int(sub_command_args[1])
-            await ctx.reply(f"Cooldown for '{command_name}' updated.")
+            command_data[cooldown_key] = int(sub_command_args[1])
+            await ctx.reply(f"{cooldown_mode.capitalize()} cooldown for '{command_name}' updated.")
+
+        elif sub_command == "cache":
+            current_cache = command_data.get('cache', urlfetch.URLFETCH_DEFAULT_TTL)
+            if len(sub_command_args) < 2:
+                await ctx.reply(
+                    f"You did not specify a new urlfetch cache duration. (Current cache duration for '{command_name}': {current_cache} seconds)")
+                return
+            if not sub_command_args[1].isdigit():
+                await ctx.reply("You must provide a valid urlfetch cache duration in seconds (0 disables caching).")
+                return
+            command_data['cache'] = int(sub_command_args[1])
+            await ctx.reply(f"Urlfetch cache duration for '{command_name}' updated.")
 
         elif sub_command == "aliases":
             if len(sub_command_args) < 2:
@@ -190,11 +237,22 @@ class CustomCommands(commands.Cog):
             command_data['aliases'] = [alias.strip() for alias in sub_command_args[1].split(',')]
             await ctx.reply(f"Aliases for '{command_name}' updated.")
 
+        elif sub_command == "triggers":
+            if len(sub_command_args) < 2:
+                await ctx.reply(
+                    f"You did not specify any trigger phrases, separated by commas, or 'none'. (Current triggers for '{command_name}': {', '.join(command_data.get('triggers', []))})")
+                return
+            triggers = " ".join(sub_command_args[1:])
+            command_data['triggers'] = [] if triggers.lower() == "none" else \
+                [trigger.strip().lower() for trigger in triggers.split(',') if trigger.strip()]
+            await ctx.reply(f"Triggers for '{command_name}' updated.")
+
         else:
-            await ctx.reply("Invalid sub-command. Supported sub-commands: message, userlevel, cooldown, aliases.")
+            await ctx.reply("Invalid sub-command. Supported sub-commands: message, userlevel, cooldown, cache, aliases, triggers.")
 
         # Update the channel data
-        data.update_data(channel_id, channel_data)
+        data.update_data(channel_id, command_state.apply(channel_id, channel_data))
+        invalidate_command_index(channel_id)
 
     async def remove_command(self, ctx: commands.Context, args: list, channel_id, channel_data):
         """
@@ -226,9 +284,11 @@ class CustomCommands(commands.Cog):
 
         # Remove the command from channel_data["commands"]
         del channel_data["commands"][command_name]
+        command_state.forget(channel_id, command_name)
 
         # Update the channel data
-        data.update_data(channel_id, channel_data)
+        data.update_data(channel_id, command_state.apply(channel_id, channel_data))
+        invalidate_command_index(channel_id)
 
         await ctx.reply(f"Command '{command_name}' has been removed.")
 
@@ -276,11 +336,8 @@ class CustomCommands(commands.Cog):
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "customcommands" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "customcommands"):
+            return
 
         if arg is None:
             await ctx.reply(
@@ -304,45 +361,199 @@ class CustomCommands(commands.Cog):
             await ctx.reply("Invalid command. Supported commands: add, edit, remove, list.")
 
 
-async def handle_command_message_event(bot, message):
+def build_command_index(channel_commands):
+    """
+    Build the lookup index mapping every command name and alias to its command.
+
+    When a name or alias is shared by several commands, the first command in
+    definition order wins.
+
+    Parameters:
+        channel_commands (dict): The channel's custom commands.
+
+    Returns:
+        dict: Command names and aliases mapped to command names.
+    """
+    index = {}
+    for command, command_data in channel_commands.items():
+        index.setdefault(command, command)
+        for alias in command_data.get("aliases", []):
+            index.setdefault(alias, command)
+    return index
+
+
+def get_command_index(channel_id):
+    """
+    Get the command name and alias index of a channel.
+
+    The index is built from the channel document once and cached until the
+    channel's commands are changed with !cmd. Building it also restores the
+    channel's global cooldowns.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+
+    Returns:
+        dict: Command names and aliases mapped to command names.
+    """
+    channel_id = str(channel_id)
+
+    index = command_indexes.get(channel_id)
+    if index is None:
+        channel_commands = data.get_data(channel_id).get("commands", {})
+        index = command_indexes[channel_id] = build_command_index(channel_commands)
+        restore_cooldowns(channel_id, channel_commands)
+
+    return index
+
+
+def restore_cooldowns(channel_id, channel_commands):
+    """
+    Restart the global cooldowns of a channel's commands from their last use.
+
+    Running cooldowns only live in the timing wheel, so this keeps them across
+    restarts and applies a cooldown changed with !cmd edit to the running one.
+    Per-user cooldowns are not stored and start over after a restart.
+
+    Parameters:
+        channel_id (str): The ID of the Twitch channel.
+        channel_commands (dict): The channel's custom commands.
+    """
+    now = time.time()
+
+    for command, command_data in channel_commands.items():
+        last_used = command_state.get_state(channel_id, command, command_data).last_used
+        remaining = last_used + command_data.get("cooldown", DEFAULT_COMMAND_COOLDOWN) - now
+
+        # A duration of 0 or less removes a running cooldown that has already passed
+        command_cooldowns.add((channel_id, command), remaining)
+
+
+def build_trigger_automaton(channel_commands):
+    """
+    Compile the trigger phrases of a channel's commands into a single automaton.
+
+    When a phrase is shared by several commands, the first command in
+    definition order wins.
+
+    Parameters:
+        channel_commands (dict): The channel's custom commands.
+
+    Returns:
+        aho_corasick.Automaton or None: The automaton, or None if no command has triggers.
+    """
+    triggers = {}
+    for command, command_data in channel_commands.items():
+        for trigger in command_data.get("triggers", []):
+            triggers.setdefault(trigger, command)
+    return aho_corasick.Automaton(triggers) if triggers else None
+
+
+def get_trigger_automaton(channel_id):
+    """
+    Get the trigger automaton of a channel.
+
+    The automaton is compiled from the channel document once and cached until
+    the channel's commands are changed with !cmd.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+
+    Returns:
+        aho_corasick.Automaton or None: The automaton, or None if the channel has no triggers.
+    """
+    channel_id = str(channel_id)
+
+    if channel_id not in trigger_automata:
+        trigger_automata[channel_id] = build_trigger_automaton(data.get_data(channel_id).get("commands", {}))
+
+    return trigger_automata[channel_id]
+
+
+def match_trigger(channel_id, content):
+    """
+    Find the command triggered by a chat message, matching all of the channel's triggers in one pass.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        content (str): The message content.
+
+    Returns:
+        str or None: The name of the first command whose trigger occurs in the message as whole words.
+    """
+    automaton = get_trigger_automaton(channel_id)
+    if automaton is None:
+        return None
+    return automaton.find_word(content.lower())
+
+
+def invalidate_command_index(channel_id):
+    """
+    Drop the cached command index and trigger automaton of a channel so they are rebuilt on next use.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+    """
+    command_indexes.pop(str(channel_id), None)
+    trigger_automata.pop(str(channel_id), None)
+
+
+async def handle_command_message_event(bot, message, channel_id, base_command):
     """
     Event handler for processing command messages.
 
     This event is called inside the global_event_handler
-    in order to prevent very annoying race conditions.
+    in order to prevent very annoying race conditions. The handler
+    only routes messages here when their first word is a known
+    command name or alias and the customcommands feature is enabled.
 
     Parameters:
         bot: The Twitch bot instance.
         message: The Twitch message.
+        channel_id (str): The ID of the channel the message was sent in.
+        base_command (str): The lowercase first word of the message.
     """
 
-    # Check if customcommands feature is disabled for the channel
-    channel_id = ids.get_id_from_name(message.channel.name)
-    channel_data = data.get_data(channel_id)
+    command = get_command_index(channel_id).get(base_command)
 
-    try:
-        if "customcommands" in channel_data["disabled_features"]:
-            return
-    except (KeyError, ValueError):
-        pass
+    if command is None:
+        return
 
     channel_data = data.get_data(channel_id)
     channel_data["commands"] = channel_data.get("commands", {})
 
-    # Split the message content into words
-    words = message.content.split()
+    # The document was changed without going through !cmd, rebuild the index on next use
+    if command not in channel_data["commands"]:
+        invalidate_command_index(channel_id)
+        return
+
+    await process_command(bot, message, channel_id, channel_data, command)
+
 
-    # Get the base command (the first word in the message)
-    base_command = words[0].lower()
+async def handle_trigger_message_event(bot, message, channel_id, command):
+    """
+    Event handler for chat messages containing a command's trigger phrase.
 
-    # Check if the base command or any of its aliases are in the available commands
-    for command, command_data in channel_data["commands"].items():
-        if base_command == command or base_command in command_data.get("aliases", []):
-            await process_command(message, channel_id, channel_data, command)
-            break
+    This event is called inside the global_event_handler, which only routes
+    messages here once match_trigger has found a triggered command.
 
+    Parameters:
+        bot: The Twitch bot instance.
+        message: The Twitch message.
+        channel_id (str): The ID of the channel the message was sent in.
+        command (str): The name of the triggered command.
+    """
+    channel_data = data.get_data(channel_id)
+    channel_data["commands"] = channel_data.get("commands", {})
 
-async def process_command(message, channel_id, channel_data, command):
+    if command not in channel_data["commands"]:
+        invalidate_command_index(channel_id)
+        return
+
+    await process_command(bot, message, channel_id, channel_data, command, triggered=True)
+
+
+async def process_command(bot, message, channel_id, channel_data, command, triggered=False):
     """
     Process and execute a custom command.
 
@@ -352,17 +563,18 @@ async def process_command(message, channel_id, channel_data, command):
         channel_id: The ID of the Twitch channel.
         channel_data: The data associated with the Twitch channel.
         command (str): The name of the command to execute.
+        triggered (bool): Whether the command was triggered by a phrase rather than invoked by name.
 
     Returns:
         None
     """
     command_data = channel_data["commands"][command]
 
-    current_time = int(time.time())
-    last_used = command_data["last_used"]
-    cooldown = command_data["cooldown"]
+    channel_id = str(channel_id)
+    user_cooldown_key = (channel_id, command, message.author.id)
 
-    if current_time - last_used < cooldown:
+    # Cooldowns expire from the timing wheel on their own, so idle chatters cost no memory
+    if (channel_id, command) in command_cooldowns or user_cooldown_key in command_cooldowns:
         return
 
     # Check if the user level is sufficient
@@ -379,198 +591,295 @@ async def process_command(message, channel_id, channel_data, command):
         user_level_actual = USER_LEVELS.index("Streamer")
 
     if user_level_actual < user_level_required:
-        await message.channel.send(f"You do not have the required user level to use this command.")
+        # Phrases are matched in regular chat, so they are ignored silently instead
+        if not triggered:
+            await message.channel.send(f"You do not have the required user level to use this command.")
         return
 
-    # Incremement usage count
-    command_data["usage_count"] = command_data["usage_count"] + 1
+    # Start the cooldowns
+    command_cooldowns.add((channel_id, command), command_data["cooldown"])
+    command_cooldowns.add(user_cooldown_key, command_data.get("user_cooldown", 0))
+
+    # Usage counts and last used timestamps live in memory and are written to the database in batches
+    state = command_state.record_use(channel_id, command, command_data, int(time.time()))
+    command_data["usage_count"] = state.usage_count
+
+    context = command_templates.RenderContext(bot, message, channel_id, command_data)
+    command_message_content = await command_templates.render(command_data["message"], context)
+
+    with metrics.timer("luminbot_chat_send_seconds", feature="customcommands"):
+        await message.channel.send(truncate(command_message_content))
+
+
+class UrlfetchRateLimited(Exception):
+    """
+    Raised when a URL fetch is refused by the urlfetch rate limiter.
+    """
+
+
+class UrlfetchRequest:
+    """
+    A URL fetched by one or more {urlfetch} placeholders of a message, which share one rate limit token
+    and one download.
+    """
+
+    __slots__ = ("url", "ttl", "line_selectors", "task")
+
+    def __init__(self, url, ttl):
+        """
+        Initializes the request.
+
+        Parameters:
+            url (str): The URL.
+            ttl (int): Seconds the response stays cached.
+        """
+        self.url = url
+        self.ttl = ttl
 
-    command_message_content = await replace_placeholders(channel_id, message, command_data["message"], command_data)
+        # Line selector of each placeholder using the URL, None for placeholders that need the whole body
+        self.line_selectors = []
+        self.task = None
 
-    await message.channel.send(command_message_content)
 
-    # Update the last used timestamp
-    command_data["last_used"] = current_time
-    data.update_data(channel_id, channel_data)
+async def fetch_url_once(context, url, ttl, line_selector):
+    """
+    Fetch a URL for a placeholder, sharing one rate limit token and one download with the message's
+    other placeholders fetching the same URL.
 
+    A URL used by a single plain line placeholder is streamed until that line is reached. Otherwise
+    its whole body is downloaded once and every placeholder picks its part from it.
 
-async def replace_placeholders(channel_id, message, command_message, command_data):
+    Parameters:
+        context (command_templates.RenderContext): The render context.
+        url (str): The URL.
+        ttl (int): Seconds the response stays cached.
+        line_selector (int or str or None): The line this placeholder streams, or None if it needs the body.
+
+    Returns:
+        tuple: The streamed line selector and line, or None and the body.
+
+    Raises:
+        UrlfetchRateLimited: If the channel is rate limited.
+        UrlFetchError: If the request fails.
     """
-    Replace placeholders in the message with corresponding data.
+    request = context.shared.get(("urlfetch", url))
+    if request is None:
+        request = context.shared[("urlfetch", url)] = UrlfetchRequest(url, ttl)
+
+    request.line_selectors.append(line_selector)
+    if request.task is None:
+        request.task = asyncio.ensure_future(download_request(context, request))
+
+    result = await asyncio.shield(request.task)
+
+    # A placeholder registered after the download started may need another line, the body is then
+    # fetched again without a token, joining the download in flight or served from the cache
+    if result[0] is not None and result[0] != line_selector:
+        return None, await urlfetch.fetch(url, ttl)
+
+    return result
+
+
+async def download_request(context, request):
+    """
+    Download the URL of a request, after the message's other placeholders had a chance to register.
 
     Parameters:
-        channel_id (int): The channel's ID.
-        message (discord.Message): The Discord message.
-        command_message (str): The command message.
-        command_data (dict): The data associated with the command.
+        context (command_templates.RenderContext): The render context.
+        request (UrlfetchRequest): The request.
 
     Returns:
-        str: The message with placeholders replaced.
-    """
-    # Remove invisible characters from the argument
-    message_content = message.content.replace(" 󠀀", "")
-
-    replacements = {
-        "{count}": str(command_data["usage_count"]),
-        "{touser}": message_content.split(' ', 1)[1].strip() if ' ' in message_content else f"@{message.author.name}",
-        "{user}": f"@{message.author.name}",
-    }
-
-    # Replace placeholders in the message
-    for placeholder, value in replacements.items():
-        command_message = command_message.replace(placeholder, value)
-
-    # Handle {urlfetch} placeholder with rate limiting
-    urlfetch_pattern = re.compile(r"{urlfetch\s+(.*?)\s*}")
-    matches = urlfetch_pattern.finditer(command_message)
-
-    for match in matches:
-        url_placeholder = match.group(0)
-        url_params = match.group(1).split()  # Split parameters by spaces
-        url = url_params[0]
-
-        # Check if the token bucket allows the urlfetch
-        async with token_bucket_lock:
-            tokens, last_refill = urlfetch_token_buckets[channel_id]["tokens"], urlfetch_token_buckets[channel_id][
-                "last_refill"]
-            current_time = time.time()
-
-            if last_refill is None or current_time - last_refill > URLFETCH_TOKEN_REFILL_RATE:
-                # Refill the tokens if it's a new minute
-                urlfetch_token_buckets[channel_id] = {"tokens": URLFETCH_RATE_LIMIT, "last_refill": current_time}
-                tokens = URLFETCH_RATE_LIMIT
-
-            if tokens <= 0:
-                # Rate limit reached, replace with an error message
-                error_message = "Rate limit reached for {urlfetch} placeholders. Please try again later."
-                command_message = command_message.replace(url_placeholder, error_message)
-                continue
-
-            # Consume a token and proceed with the urlfetch
-            urlfetch_token_buckets[channel_id]["tokens"] -= 1
+        tuple: The streamed line selector and line, or None and the body.
+    """
+    # The placeholders of a message are started together, so every one using the URL registers first
+    await asyncio.sleep(0)
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    fetched_content = await handle_urlfetch_response(response, url_params)
-        except Exception as e:
-            fetched_content = f"Error fetching content: {str(e)}"
+    # Cached responses are served without spending a token
+    cached_content = urlfetch.lookup(request.url, request.ttl)
+    if cached_content is not None:
+        return None, cached_content
+
+    # Consume a single token for every placeholder using the URL
+    channel_id = str(context.channel_id)
+    if not urlfetch_limiter.try_acquire(channel_id):
+        metrics.increment("luminbot_rate_limited_total", limiter="urlfetch")
+        retry_after = max(1, math.ceil(urlfetch_limiter.retry_after(channel_id)))
+        raise UrlfetchRateLimited(
+            f"Rate limit reached for {{urlfetch}} placeholders. Please try again in {retry_after} seconds.")
 
-        # Replace the {urlfetch} placeholder with the fetched content
-        command_message = command_message.replace(url_placeholder, fetched_content)
+    # Plain line fetches are streamed without downloading the whole body
+    if len(request.line_selectors) == 1 and request.line_selectors[0] is not None:
+        line_selector = request.line_selectors[0]
+        return line_selector, await urlfetch.fetch_line(request.url, line_selector, request.ttl)
 
-    return command_message
+    return None, await urlfetch.fetch(request.url, request.ttl)
 
 
-async def handle_urlfetch_response(response, url_params):
+@command_templates.placeholder("urlfetch", shared=True)
+async def resolve_urlfetch(context, args):
     """
-    Handle the response from a URL fetch.
+    Resolve a {urlfetch <url> [json <key>] [line <number/random>]} placeholder with rate limiting.
+
+    Placeholders of one message are fetched concurrently, and placeholders
+    fetching the same URL spend one token and download it only once.
 
     Parameters:
-        response (aiohttp.ClientResponse): The response from the URL fetch.
-        url_params (list): Parameters associated with the URL fetch.
+        context (command_templates.RenderContext): The render context.
+        args (str): The rendered placeholder arguments.
 
     Returns:
-        str: The fetched content.
+        str: The fetched content or an error message.
     """
-    # Check if the response is JSON
+    url_params = args.split()  # Split parameters by spaces
+    if not url_params:
+        return "Error: No URL specified for {urlfetch}."
+
+    url = url_params[0]
+    ttl = context.command_data.get("cache", urlfetch.URLFETCH_DEFAULT_TTL)
+
+    line_selector = get_line_selector(url_params)
     if 'json' in url_params:
-        try:
-            json_data = await response.json()
-            fetched_content = await process_json_response(json_data, url_params)
-        except json.JSONDecodeError:
-            fetched_content = "Error decoding JSON response."
-    else:
-        fetched_content = await response.text()
+        line_selector = None
 
-    # Handle line parameter
+    try:
+        streamed_selector, content = await fetch_url_once(context, url, ttl, line_selector)
+        if streamed_selector is not None:
+            fetched_content = format_selected_line(content, streamed_selector)
+        else:
+            fetched_content = await handle_urlfetch_response(content, url_params)
+    except UrlfetchRateLimited as e:
+        fetched_content = str(e)
+    except Exception as e:
+        fetched_content = f"Error fetching content: {str(e)}"
+
+    return fetched_content
+
+
+def get_line_selector(url_params):
+    """
+    Get the line selected by the 'line' parameter of a URL fetch.
+
+    Parameters:
+        url_params (list): Parameters associated with the URL fetch.
+
+    Returns:
+        int or str or None: The line number, 'random', or None when no valid line parameter is given.
+    """
     if 'line' in url_params and len(url_params) > url_params.index('line') + 1:
         line_param = url_params[url_params.index('line') + 1].lower()
 
         if line_param.isdigit():
-            # Get the specified line number
-            line_number = int(line_param)
-            fetched_content = get_line_from_content(fetched_content, line_number)
+            return int(line_param)
         elif line_param == 'random':
-            # Get a random line
-            fetched_content = get_random_line_from_content(fetched_content)
+            return line_param
 
-    return fetched_content
+    return None
 
 
-def get_line_from_content(content, line_number):
+async def handle_urlfetch_response(content, url_params):
     """
-    Get the specified line number from the content.
+    Handle the body of a URL fetch.
 
     Parameters:
-        content (str): The content to extract the line from.
-        line_number (int): The line number to retrieve.
+        content (str): The response body of the URL fetch.
+        url_params (list): Parameters associated with the URL fetch.
 
     Returns:
-        str: The specified line or an error message if the line is not found.
+        str: The fetched content.
     """
-    lines = content.split('\n')
-    if 1 <= line_number <= len(lines):
-        return lines[line_number - 1]
+    # Check if the response is JSON
+    if 'json' in url_params:
+        try:
+            fetched_content = await process_json_response(content, url_params)
+        except json.JSONDecodeError:
+            fetched_content = "Error decoding JSON response."
     else:
-        return f"Error: Line {line_number} not found in the response."
+        fetched_content = content
+
+    # Handle line parameter
+    line_selector = get_line_selector(url_params)
+
+    if line_selector is not None:
+        line = urlfetch.select_line(urlfetch.split_lines(fetched_content), line_selector)
+        fetched_content = format_selected_line(line, line_selector)
+
+    return fetched_content
 
 
-def get_random_line_from_content(content):
+def format_selected_line(line, line_selector):
     """
-    Get a random line from the content.
+    Format a line selected from fetched content.
 
     Parameters:
-        content (str): The content to extract a random line from.
+        line (str or None): The selected line, or None if it was not found.
+        line_selector (int or str): The line number, or 'random'.
 
     Returns:
-        str: A random line or an error message if the content is empty.
+        str: The line or an error message if the line is not found.
     """
-    lines = content.split('\n')
-    if lines:
-        return random.choice(lines)
-    else:
+    if line is not None:
+        return line
+    elif line_selector == 'random':
         return "Error: No lines found in the response."
+    else:
+        return f"Error: Line {line_selector} not found in the response."
 
 
-async def process_json_response(json_data, url_params):
+async def process_json_response(content, url_params):
     """
     Process JSON response from a URL fetch.
 
+    The key is compiled into a cached JSON path and only the values it
+    selects are decoded from the response, see json_path.extract. Without a
+    key, the response itself is returned. The result is truncated to the
+    length of a chat message.
+
     Parameters:
-        json_data (dict or list): JSON data from the response.
+        content (str): The JSON response body.
         url_params (list): Parameters associated with the URL fetch.
 
     Returns:
         str: The processed JSON content.
+
+    Raises:
+        json.JSONDecodeError: If the response is not valid JSON along the key's path.
     """
     # If the parameter "json" is present, use it to extract the specified JSON value
     json_key = url_params[url_params.index('json') + 1] if 'json' in url_params and len(url_params) > url_params.index(
         'json') + 1 else None
 
-    if json_key:
-        # Split the nested keys and traverse the JSON structure
-        keys = json_key.split('.')
-        nested_value = json_data
+    if not json_key:
+        # Chat collapses the whitespace anyway, so only the start of the response is needed
+        return truncate(" ".join(content[:CHAT_MESSAGE_MAX_LENGTH * 4].split()))
 
-        try:
-            for key in keys:
-                if isinstance(nested_value, list):
-                    # Handle the case where nested_value is a list
-                    index = int(key)
-                    nested_value = nested_value[index]
-                else:
-                    nested_value = nested_value[key]
-        except (KeyError, IndexError, TypeError):
-            # Handle cases where the key is not found or the structure is not as expected
-            fetched_content = f"Key '{json_key}' not found in JSON response."
-        else:
-            # If the value is a string, remove the quotes
-            fetched_content = nested_value if isinstance(nested_value, str) else json.dumps(nested_value, indent=2)
-    else:
-        fetched_content = json.dumps(json_data, indent=2)
+    try:
+        steps = json_path.compile_path(json_key)
+    except ValueError as e:
+        return f"Error: {e}"
 
-    return fetched_content
+    values = json_path.extract(content, steps)
+
+    if not values:
+        # Handle cases where the key is not found or the structure is not as expected
+        return f"Key '{json_key}' not found in JSON response."
+
+    # String values are shown without their quotes
+    formatted = [value if isinstance(value, str) else json.dumps(value, separators=(", ", ": ")) for value in values]
+    return truncate(", ".join(formatted))
+
+
+def truncate(text, limit=CHAT_MESSAGE_MAX_LENGTH):
+    """
+    Truncate text to fit in a chat message.
+
+    Parameters:
+        text (str): The text.
+        limit (int): The maximum length.
+
+    Returns:
+        str: The text, ending in '...' if it was truncated.
+    """
+    return text if len(text) <= limit else text[:limit - 3] + "..."
 
 
 def prepare(bot: commands.Bot):
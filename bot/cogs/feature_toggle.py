@@ -2,7 +2,7 @@ from twitchio.ext import commands
 from typing import Optional
 
 from data import data
-from bot.utilities import ids
+from bot.utilities import ids, features, announcements
 
 
 class FeatureToggle(commands.Cog):
@@ -36,23 +36,6 @@ class FeatureToggle(commands.Cog):
         if not ctx.author.is_mod and not ctx.author.is_broadcaster:
             return
 
-        # List of available features
-        features = [
-            "customcommands",  # Entire custom commands feature
-            "watchstreaks",  # Entire watchstreaks feature
-            "firsts",  # Entire firsts feature
-            "rank",  # Global rank command
-
-            "osu.map",  # osu related
-            "osu.profile",  # osu related
-            "osu.recent",  # osu related
-
-            "valorant.radiant",  # valorant related
-            "valorant.record",  # valorant related
-            "valorant.winlossnoti",  # valorant related
-            "valorant.lastgame",  # valorant related
-        ]
-
         # Split the argument into components
         args = arg.split(" ")
 
@@ -62,7 +45,7 @@ class FeatureToggle(commands.Cog):
             return
 
         # Validate the specified feature
-        if args[1].lower() not in features:
+        if len(args) < 2 or args[1].lower() not in features.FEATURES:
             await ctx.reply("The feature you specified is not valid, view the wiki for more help.")
             return
 
@@ -92,6 +75,64 @@ class FeatureToggle(commands.Cog):
         # Update the channel_data with the modified feature settings
         data.update_data(channel_id, channel_data)
 
+        # Rebuild the cached feature bitmask on next use
+        features.invalidate(channel_id)
+
+    @commands.command(aliases=["announcements", "announcement"])
+    async def announcement_settings(self, ctx: commands.Context, *, arg: Optional[str] = None):
+        """
+        Command for configuring how milestone announcements are grouped.
+
+        Parameters:
+            ctx (commands.Context): The command context.
+            arg (Optional[str]): An optional argument for the command.
+
+        Usage:
+            !announcements
+            !announcements window <seconds>
+            !announcements batch <count>
+        """
+
+        # Check if the command issuer is a moderator or broadcaster
+        if not ctx.author.is_mod and not ctx.author.is_broadcaster:
+            return
+
+        channel_id = ids.get_id_from_name(ctx.channel.name)
+
+        if arg is None:
+            window, max_batch = announcements.get_settings(channel_id)
+            await ctx.reply(f"Milestones are collected for {window} seconds and announced up to {max_batch} at a time.")
+            return
+
+        args = arg.split(" ")
+        limits = {"window": (0, announcements.MAX_ANNOUNCEMENT_WINDOW),
+                  "batch": (1, announcements.MAX_ANNOUNCEMENT_BATCH)}
+
+        if args[0].lower() not in limits or len(args) < 2:
+            await ctx.reply("Invalid usage. Correct usage: !announcements <window/batch> <value>")
+            return
+
+        minimum, maximum = limits[args[0].lower()]
+
+        try:
+            value = int(args[1])
+        except ValueError:
+            value = None
+
+        if value is None or not minimum <= value <= maximum:
+            await ctx.reply(f"The value you specified must be an integer from {minimum} to {maximum}.")
+            return
+
+        channel_data = data.get_data(channel_id)
+        channel_data.setdefault("announcements", {})
+        channel_data["announcements"]["window" if args[0].lower() == "window" else "max_batch"] = value
+        data.update_data(channel_id, channel_data)
+
+        # Read the new settings on next use
+        announcements.invalidate(channel_id)
+
+        await ctx.reply(f"Announcement {args[0].lower()} set to {value}.")
+
 
 def prepare(bot: commands.Bot):
     bot.add_cog(FeatureToggle(bot))
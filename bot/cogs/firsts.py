@@ -1,7 +1,7 @@
 from twitchio.ext import commands
 from typing import Optional
 
-from bot.utilities import ids, known_bots
+from bot.utilities import ids, features, announcements, leaderboard, live_streams
 from data import data
 
 
@@ -19,6 +19,10 @@ class Firsts(commands.Cog):
         """
         self.bot = bot
 
+        # Loading every channel's firsts leaderboard once, it is kept up to date from then on
+        loaded = leaderboard.load(r"streamer_\d+_firsts", ["firsts"])
+        print(f"[firsts] Loaded {loaded} leaderboard entries")
+
     @commands.command(aliases=["firsts"])
     @commands.cooldown(rate=1, per=5, bucket=commands.Bucket.channel)
     async def first(self, ctx: commands.Context, *, arg: Optional[str] = None):
@@ -32,17 +36,15 @@ class Firsts(commands.Cog):
         Usage:
             !first
             !first top
+            !first rank
         """
 
         # Get channel data
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "firsts" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "firsts"):
+            return
 
         if arg is None:
             await self.handle_basic_firsts(ctx, channel_id, channel_data)
@@ -55,6 +57,10 @@ class Firsts(commands.Cog):
             await self.handle_top_firsts(ctx, channel_id)
             return
 
+        if args[0] == "rank":
+            await self.handle_rank_firsts(ctx, channel_id)
+            return
+
         if args[0] == "set":
 
             # Check if the command issuer is a moderator or broadcaster
@@ -89,6 +95,7 @@ class Firsts(commands.Cog):
 
             # Update the data
             data.update_data(user_id, user_data)
+            leaderboard.get(f"streamer_{channel_id}_firsts.firsts").set(str(user_id), firsts_count)
 
             await ctx.reply(f"Firsts count for {username} set to {firsts_count}.")
 
@@ -126,85 +133,103 @@ class Firsts(commands.Cog):
             ctx (commands.Context): The command context.
             channel_id (str): The channel ID.
         """
-        leaderboard = "PogChamp Top Firsts: "
+        board = leaderboard.get(f"streamer_{channel_id}_firsts.firsts")
+        await ctx.reply(leaderboard.format_top("PogChamp Top Firsts: ", board))
+
+    async def handle_rank_firsts(self, ctx: commands.Context, channel_id: str):
+        """
+        Helper method to handle 'rank' command.
+
+        Parameters:
+            ctx (commands.Context): The command context.
+            channel_id (str): The channel ID.
+        """
+        user_id = str(ctx.author.id)
+        board = leaderboard.get(f"streamer_{channel_id}_firsts.firsts")
+
+        if user_id not in board:
+            await ctx.reply("You have not been first in this channel yet.")
+            return
 
-        sorted_documents = data.get_sorted_document_ids(f"streamer_{channel_id}_firsts.firsts")
+        await ctx.reply(f"PartyHat You are #{board.rank(user_id)} of {len(board)} with {board.get(user_id)} firsts")
 
-        for index, document_id in enumerate(sorted_documents):
-            if index >= 10:
-                break
 
-            document = data.get_data(document_id)
-            document_firsts = document[f"streamer_{channel_id}_firsts"]["firsts"]
-            document_user = ids.get_name_from_id(document_id)
+# Stream whose first chatter has been claimed, keyed by channel ID
+_claimed_streams = {}
 
-            leaderboard += f"{index + 1}. {document_user} ({document_firsts}), "
 
-        await ctx.reply(leaderboard + "PogChamp")
+def get_claimed_stream(channel_id):
+    """
+    Get the stream whose first chatter has been claimed in a channel, reading the channel document on first use.
+
+    Parameters:
+        channel_id (str): The ID of the Twitch channel.
+
+    Returns:
+        str or None: The stream ID, or None if no first has been claimed yet.
+    """
+    if channel_id not in _claimed_streams:
+        _claimed_streams[channel_id] = data.get_data(channel_id).get("firsts", {}).get("current_stream")
+
+    return _claimed_streams[channel_id]
 
 
-async def handle_firsts_message_event(bot, message):
+async def handle_firsts_message_event(bot, message, channel_id):
     """
     Event handler for processing firsts and updating data.
 
     This event is called inside the global_event_handler
-    in order to prevent very annoying race conditions.
+    in order to prevent very annoying race conditions. The handler
+    only routes non-command messages from non-bot chatters here,
+    and only when the firsts feature is enabled.
 
     Parameters:
         bot: The Twitch bot instance.
         message: The incoming message.
+        channel_id (str): The ID of the channel the message was sent in.
     """
 
-    if message.content.startswith("!"):
-        return
-
-    # Get channel data
-    channel_id = ids.get_id_from_name(message.channel.name)
-    channel_data = data.get_data(channel_id)
+    stream = await live_streams.get_stream(bot, message.channel.name)
 
-    try:
-        if "firsts" in channel_data["disabled_features"]:
-            return
-    except (KeyError, ValueError):
-        pass
-
-    try:
-        user_id = message.author.id
-    except AttributeError:
+    if stream is None:
         return
 
-    # If the user is in the known bots list, return
-    if message.author.name in known_bots.KNOWN_BOTS:
+    # Checked and claimed without awaiting in between, so only one message can be first
+    if get_claimed_stream(channel_id) == stream.id:
         return
 
-    stream = await bot.fetch_streams(user_logins=[message.channel.name], type="live")
+    previous_stream = _claimed_streams[channel_id]
+    _claimed_streams[channel_id] = stream.id
 
-    if not stream:
-        return
-
-    # Update data for the stream
-    channel_data.setdefault("firsts", {})
-    current_stream = channel_data["firsts"].get("current_stream")
+    try:
+        # The same document when broadcasters are first in their own channel
+        documents = data.get_data_many([channel_id, message.author.id])
+        channel_data = documents[str(channel_id)]
+        user_data = documents[str(message.author.id)]
 
-    if current_stream == stream[0].id:
-        return
+        channel_data.setdefault("firsts", {})
+        channel_data["firsts"]["current_stream"] = stream.id
+        channel_data["firsts"]["first_person"] = message.author.name
 
-    current_stream = stream[0].id
-    channel_data["firsts"]["current_stream"] = current_stream
-    channel_data["firsts"]["first_person"] = message.author.name
-    data.update_data(channel_id, channel_data)
+        user_firsts = user_data.get(f"streamer_{channel_id}_firsts", {}).get("firsts", 0) + 1
 
-    user_data = data.get_data(user_id)
+        user_data.setdefault(f"streamer_{channel_id}_firsts", {})
+        user_data[f"streamer_{channel_id}_firsts"]["firsts"] = user_firsts
 
-    user_firsts = user_data.get(f"streamer_{channel_id}_firsts", {}).get("firsts", 0) + 1
+        # Stored so leaderboards can show names without asking Helix
+        user_data["name"] = message.author.display_name or message.author.name
 
-    user_data.setdefault(f"streamer_{channel_id}_firsts", {})
-    user_data[f"streamer_{channel_id}_firsts"]["firsts"] = user_firsts
+        # The claim and the user's count are written together in one transaction
+        data.update_data_many({str(channel_id): channel_data, str(message.author.id): user_data})
+    except Exception:
+        # Let the next message claim first instead
+        _claimed_streams[channel_id] = previous_stream
+        raise
 
-    data.update_data(message.author.id, user_data)
+    ids.remember_name(message.author.id, user_data["name"])
+    leaderboard.get(f"streamer_{channel_id}_firsts.firsts").set(str(message.author.id), user_firsts)
 
-    channel = bot.get_channel(message.channel.name)
-    await channel.send(f"PartyHat {message.author.name} was first and now has {user_firsts} firsts! PartyHat")
+    announcements.add(channel_id, message.channel.name, "firsts", message.author.name, user_firsts)
     print(
         f"[firsts] {message.author.name} was first and now has {user_firsts} firsts in {message.channel.name}'s channel")
 
@@ -1,10 +1,92 @@
 from twitchio.ext import commands
 from twitchio.ext import routines
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
 
 from bot.cogs import watchstreak, firsts, custom_commands, valorant
+from bot.utilities import ids, features, metrics, known_bots, live_streams, announcements
 
 from data import data
 
+load_dotenv()
+
+COMMAND_PREFIX = "!"
+
+# Deadline in seconds for each pipeline stage, after which the stage is cancelled
+# so that a hanging dependency only costs bounded latency.
+# Each one can be overridden with a STAGE_TIMEOUT_<STAGE> environment variable.
+STAGE_TIMEOUTS = {
+    "firsts": float(os.getenv("STAGE_TIMEOUT_FIRSTS", "5")),
+    "watchstreaks": float(os.getenv("STAGE_TIMEOUT_WATCHSTREAKS", "5")),
+    "customcommands": float(os.getenv("STAGE_TIMEOUT_CUSTOMCOMMANDS", "15")),  # Allows for {urlfetch} placeholders
+    "triggers": float(os.getenv("STAGE_TIMEOUT_TRIGGERS", "15")),
+    "winlossnoti": float(os.getenv("STAGE_TIMEOUT_WINLOSSNOTI", "45")),
+}
+
+
+class MessageInfo:
+    """
+    Classification of a chat message, computed once and shared by every pipeline stage.
+    """
+
+    __slots__ = ("channel_id", "content", "first_token", "is_command", "is_bot_author", "trigger_command")
+
+    def __init__(self, message, channel_id):
+        """
+        Classifies a chat message.
+
+        Parameters:
+            message: The Twitch message.
+            channel_id (str): The ID of the channel the message was sent in.
+        """
+        content = message.content
+        words = content.split(None, 1)
+
+        self.channel_id = channel_id
+        self.content = content
+        self.first_token = words[0].lower() if words else ""
+        self.is_command = content.startswith(COMMAND_PREFIX)
+        self.is_bot_author = message.author.name in known_bots.KNOWN_BOTS
+        self.trigger_command = None
+
+
+def route_message(info):
+    """
+    Get the pipeline stages that apply to a classified message.
+
+    Plain chat lines only reach the firsts and watchstreaks stages, the custom
+    commands stage is only reached when the first token is a known command
+    name or alias in the channel, and the triggers stage only when the
+    message contains one of the channel's trigger phrases.
+
+    Parameters:
+        info (MessageInfo): The classified message.
+
+    Returns:
+        list: The names of the stages to run, in order.
+    """
+    disabled_mask = features.get_disabled_mask(info.channel_id)
+    stages = []
+
+    if not info.is_command and not info.is_bot_author and not disabled_mask & features.FEATURE_BITS["firsts"]:
+        stages.append("firsts")
+
+    if not disabled_mask & features.FEATURE_BITS["watchstreaks"]:
+        stages.append("watchstreaks")
+
+    if not disabled_mask & features.FEATURE_BITS["customcommands"]:
+        if info.first_token in custom_commands.get_command_index(info.channel_id):
+            stages.append("customcommands")
+        elif not info.is_command and not info.is_bot_author:
+            # Matched here so that messages without any trigger phrase never start the stage
+            info.trigger_command = custom_commands.match_trigger(info.channel_id, info.content)
+            if info.trigger_command is not None:
+                stages.append("triggers")
+
+    return stages
+
 
 class GlobalEventHandler(commands.Cog):
     """
@@ -21,8 +103,10 @@ class GlobalEventHandler(commands.Cog):
         """
         self.bot = bot
 
-        # Starting the background routine
+        # Starting the background routines
         self.background_routine.start()
+        # Failed sends are retried by announcements.flush, an unexpected error must not stop every announcement
+        self.announcement_routine.start(stop_on_error=False)
 
     @commands.Cog.event()
     async def event_message(self, message):
@@ -33,9 +117,40 @@ class GlobalEventHandler(commands.Cog):
             message: The Twitch message.
         """
 
-        await firsts.handle_firsts_message_event(self.bot, message)
-        await watchstreak.handle_watchstreaks_message_event(self.bot, message)
-        await custom_commands.handle_command_message_event(self.bot, message)
+        # Ignore the bot's own messages
+        if message.echo or message.author is None:
+            return
+
+        metrics.increment("luminbot_messages_total")
+
+        with metrics.timer("luminbot_message_seconds"):
+            # Skip the whole pipeline for channels that have every message feature disabled
+            channel_id = ids.get_id_from_name(message.channel.name)
+            if features.message_pipeline_disabled(channel_id):
+                return
+
+            info = MessageInfo(message, channel_id)
+
+            # Stages still run one after another as they share the channel document,
+            # but each one is bounded by its deadline and isolated from the others' errors
+            for stage in route_message(info):
+                if stage == "firsts":
+                    await run_stage(stage, firsts.handle_firsts_message_event(self.bot, message, channel_id))
+                elif stage == "watchstreaks":
+                    await run_stage(stage, watchstreak.handle_watchstreaks_message_event(self.bot, message, channel_id))
+                elif stage == "customcommands":
+                    await run_stage(stage, custom_commands.handle_command_message_event(self.bot, message, channel_id,
+                                                                                        info.first_token))
+                elif stage == "triggers":
+                    await run_stage(stage, custom_commands.handle_trigger_message_event(self.bot, message, channel_id,
+                                                                                        info.trigger_command))
+
+    @routines.routine(seconds=announcements.ANNOUNCEMENT_FLUSH_INTERVAL)
+    async def announcement_routine(self):
+        """
+        Sends the milestone announcements whose window has ended, combined into as few messages as possible.
+        """
+        await announcements.flush(self.bot)
 
     @routines.routine(seconds=60)
     async def background_routine(self):
@@ -58,7 +173,11 @@ class GlobalEventHandler(commands.Cog):
         user_logins = [channel.name for channel in connected_channels]
 
         # Fetch live streams for connected channels
-        streams = await self.bot.fetch_streams(user_logins=user_logins, type="live")
+        with metrics.timer("luminbot_external_api_seconds", service="helix", endpoint="streams"):
+            streams = await self.bot.fetch_streams(user_logins=user_logins, type="live")
+
+        # Refresh the shared live stream cache used by the message handlers
+        live_streams.update(user_logins, streams)
 
         # Convert Stream objects to a serializable format
         serializable_streams = [
@@ -76,7 +195,7 @@ class GlobalEventHandler(commands.Cog):
         ]
 
         # Trigger Valorant win/loss notifications
-        await valorant.win_loss_notifications(self.bot, streams, False)
+        await run_stage("winlossnoti", valorant.win_loss_notifications(self.bot, streams, False))
 
         # Updating the logged stream data
         streams_data = data.get_data("streams")
@@ -84,5 +203,37 @@ class GlobalEventHandler(commands.Cog):
         data.update_data("streams", streams_data)
 
 
+async def run_stage(stage, coroutine):
+    """
+    Run a pipeline stage under its deadline, isolating any error it raises.
+
+    A stage that exceeds its deadline is cancelled. Timeouts and errors are
+    counted per stage and never propagate to the caller, so the following
+    stages still run.
+
+    Parameters:
+        stage (str): The stage name, as used in STAGE_TIMEOUTS.
+        coroutine: The stage's coroutine.
+
+    Returns:
+        bool: True if the stage completed without timing out or raising.
+    """
+    start_time = time.perf_counter()
+
+    try:
+        await asyncio.wait_for(coroutine, timeout=STAGE_TIMEOUTS[stage])
+        return True
+    except asyncio.TimeoutError:
+        metrics.increment("luminbot_pipeline_stage_timeouts_total", stage=stage)
+        print(f"[pipeline] Stage {stage} timed out after {STAGE_TIMEOUTS[stage]} seconds and was cancelled")
+        return False
+    except Exception as error:
+        metrics.increment("luminbot_pipeline_stage_errors_total", stage=stage)
+        print(f"[pipeline] Ignoring exception in stage {stage}: {error!r}")
+        return False
+    finally:
+        metrics.observe("luminbot_pipeline_stage_seconds", time.perf_counter() - start_time, stage=stage)
+
+
 def prepare(bot: commands.Bot):
     bot.add_cog(GlobalEventHandler(bot))
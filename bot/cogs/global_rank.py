@@ -2,7 +2,7 @@ from twitchio.ext import commands
 from typing import Optional
 
 from bot.cogs import valorant, osu
-from bot.utilities import ids, add_mention
+from bot.utilities import ids, add_mention, features
 from data import data
 
 class GlobalRank(commands.Cog):
@@ -40,11 +40,8 @@ class GlobalRank(commands.Cog):
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "rank" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "rank"):
+            return
 
         # Get ranks for different games
         ranks = {
@@ -1,19 +1,9 @@
 from twitchio.ext import commands
 from typing import Optional
-from dotenv import load_dotenv
 
-import aiohttp
-import os
-import requests
-
-from bot.utilities import ids
+from bot.utilities import ids, features, beatmap_cache, osu_api, pp_cache, pp_calculator
 from data import data
 
-load_dotenv()
-
-PP_ADDICT_APIKEY = os.getenv("PP_ADDICT_APIKEY")
-OSU_V1_APIKEY = os.getenv("OSU_V1_APIKEY")
-
 
 class Osu(commands.Cog):
     """
@@ -29,6 +19,10 @@ class Osu(commands.Cog):
         """
         self.bot = bot
 
+        # Loading the most recently used beatmaps so the first commands after a restart need no API calls
+        loaded = beatmap_cache.warm_up()
+        print(f"[osu] Loaded {loaded} cached beatmaps")
+
     @commands.command()
     @commands.cooldown(rate=1, per=5, bucket=commands.Bucket.channel)
     async def osuset(self, ctx: commands.Context, *, arg: Optional[str] = None):
@@ -56,14 +50,18 @@ class Osu(commands.Cog):
         arg = arg.replace(" 󠀀", "")
 
         # Retrieve user data from osu!
-        user_request = await get_user(arg)
-
         try:
-            user_id = user_request.json()[0]["user_id"]
-        except IndexError:
+            user = await osu_api.client.get_user(arg)
+        except osu_api.OsuApiError as error:
+            await reply_unavailable(ctx, error)
+            return
+
+        if user is None:
             await ctx.reply("The osu! account you specified appears to be invalid.")
             return
 
+        user_id = user.user_id
+
         # Retrieve channel data
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
@@ -121,77 +119,54 @@ class Osu(commands.Cog):
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "osu.recent" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "osu.recent"):
+            return
 
         try:
             user_id = channel_data["osu"]["user_id"]
         except (KeyError, ValueError):
             return
 
-        recent_request = await get_recent(user_id)
-        recent_info = recent_request.json()
-        if not recent_info:
-            await ctx.reply(f"{ctx.channel.name} has not played a map recently.")
-            return
-
-        pp_info = await get_pp_value(beatmap_id=recent_info[0]["beatmap_id"],
-                                     combo=recent_info[0]["maxcombo"],
-                                     good=recent_info[0]["count300"],
-                                     ok=recent_info[0]["count100"],
-                                     meh=recent_info[0]["count50"],
-                                     miss=recent_info[0]["countmiss"],
-                                     mods=convert_osu_mods_to_readable(mods_integer=int((recent_info[0]["enabled_mods"])), output_format="list"))
-
-        beatmap_id = recent_info[0]["beatmap_id"]
-
-        beatmap_request = await get_beatmap(beatmap_id)
-        beatmap_info = beatmap_request.json()[0]
-
-        beatmap_title = beatmap_info["title"]
-        beatmap_diff_name = beatmap_info["version"]
-        beatmap_max_combo = beatmap_info["max_combo"]
+        try:
+            recent = await osu_api.client.get_recent(user_id)
+            if recent is None:
+                await ctx.reply(f"{ctx.channel.name} has not played a map recently.")
+                return
 
-        accuracy = pp_info['accuracy']
-        max_combo = pp_info['max_combo']
-        miss = pp_info['miss']
-        local_pp = pp_info['local_pp']
-        new_sr = pp_info['newSR']
+            # Fetched with the play's mods so the star rating matches them
+            beatmap = await beatmap_cache.get_beatmap(recent.beatmap_id, recent.enabled_mods)
+            if beatmap is None:
+                return
 
-        """
-        perfect = pp_info['perfect']
-        great = pp_info['great']
-        good = pp_info['good']
-        aim_pp = pp_info['aim_pp']
-        tap_pp = pp_info['tap_pp']
-        acc_pp = pp_info['acc_pp']
-        """
+            score = await calculate_score(beatmap=beatmap,
+                                          mods=recent.enabled_mods,
+                                          combo=recent.max_combo,
+                                          good=recent.count300,
+                                          ok=recent.count100,
+                                          meh=recent.count50,
+                                          miss=recent.count_miss)
+
+            if_fc = ""
+
+            if beatmap.max_combo is not None and (score.miss > 0 or score.max_combo + 9 < beatmap.max_combo):
+                if_fc_score = await calculate_score(beatmap=beatmap,
+                                                    mods=recent.enabled_mods,
+                                                    combo=beatmap.max_combo,
+                                                    good=recent.count300,
+                                                    ok=recent.count100,
+                                                    meh=recent.count50,
+                                                    miss=0)
+                if_fc = f" ({format_pp(if_fc_score.pp, if_fc_score.approximate)} for {if_fc_score.accuracy}% FC)"
+        except osu_api.OsuApiError as error:
+            await reply_unavailable(ctx, error)
+            return
 
-        if_fc = ""
-
-        if int(miss) > 0 or int(max_combo) + 9 < int(beatmap_max_combo):
-            miss_simulate = 0
-            max_combo_simulate = beatmap_max_combo
-            if_fc_pp_info = await get_pp_value(beatmap_id=beatmap_id,
-                                         combo=max_combo_simulate,
-                                         good=recent_info[0]["count300"],
-                                         ok=recent_info[0]["count100"],
-                                         meh=recent_info[0]["count50"],
-                                         miss=miss_simulate,
-                                         mods=convert_osu_mods_to_readable(mods_integer=int((recent_info[0]["enabled_mods"])), output_format="list"))
-            if_fc_local_pp = if_fc_pp_info['local_pp']
-            if_fc_acc = if_fc_pp_info['accuracy']
-            if_fc = f" ({round(if_fc_local_pp)}pp for {if_fc_acc}% FC)"
-
-        rank = recent_info[0]["rank"]
-        mods = recent_info[0]["enabled_mods"]
-        mods_string = convert_osu_mods_to_readable(mods_integer=int((recent_info[0]["enabled_mods"])), output_format="string")
+        # The star rating is osu!'s own, like in !map, as the local calculator only approximates it
+        beatmap_stars = round(beatmap.difficulty_rating, 2)
+        mods_string = convert_osu_mods_to_readable(mods_integer=recent.enabled_mods, output_format="string")
 
         await ctx.reply(
-            f"Recent Score: {beatmap_title} [{beatmap_diff_name}] ({new_sr}⭐️) +{mods_string} https://osu.ppy.sh/b/{beatmap_id} | Accuracy: {accuracy:.2f}% | {round(local_pp)}pp{if_fc} | Combo: {max_combo}/{beatmap_max_combo} | {miss}❌ | Rank: {rank}")
+            f"Recent Score: {beatmap.title} [{beatmap.version}] ({beatmap_stars}⭐️) +{mods_string} https://osu.ppy.sh/b/{recent.beatmap_id} | Accuracy: {score.accuracy:.2f}% | {format_pp(score.pp, score.approximate)}{if_fc} | Combo: {score.max_combo}/{beatmap.max_combo} | {score.miss}❌ | Rank: {recent.rank}")
 
     @commands.command(aliases=["osu"])
     @commands.cooldown(rate=1, per=5, bucket=commands.Bucket.channel)
@@ -210,29 +185,28 @@ class Osu(commands.Cog):
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "osu.profile" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "osu.profile"):
+            return
 
         try:
             user_id = channel_data["osu"]["user_id"]
         except (KeyError, ValueError):
             return
 
-        user_request = await get_user(user_id)
-        user_data = user_request.json()[0]
+        try:
+            user = await osu_api.client.get_user(user_id)
+        except osu_api.OsuApiError as error:
+            await reply_unavailable(ctx, error)
+            return
 
-        profile_url = f"https://osu.ppy.sh/u/{user_data['user_id']}"
-        rank = user_data["pp_rank"]
-        username = user_data["username"]
-        pp = round(float(user_data["pp_raw"]))
-        country = user_data["country"]
-        country_rank = user_data["pp_country_rank"]
-        acc = round(float(user_data["accuracy"]), 2)
+        if user is None:
+            return
+
+        profile_url = f"https://osu.ppy.sh/u/{user.user_id}"
+        pp = round(user.pp_raw)
+        acc = round(user.accuracy, 2)
 
-        await ctx.reply(f"{profile_url} {username}: #{rank} (#{country_rank} {country}) {pp}PP (Profile Acc: {acc}%)")
+        await ctx.reply(f"{profile_url} {user.username}: #{user.pp_rank} (#{user.pp_country_rank} {user.country}) {pp}PP (Profile Acc: {acc}%)")
 
     @commands.command()
     @commands.cooldown(rate=1, per=5, bucket=commands.Bucket.channel)
@@ -251,47 +225,40 @@ class Osu(commands.Cog):
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "osu.map" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "osu.map"):
+            return
 
         try:
             user_id = channel_data["osu"]["user_id"]
         except (KeyError, ValueError):
             return
 
-        recent_request = await get_recent(user_id)
-
-        if not recent_request.json():
-            await ctx.reply(f"{ctx.channel.name} has not played a map recently.")
-            return
-
-        beatmap_id = recent_request.json()[0]["beatmap_id"]
-        beatmap_request = await get_beatmap(beatmap_id)
-
-        beatmap_info = beatmap_request.json()[0]
-        beatmap_title = beatmap_info["title"]
-        beatmap_diff_name = beatmap_info["version"]
-        beatmap_stars = round(float(beatmap_info["difficultyrating"]), 2)
-
-        mods = recent_request.json()[0]["enabled_mods"]
-        mods_string = convert_osu_mods_to_readable(mods_integer=int(mods), output_format="string")
+        try:
+            recent = await osu_api.client.get_recent(user_id)
+            if recent is None:
+                await ctx.reply(f"{ctx.channel.name} has not played a map recently.")
+                return
 
-        pp_values_request = await get_pp_values(beatmap_id, mods)
+            # Fetched with the play's mods so the star rating matches them
+            beatmap = await beatmap_cache.get_beatmap(recent.beatmap_id, recent.enabled_mods)
+            if beatmap is None:
+                return
 
-        accuracy_values = {key: None for key in ['1.0', '0.99', '0.97', '0.95']}
+            pp_values = await get_pp_values(beatmap, recent.enabled_mods)
+        except osu_api.OsuApiError as error:
+            await reply_unavailable(ctx, error)
+            return
 
-        for key, value in pp_values_request.json()["ppForAcc"].items():
-            if key in accuracy_values:
-                accuracy_values[key] = round(value)
+        beatmap_stars = round(beatmap.difficulty_rating, 2)
+        mods_string = convert_osu_mods_to_readable(mods_integer=recent.enabled_mods, output_format="string")
 
         pp_values_string = ""
-        for key, value in accuracy_values.items():
-            pp_values_string += f"{round(float(key) * 100)}%: {value}PP, "
+        for accuracy in [1.0, 0.99, 0.97, 0.95]:
+            pp = pp_values.pp_for_accuracy.get(accuracy)
+            pp_string = format_pp(pp, pp_values.approximate) if pp is not None else "?pp"
+            pp_values_string += f"{round(accuracy * 100)}%: {pp_string}, "
 
-        reply_message = f"{beatmap_title} [{beatmap_diff_name}] ({beatmap_stars}⭐️) +{mods_string} https://osu.ppy.sh/b/{beatmap_id} | {pp_values_string}"
+        reply_message = f"{beatmap.title} [{beatmap.version}] ({beatmap_stars}⭐️) +{mods_string} https://osu.ppy.sh/b/{recent.beatmap_id} | {pp_values_string}"
         await ctx.reply(reply_message)
 
 
@@ -317,173 +284,104 @@ async def get_rank(channel_name):
     except (KeyError, ValueError):
         return None
 
-    user_request = await get_user(user_id)
-
-    rank = user_request.json()[0]["pp_rank"]
-    pp = round(float(user_request.json()[0]["pp_raw"]))
+    try:
+        user = await osu_api.client.get_user(user_id)
+    except osu_api.OsuApiError as error:
+        print(f"[osu] Failed to retrieve the rank of {channel_name}: {error}")
+        return None
 
-    country = user_request.json()[0]["country"]
-    country_rank = user_request.json()[0]["pp_country_rank"]
+    if user is None:
+        return None
 
-    return f"Rank #{rank} (#{country_rank} {country}) {pp}PP"
+    return f"Rank #{user.pp_rank} (#{user.pp_country_rank} {user.country}) {round(user.pp_raw)}PP"
 
 
-async def get_user(username):
+async def calculate_score(beatmap, mods, good, ok, meh, miss, combo):
     """
-    Get osu user information by username.
+    Calculate the PP of a play with the remote calculator, falling back to the local one when it fails.
 
     Parameters:
-    - username (str): The osu username.
+    - beatmap (osu_api.Beatmap): The beatmap.
+    - mods (int): The osu mods as a bitmask.
+    - good (int): The number of "good" hits in the play.
+    - ok (int): The number of "ok" hits in the play.
+    - meh (int): The number of "meh" hits in the play.
+    - miss (int): The number of misses in the play.
+    - combo (int): The maximum combo achieved in the play.
 
     Returns:
-    requests.Response: The HTTP response containing user information.
-    """
-    url = f"https://osu.ppy.sh/api/get_user"
+    osu_api.ScoreCalculation: The calculated play.
 
-    params = {
-        'k': OSU_V1_APIKEY,
-        'u': username
-    }
-
-    try:
-        response = requests.get(url=url, params=params)
-        response.raise_for_status()
-        return response
-    except requests.exceptions.HTTPError as http_err:
-        return http_err.response
-    except requests.exceptions.RequestException as req_err:
-        print(f"Error retrieving osu! user information: {req_err}")
-        return None
-
-
-async def get_recent(user_id):
+    Raises:
+    - OsuApiError: If both the remote and the local calculator failed.
     """
-    Get the most recent osu play information for a user.
-
-    Parameters:
-    - user_id (str): The osu user ID.
-
-    Returns:
-    requests.Response: The HTTP response containing recent play information.
-    """
-    url = f"https://osu.ppy.sh/api/get_user_recent"
-
-    params = {
-        'k': OSU_V1_APIKEY,
-        'u': user_id
-    }
-
     try:
-        response = requests.get(url=url, params=params)
-        response.raise_for_status()
-        return response
-    except requests.exceptions.HTTPError as http_err:
-        return http_err.response
-    except requests.exceptions.RequestException as req_err:
-        print(f"Error retrieving osu! recent information: {req_err}")
-        return None
+        return await pp_cache.calculate_score(beatmap_id=beatmap.beatmap_id,
+                                              mods=convert_osu_mods_to_readable(mods_integer=mods, output_format="list"),
+                                              good=good, ok=ok, meh=meh, miss=miss, combo=combo)
+    except osu_api.OsuApiError as error:
+        remote_error = error
+
+    # The local calculator uses an older PP model, so its values are only shown while the remote one is down
+    print(f"[osu] Calculating beatmap {beatmap.beatmap_id} locally: {remote_error}")
+    try:
+        return await pp_calculator.calculate_score(beatmap, mods, good, ok, meh, miss, combo)
+    except (osu_api.OsuApiError, ValueError) as error:
+        print(f"[osu] Local calculation of beatmap {beatmap.beatmap_id} failed: {error}")
+        raise remote_error
 
 
-async def get_beatmap(beatmap_id):
+async def get_pp_values(beatmap, mods):
     """
-    Get osu beatmap information by beatmap ID.
+    Get the PP of a beatmap at several accuracies from Tillerino, falling back to the local calculator when it fails.
 
     Parameters:
-    - beatmap_id (str): The osu beatmap ID.
+    - beatmap (osu_api.Beatmap): The beatmap.
+    - mods (int): The osu mods as a bitmask.
 
     Returns:
-    requests.Response: The HTTP response containing beatmap information.
-    """
-    url = f"https://osu.ppy.sh/api/get_beatmaps"
+    osu_api.PpValues: The PP values.
 
-    params = {
-        'k': OSU_V1_APIKEY,
-        'b': beatmap_id
-    }
+    Raises:
+    - OsuApiError: If both Tillerino and the local calculator failed.
+    """
+    try:
+        return await pp_cache.get_pp_values(beatmap.beatmap_id, mods)
+    except osu_api.OsuApiError as error:
+        remote_error = error
 
+    print(f"[osu] Calculating beatmap {beatmap.beatmap_id} locally: {remote_error}")
     try:
-        response = requests.get(url=url, params=params)
-        response.raise_for_status()
-        return response
-    except requests.exceptions.HTTPError as http_err:
-        return http_err.response
-    except requests.exceptions.RequestException as req_err:
-        print(f"Error retrieving osu! recent information: {req_err}")
-        return None
+        return await pp_calculator.get_pp_values(beatmap, mods)
+    except (osu_api.OsuApiError, ValueError) as error:
+        print(f"[osu] Local calculation of beatmap {beatmap.beatmap_id} failed: {error}")
+        raise remote_error
 
 
-async def get_pp_values(beatmap_id, mods):
+def format_pp(pp, approximate):
     """
-    Get osu PP values for a specific beatmap and mods.
+    Format a PP value, marking values from the local calculator as approximate.
 
     Parameters:
-    - beatmap_id (str): The osu beatmap ID.
-    - mods (str): The osu mods.
+    - pp (float): The PP value.
+    - approximate (bool): Whether the value comes from the local calculator.
 
     Returns:
-    requests.Response: The HTTP response containing PP values.
+    str: The formatted PP value, such as "~250pp".
     """
-    url = "https://api.tillerino.org/beatmapinfo"
-
-    params = {
-        'k': PP_ADDICT_APIKEY,
-        'beatmapid': beatmap_id,
-        'mods': mods,
-    }
-
-    try:
-        response = requests.get(url=url, params=params)
-        response.raise_for_status()
-        return response
-    except requests.exceptions.HTTPError as http_err:
-        return http_err.response
-    except requests.exceptions.RequestException as req_err:
-        print(f"Error retrieving osu! recent information: {req_err}")
-        return None
+    return f"{'~' if approximate else ''}{round(pp)}pp"
 
 
-async def get_pp_value(beatmap_id, mods, good, ok, meh, miss, combo):
+async def reply_unavailable(ctx, error):
     """
-    Calculate osu! performance points (PP) for a specific play.
+    Reply that osu! could not be reached, after every retry failed.
 
     Parameters:
-    - beatmap_id (str): The osu! beatmap ID.
-    - mods (str): The osu! mods applied to the play.
-    - good (int): The number of "good" hits in the play.
-    - ok (int): The number of "ok" hits in the play.
-    - meh (int): The number of "meh" hits in the play.
-    - miss (int): The number of misses in the play.
-    - combo (int): The maximum combo achieved in the play.
-
-    Returns:
-    dict: A dictionary containing the calculated PP values and additional information.
-        - 'accuracy': The accuracy of the play as a percentage.
-        - 'max_combo': The maximum combo achieved in the play.
-        - 'miss': The number of misses in the play.
-        - 'local_pp': The calculated PP value for the play.
-        - 'newSR': The new star rating of the beatmap after applying mods.
+    - ctx (commands.Context): The command context.
+    - error (osu_api.OsuApiError): The error.
     """
-    url = "https://pp-api.huismetbenen.nl/calculate-score"
-
-    data = {
-        'map_id': beatmap_id,
-        'mods': mods,
-        'good': good,
-        'ok': ok,
-        'meh': meh,
-        'miss': miss,
-        'combo': combo,
-        'rework': 'live',
-    }
-
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.patch(url=url, json=data) as response:
-                response.raise_for_status()
-                return await response.json()  # Use await to get the JSON response
-        except aiohttp.ClientError as client_err:
-            print(f"Error retrieving osu! PP values: {client_err}")
-            return None
+    print(f"[osu] {error}")
+    await ctx.reply("osu! is not responding right now, try again later.")
 
 
 def convert_osu_mods_to_readable(mods_integer, output_format):
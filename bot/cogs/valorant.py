@@ -6,7 +6,7 @@ import requests
 import os
 from twitchio.ext import commands
 
-from bot.utilities import ids, add_mention
+from bot.utilities import ids, add_mention, features, metrics
 from data import data
 
 load_dotenv()
@@ -147,11 +147,8 @@ class Valorant(commands.Cog):
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "valorant.record" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "valorant.record"):
+            return
 
         if not channel_data:
             return
@@ -214,11 +211,8 @@ class Valorant(commands.Cog):
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "valorant.radiant" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "valorant.radiant"):
+            return
 
         if not channel_data:
             return
@@ -248,21 +242,12 @@ class Valorant(commands.Cog):
         channel_id = ids.get_id_from_name(ctx.channel.name)
         channel_data = data.get_data(channel_id)
 
-        try:
-            if "valorant.lastgame" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "valorant.lastgame"):
+            return
 
         if not channel_data:
             return
 
-        try:
-            if "valorant.lastgame" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
-
         try:
             name, discriminator = channel_data["valorant"]["account_user"].split("#")
             region = channel_data["valorant"]["account_region"]
@@ -289,7 +274,7 @@ async def win_loss_notifications(bot, streams, command):
 
         if command is False:
             # Check if win/loss notifications are disabled for the channel
-            if channel_data and "valorant.winlossnoti" in channel_data.get("disabled_features", []):
+            if features.is_disabled(channel_id, "valorant.winlossnoti"):
                 continue
 
         try:
@@ -439,6 +424,7 @@ async def get_rank(channel_name):
     return result
 
 
+@metrics.timed("luminbot_external_api_seconds", service="henrik", endpoint="mmr")
 async def get_rr(region: str, name: str, discriminator: str):
     """
     Get Valorant rank information.
@@ -465,6 +451,7 @@ async def get_rr(region: str, name: str, discriminator: str):
         return None
 
 
+@metrics.timed("luminbot_external_api_seconds", service="henrik", endpoint="match")
 async def get_match(match_id):
     """
     Get Valorant match information.
@@ -489,6 +476,7 @@ async def get_match(match_id):
         return None
 
 
+@metrics.timed("luminbot_external_api_seconds", service="henrik", endpoint="mmr-history")
 async def get_career(region: str, name: str, discriminator: str):
     """
     Get Valorant career information.
@@ -515,6 +503,7 @@ async def get_career(region: str, name: str, discriminator: str):
         return None
 
 
+@metrics.timed("luminbot_external_api_seconds", service="henrik", endpoint="leaderboard")
 async def get_leaderboard(region: str):
     """
     Get Valorant leaderboard information.
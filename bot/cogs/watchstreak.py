@@ -1,7 +1,8 @@
 from twitchio.ext import commands
+from twitchio.ext import routines
 from typing import Optional
 
-from bot.utilities import ids, known_bots
+from bot.utilities import ids, known_bots, features, attendance, announcements, leaderboard, live_streams
 from data import data
 
 
@@ -19,6 +20,20 @@ class Watchstreak(commands.Cog):
         """
         self.bot = bot
 
+        # Loading every channel's watchstreak leaderboards once, they are kept up to date from then on
+        loaded = leaderboard.load(r"streamer_\d+_watchstreaks", ["watchstreak", "watchstreak_record"])
+        print(f"[watchstreak] Loaded {loaded} leaderboard entries")
+
+        # Starting the routine writing new attendees to the database
+        self.flush_watchstreaks.start()
+
+    @routines.routine(seconds=attendance.ATTENDANCE_FLUSH_INTERVAL)
+    async def flush_watchstreaks(self):
+        """
+        Writes the attendees seen since the last flush to the database and queues their milestones.
+        """
+        await flush_attendance(self.bot)
+
     @commands.command(aliases=["watchstreaks", "ws"])
     @commands.cooldown(rate=1, per=5, bucket=commands.Bucket.channel)
     async def watchstreak(self, ctx: commands.Context, *, arg: Optional[str] = None):
@@ -32,6 +47,10 @@ class Watchstreak(commands.Cog):
         Usage:
             !watchstreak
             !watchstreak top
+            !watchstreak recordtop
+            !watchstreak rank
+            !watchstreak attendance [streams]
+            !watchstreak grace
         """
 
         # Extract channel information
@@ -39,11 +58,11 @@ class Watchstreak(commands.Cog):
         channel_data = data.get_data(channel_id)
 
         # Check if watchstreaks feature is disabled for the channel
-        try:
-            if "watchstreaks" in channel_data["disabled_features"]:
-                return
-        except (KeyError, ValueError):
-            pass
+        if features.is_disabled(channel_id, "watchstreaks"):
+            return
+
+        # Make sure recent attendees are in the database before reading or changing it
+        attendance.commit(channel_id)
 
         if arg is None:
             await self.handle_basic_watchstreak(ctx, channel_id)
@@ -60,6 +79,18 @@ class Watchstreak(commands.Cog):
             await self.handle_recordtop_watchstreaks(ctx, channel_id)
             return
 
+        if args[0] == "rank":
+            await self.handle_rank_watchstreak(ctx, channel_id)
+            return
+
+        if args[0] == "attendance":
+            await self.handle_attendance_watchstreak(ctx, channel_id, args[1] if len(args) > 1 else None)
+            return
+
+        if args[0] == "grace":
+            await self.handle_grace_watchstreak(ctx, channel_id)
+            return
+
         if args[0] == "set":
 
             # Check if the command issuer is a moderator or broadcaster
@@ -111,6 +142,9 @@ class Watchstreak(commands.Cog):
 
             # Update the data
             data.update_data(user_id, user_data)
+            leaderboard.get(f"streamer_{channel_id}_watchstreaks.watchstreak").set(str(user_id), streak)
+            leaderboard.get(f"streamer_{channel_id}_watchstreaks.watchstreak_record").set(
+                str(user_id), user_watchstreak_data["watchstreak_record"])
 
             await ctx.reply(f"Watchstreak for {username} set to {streak}.")
 
@@ -143,20 +177,8 @@ class Watchstreak(commands.Cog):
             ctx (commands.Context): The command context.
             channel_id (str): The channel ID.
         """
-        leaderboard = "PogChamp Top Active Watchstreaks: "
-        sorted_documents = data.get_sorted_document_ids(f"streamer_{channel_id}_watchstreaks.watchstreak")
-
-        for index, document_id in enumerate(sorted_documents):
-            if index >= 10:
-                break
-
-            document = data.get_data(document_id)
-            document_watchstreak = document[f"streamer_{channel_id}_watchstreaks"]["watchstreak"]
-            document_user = ids.get_name_from_id(document_id)
-
-            leaderboard = leaderboard + f"{index + 1}. {document_user} ({document_watchstreak}), "
-
-        await ctx.reply(leaderboard + "PogChamp")
+        board = leaderboard.get(f"streamer_{channel_id}_watchstreaks.watchstreak")
+        await ctx.reply(leaderboard.format_top("PogChamp Top Active Watchstreaks: ", board))
 
     async def handle_recordtop_watchstreaks(self, ctx: commands.Context, channel_id: str):
         """
@@ -166,127 +188,113 @@ class Watchstreak(commands.Cog):
             ctx (commands.Context): The command context.
             channel_id (str): The channel ID.
         """
-        leaderboard = "PogChamp Top Watchstreak Records: "
-        sorted_documents = data.get_sorted_document_ids(f"streamer_{channel_id}_watchstreaks.watchstreak_record")
+        board = leaderboard.get(f"streamer_{channel_id}_watchstreaks.watchstreak_record")
+        await ctx.reply(leaderboard.format_top("PogChamp Top Watchstreak Records: ", board))
 
-        for index, document_id in enumerate(sorted_documents):
-            if index >= 10:
-                break
-
-            document = data.get_data(document_id)
-            document_watchstreak = document[f"streamer_{channel_id}_watchstreaks"]["watchstreak_record"]
-            document_user = ids.get_name_from_id(document_id)
+    async def handle_rank_watchstreak(self, ctx: commands.Context, channel_id: str):
+        """
+        Helper method to handle 'rank' command.
 
-            leaderboard = leaderboard + f"{index + 1}. {document_user} ({document_watchstreak}), "
+        Parameters:
+            ctx (commands.Context): The command context.
+            channel_id (str): The channel ID.
+        """
+        user_id = str(ctx.author.id)
+        active_board = leaderboard.get(f"streamer_{channel_id}_watchstreaks.watchstreak")
+        record_board = leaderboard.get(f"streamer_{channel_id}_watchstreaks.watchstreak_record")
 
-        await ctx.reply(leaderboard + "PogChamp")
+        if user_id not in record_board:
+            await ctx.reply("You do not have a watchstreak in this channel yet.")
+            return
 
+        active = (f"#{active_board.rank(user_id)} of {len(active_board)} ({active_board.get(user_id)})"
+                  if user_id in active_board else "unranked")
+        record = f"#{record_board.rank(user_id)} of {len(record_board)} ({record_board.get(user_id)})"
 
-async def handle_watchstreaks_message_event(bot, message):
-    """
-    Event handler for processing messages and updating watchstreaks.
+        await ctx.reply(f"PartyHat Active watchstreak rank: {active}, record rank: {record}")
 
-    This event is called inside the global_event_handler
-    in order to prevent very annoying race conditions.
+    async def handle_attendance_watchstreak(self, ctx: commands.Context, channel_id: str, streams: Optional[str]):
+        """
+        Helper method to handle 'attendance' command.
 
-    Parameters:
-        bot: The Twitch bot instance.
-        message: The Twitch message.
-    """
+        Parameters:
+            ctx (commands.Context): The command context.
+            channel_id (str): The channel ID.
+            streams (Optional[str]): The number of most recent streams to look at.
+        """
+        try:
+            streams = int(streams) if streams is not None else 10
+        except ValueError:
+            await ctx.reply("The number of streams you specified is not a valid integer.")
+            return
 
-    # Check if watchstreaks feature is disabled for the channel
-    channel_id = ids.get_id_from_name(message.channel.name)
-    channel_data = data.get_data(channel_id)
+        state = attendance.get_state(channel_id, ctx.channel.name)
+        streams = max(1, min(streams, attendance.ATTENDANCE_HISTORY, state.ordinal))
 
-    try:
-        if "watchstreaks" in channel_data["disabled_features"]:
-            return
-    except (KeyError, ValueError):
-        pass
+        watchstreak_data = data.get_data(ctx.author.id).get(f"streamer_{channel_id}_watchstreaks", {})
+        attended = attendance.count_attended(attendance.attendance_bits(watchstreak_data, state.ordinal), streams)
 
-    try:
-        user_id = message.author.id
-    except AttributeError:
-        return
+        await ctx.reply(f"PartyHat You attended {attended} of the last {streams} streams "
+                        f"({round(attended / streams * 100)}%)")
 
-    # Fetch the current stream information
-    stream = await bot.fetch_streams(user_logins=[message.channel.name], type="live")
+    async def handle_grace_watchstreak(self, ctx: commands.Context, channel_id: str):
+        """
+        Helper method to handle 'grace' command.
 
-    if not stream:
-        return
+        Parameters:
+            ctx (commands.Context): The command context.
+            channel_id (str): The channel ID.
+        """
+        state = attendance.get_state(channel_id, ctx.channel.name)
 
-    channel_data.setdefault("watchstreaks", {})
-    current_stream = channel_data["watchstreaks"].get("current_stream")
-    last_stream = channel_data["watchstreaks"].get("last_stream")
+        watchstreak_data = data.get_data(ctx.author.id).get(f"streamer_{channel_id}_watchstreaks", {})
+        streak = attendance.grace_streak(attendance.attendance_bits(watchstreak_data, state.ordinal))
 
-    if current_stream != stream[0].id:
-        last_stream = current_stream
-        current_stream = stream[0].id
+        await ctx.reply(f"PartyHat Your watchstreak with single missed streams forgiven is: {streak}")
 
-        channel_data["watchstreaks"]["last_stream"] = last_stream
-        channel_data["watchstreaks"]["current_stream"] = current_stream
 
-        data.update_data(document_id=channel_id, new_data=channel_data)
+async def handle_watchstreaks_message_event(bot, message, channel_id):
+    """
+    Event handler for processing messages and updating watchstreaks.
 
-        all_watchstreak_documents = data.get_documents_with_key(f"streamer_{channel_id}_watchstreaks.watchstreak")
+    This event is called inside the global_event_handler
+    in order to prevent very annoying race conditions. The handler
+    only routes messages here when the watchstreaks feature is enabled.
 
-        for document_id in all_watchstreak_documents:
-            document = data.get_data(document_id)
+    Parameters:
+        bot: The Twitch bot instance.
+        message: The Twitch message.
+        channel_id (str): The ID of the channel the message was sent in.
+    """
 
-            latest_stream = document[f"streamer_{channel_id}_watchstreaks"]["latest_stream"]
+    stream = await live_streams.get_stream(bot, message.channel.name)
 
-            if latest_stream not in [last_stream, current_stream]:
-                del document[f"streamer_{channel_id}_watchstreaks"]["watchstreak"]
-                data.update_data(document_id, document)
+    if stream is None:
+        return
 
+    # Bot messages still move the channel on to a new stream, but are not counted as attendance
     if message.author.name in known_bots.KNOWN_BOTS:
+        attendance.observe_stream(channel_id, message.channel.name, stream.id)
         return
 
-    user_data = data.get_data(user_id)
-
-    try:
-        user_watchstreak_data = user_data[f"streamer_{channel_id}_watchstreaks"]
-    except (KeyError, ValueError):
-        user_watchstreak_data = {
-            "latest_stream": current_stream,
-            "watchstreak": 1,
-            "watchstreak_record": 1,
-        }
-        user_data[f"streamer_{channel_id}_watchstreaks"] = user_watchstreak_data
-        data.update_data(user_id, user_data)
-        return
+    # Chatters already counted for this stream only cost a set lookup, new attendees are written in batches
+    attendance.record(channel_id, message.channel.name, stream.id, message.author.id, message.author.name,
+                      message.author.display_name)
 
-    user_latest_stream = user_watchstreak_data["latest_stream"]
-    user_watchstreak = user_watchstreak_data["watchstreak"]
-    user_watchstreak_record = user_watchstreak_data["watchstreak_record"]
 
-    # Do nothing if the user's last stream is already this stream
-    if user_latest_stream == current_stream:
-        return
+async def flush_attendance(bot):
+    """
+    Write pending watchstreak attendees to the database and queue the milestones they reached
+    to be announced together.
+
+    Parameters:
+        bot: The Twitch bot instance.
+    """
+    attendance.commit_all()
 
-    # If the user's last stream is not the last stream, reset watchstreak back to 1
-    if user_latest_stream != last_stream:
-        user_latest_stream = current_stream
-        user_watchstreak = 1
-    else:
-        # If the user's last stream is the last stream, add 1 to the watchstreak
-        user_latest_stream = current_stream
-        user_watchstreak += 1
-
-        if user_watchstreak % 5 == 0:
-            channel = bot.get_channel(message.channel.name)
-            await channel.send(
-                f"PartyHat {message.author.name} has reached a watchstreak of {user_watchstreak}! PartyHat")
-            print(
-                f"[watchstreak] {message.author.name} has reached a {user_watchstreak} watchstreak in {message.channel.name}'s channel")
-
-    user_watchstreak_data["latest_stream"] = user_latest_stream
-    user_watchstreak_data["watchstreak"] = user_watchstreak
-
-    if user_watchstreak_record < user_watchstreak:
-        user_watchstreak_data["watchstreak_record"] = user_watchstreak
-
-    data.update_data(user_id, user_data)
+    for channel_id, channel_name, user_name, watchstreak in attendance.pop_announcements():
+        announcements.add(channel_id, channel_name, "watchstreaks", user_name, watchstreak)
+        print(f"[watchstreak] {user_name} has reached a {watchstreak} watchstreak in {channel_name}'s channel")
 
 
 def prepare(bot: commands.Bot):
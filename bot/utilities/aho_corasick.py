@@ -0,0 +1,102 @@
+from collections import deque
+
+
+class Automaton:
+    """
+    An Aho-Corasick automaton matching many patterns against a text in a single pass.
+
+    The patterns are compiled once into a trie whose nodes also link to the
+    longest proper suffix that is a prefix of another pattern, so a text is
+    scanned one character at a time without ever backtracking, however many
+    patterns there are.
+    """
+
+    def __init__(self, patterns):
+        """
+        Compiles the automaton.
+
+        Parameters:
+            patterns (dict): The patterns mapped to the value returned when they match.
+        """
+        # Per node: the transitions by character, the suffix link and the (pattern length, value) pairs ending there
+        self._transitions = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+
+        for pattern, value in patterns.items():
+            if pattern:
+                self._add(pattern, value)
+
+        self._link()
+
+    def __bool__(self):
+        return len(self._transitions) > 1
+
+    def _add(self, pattern, value):
+        node = 0
+        for char in pattern:
+            next_node = self._transitions[node].get(char)
+            if next_node is None:
+                next_node = self._transitions[node][char] = len(self._transitions)
+                self._transitions.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            node = next_node
+        self._outputs[node].append((len(pattern), value))
+
+    def _link(self):
+        # Breadth-first, so the suffix link of a node's parent is always known before the node itself
+        queue = deque(self._transitions[0].values())
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._transitions[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._transitions[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._transitions[fail].get(char, 0)
+
+                # Patterns ending at the suffix also end at this node
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+                queue.append(child)
+
+    def search(self, text):
+        """
+        Find every occurrence of every pattern in a text.
+
+        Parameters:
+            text (str): The text.
+
+        Yields:
+            tuple: The start index, end index and value of each match, ordered by end index.
+        """
+        transitions = self._transitions
+        fail = self._fail
+        outputs = self._outputs
+        node = 0
+
+        for index, char in enumerate(text):
+            while node and char not in transitions[node]:
+                node = fail[node]
+            node = transitions[node].get(char, 0)
+
+            for length, value in outputs[node]:
+                yield index + 1 - length, index + 1, value
+
+    def find_word(self, text):
+        """
+        Find the first pattern occurring in a text as whole words.
+
+        A match counts as whole words when it is not directly preceded or
+        followed by a letter or digit, so a pattern 'hi' does not match 'this'.
+
+        Parameters:
+            text (str): The text.
+
+        Returns:
+            The value of the first whole-word match, or None if there is none.
+        """
+        for start, end, value in self.search(text):
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                return value
+        return None
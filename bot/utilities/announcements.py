@@ -0,0 +1,196 @@
+import time
+
+from bot.utilities import metrics
+from data import data
+
+# Seconds between checks for announcements that are due
+ANNOUNCEMENT_FLUSH_INTERVAL = 1
+
+# Default seconds milestones are collected for before they are announced together,
+# channels can change it with !announcements window
+ANNOUNCEMENT_WINDOW = 5
+
+# Default number of milestones combined into one chat message, a full batch is sent without waiting
+# for the window to end, channels can change it with !announcements batch
+ANNOUNCEMENT_MAX_BATCH = 8
+
+# Limits for the per-channel settings, the batch limit keeps combined messages within Twitch's message length
+MAX_ANNOUNCEMENT_WINDOW = 60
+MAX_ANNOUNCEMENT_BATCH = 15
+
+# Attempts at sending an announcement before it is dropped, a failed send is retried with the next flush
+ANNOUNCEMENT_MAX_ATTEMPTS = 3
+
+# Message templates of each kind of milestone, for a single user and for several users
+TEMPLATES = {
+    "watchstreaks": ("PartyHat {name} has reached a watchstreak of {value}! PartyHat",
+                     "PartyHat {names} reached watchstreaks of {values}! PartyHat"),
+    "firsts": ("PartyHat {name} was first and now has {value} firsts! PartyHat",
+               "PartyHat {names} were first and now have {values} firsts! PartyHat"),
+}
+
+
+class Batch:
+    """
+    Milestones of one kind waiting to be announced in a channel.
+    """
+
+    __slots__ = ("channel_id", "started_at", "events")
+
+    def __init__(self, channel_id):
+        """
+        Initializes an empty batch.
+
+        Parameters:
+            channel_id (str): The ID of the Twitch channel.
+        """
+        self.channel_id = channel_id
+        self.started_at = time.monotonic()
+
+        # (user name, value) tuples in the order they were reached
+        self.events = []
+
+
+# Batches waiting to be sent, keyed by (channel name, kind)
+_batches = {}
+
+# (window, max batch) of each channel, keyed by channel ID
+_settings = {}
+
+# (channel name, kind, message, attempts) tuples of messages whose send failed
+_unsent = []
+
+
+def get_settings(channel_id):
+    """
+    Get the announcement settings of a channel, reading the channel document on first use.
+
+    Parameters:
+        channel_id (str): The ID of the Twitch channel.
+
+    Returns:
+        tuple: The window in seconds and the maximum number of milestones per message.
+    """
+    channel_id = str(channel_id)
+
+    settings = _settings.get(channel_id)
+    if settings is None:
+        channel_settings = data.get_data(channel_id).get("announcements", {})
+        settings = _settings[channel_id] = (channel_settings.get("window", ANNOUNCEMENT_WINDOW),
+                                            channel_settings.get("max_batch", ANNOUNCEMENT_MAX_BATCH))
+
+    return settings
+
+
+def invalidate(channel_id):
+    """
+    Drop the cached settings of a channel so they are read again on next use.
+
+    Parameters:
+        channel_id (str): The ID of the Twitch channel.
+    """
+    _settings.pop(str(channel_id), None)
+
+
+def add(channel_id, channel_name, kind, user_name, value):
+    """
+    Queue a milestone to be announced with the others reached in the same window.
+
+    Parameters:
+        channel_id (str): The ID of the Twitch channel.
+        channel_name (str): The channel login.
+        kind (str): The kind of milestone, as listed in TEMPLATES.
+        user_name (str): The user who reached the milestone.
+        value (int): The value reached.
+    """
+    batch = _batches.get((channel_name, kind))
+    if batch is None:
+        batch = _batches[(channel_name, kind)] = Batch(str(channel_id))
+
+    batch.events.append((user_name, value))
+
+
+def format_message(kind, events):
+    """
+    Combine milestones of one kind into a single chat message.
+
+    Parameters:
+        kind (str): The kind of milestone, as listed in TEMPLATES.
+        events (list): The (user name, value) tuples.
+
+    Returns:
+        str: The message.
+    """
+    single, grouped = TEMPLATES[kind]
+
+    if len(events) == 1:
+        return single.format(name=events[0][0], value=events[0][1])
+
+    names = [name for name, _ in events]
+    return grouped.format(names=", ".join(names[:-1]) + " and " + names[-1],
+                          values="/".join(str(value) for _, value in events))
+
+
+def pop_due(force=False):
+    """
+    Take the messages whose window has ended or whose batch is full.
+
+    Parameters:
+        force (bool): Take every queued milestone, such as when shutting down.
+
+    Returns:
+        list: (channel name, kind, message) tuples to send.
+    """
+    now = time.monotonic()
+    messages = []
+
+    for key, batch in list(_batches.items()):
+        window, max_batch = get_settings(batch.channel_id)
+        channel_name, kind = key
+
+        if force or now - batch.started_at >= window:
+            events, remainder = batch.events, []
+            del _batches[key]
+        else:
+            # Full batches go out early, the rest keeps waiting for the window to end
+            full = len(batch.events) - len(batch.events) % max_batch
+            events, remainder = batch.events[:full], batch.events[full:]
+            batch.events = remainder
+
+        for start in range(0, len(events), max_batch):
+            messages.append((channel_name, kind, format_message(kind, events[start:start + max_batch])))
+
+    return messages
+
+
+async def flush(bot, force=False):
+    """
+    Send every announcement that is due, and retry the ones that failed to send.
+
+    A failed send is logged and retried with the next flush, up to ANNOUNCEMENT_MAX_ATTEMPTS
+    attempts, so it neither loses the messages after it nor stops the calling routine.
+
+    Parameters:
+        bot: The Twitch bot instance.
+        force (bool): Send every queued milestone, such as when shutting down. Failed sends are then dropped.
+    """
+    global _unsent
+
+    pending, _unsent = _unsent, []
+    pending.extend((channel_name, kind, message, 0) for channel_name, kind, message in pop_due(force))
+
+    for channel_name, kind, message, attempts in pending:
+        channel = bot.get_channel(channel_name)
+        if channel is None:
+            continue
+
+        try:
+            with metrics.timer("luminbot_chat_send_seconds", feature=kind):
+                await channel.send(message)
+        except Exception as error:
+            attempts += 1
+            if force or attempts >= ANNOUNCEMENT_MAX_ATTEMPTS:
+                print(f"[announcements] Dropped an announcement in {channel_name} after {attempts} attempts: {error}")
+            else:
+                print(f"[announcements] Failed to send an announcement in {channel_name}, retrying: {error}")
+                _unsent.append((channel_name, kind, message, attempts))
@@ -0,0 +1,357 @@
+from bot.utilities import ids, leaderboard, metrics
+from data import data
+
+# Seconds between writes of new watchstreak attendees to the database,
+# which bounds how much attendance is lost if the bot crashes
+ATTENDANCE_FLUSH_INTERVAL = 10
+
+# Watchstreaks are announced in chat every time they reach a multiple of this
+ANNOUNCE_EVERY = 5
+
+# Number of recent streams whose attendance is kept per user, as bits of a hex string
+ATTENDANCE_HISTORY = 64
+
+
+class StreamState:
+    """
+    The current and previous stream of a channel, with the chatters already counted for the current one.
+    """
+
+    __slots__ = ("current_stream", "last_stream", "ordinal", "seen", "pending", "channel_name")
+
+    def __init__(self, current_stream, last_stream, ordinal, channel_name):
+        """
+        Initializes the stream state.
+
+        Parameters:
+            current_stream (str): The ID of the channel's current stream.
+            last_stream (str): The ID of the channel's previous stream.
+            ordinal (int): The number of streams the channel has had, which numbers the current stream.
+            channel_name (str): The channel login, used for announcements.
+        """
+        self.current_stream = current_stream
+        self.last_stream = last_stream
+        self.ordinal = ordinal
+        self.channel_name = channel_name
+
+        # User IDs as integers, which take far less memory than their strings
+        self.seen = set()
+
+        # Chatters seen but not written to the database yet, user ID mapped to (user name, display name)
+        self.pending = {}
+
+
+# Stream state of each channel, keyed by channel ID
+_channels = {}
+
+# Watchstreak milestones waiting to be announced, as (channel ID, channel name, user name, watchstreak) tuples
+_announcements = []
+
+
+def _key(channel_id):
+    return f"streamer_{channel_id}_watchstreaks"
+
+
+def get_state(channel_id, channel_name):
+    """
+    Get the stream state of a channel, loading it from the channel document on first use.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        channel_name (str): The channel login.
+
+    Returns:
+        StreamState: The channel's stream state.
+    """
+    channel_id = str(channel_id)
+
+    state = _channels.get(channel_id)
+    if state is None:
+        watchstreaks = data.get_data(channel_id).get("watchstreaks", {})
+        state = _channels[channel_id] = StreamState(watchstreaks.get("current_stream"),
+                                                    watchstreaks.get("last_stream"),
+                                                    watchstreaks.get("stream_ordinal", 0), channel_name)
+
+    return state
+
+
+def record(channel_id, channel_name, stream_id, user_id, user_name, display_name=None):
+    """
+    Record that a chatter was present in a channel's live stream.
+
+    A chatter already counted for the stream costs a single set lookup. New
+    attendees are written with the next commit.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        channel_name (str): The channel login.
+        stream_id (str): The ID of the live stream.
+        user_id (str): The ID of the chatter.
+        user_name (str): The login of the chatter.
+        display_name (str): The display name of the chatter, defaults to the login.
+
+    Returns:
+        bool: True if the chatter was not counted for this stream yet.
+    """
+    state = observe_stream(channel_id, channel_name, stream_id)
+
+    user_key = int(user_id)
+    if user_key in state.seen:
+        return False
+
+    state.seen.add(user_key)
+    state.pending[str(user_id)] = (user_name, display_name or user_name)
+    return True
+
+
+def observe_stream(channel_id, channel_name, stream_id):
+    """
+    Note the live stream of a channel, moving the channel on to it if it is a new stream.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        channel_name (str): The channel login.
+        stream_id (str): The ID of the live stream.
+
+    Returns:
+        StreamState: The channel's stream state.
+    """
+    state = get_state(channel_id, channel_name)
+
+    if state.current_stream != stream_id:
+        start_stream(channel_id, stream_id)
+
+    return state
+
+
+def start_stream(channel_id, stream_id):
+    """
+    Move a channel on to a new stream.
+
+    Attendees of the previous stream are committed first. Then the active
+    watchstreak of every chatter who missed the previous stream is removed,
+    all in one batch.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        stream_id (str): The ID of the new stream.
+    """
+    channel_id = str(channel_id)
+    state = _channels[channel_id]
+
+    commit(channel_id)
+
+    state.last_stream = state.current_stream
+    state.current_stream = stream_id
+    state.ordinal += 1
+    state.seen = set()
+
+    channel_data = data.get_data(channel_id)
+    channel_data.setdefault("watchstreaks", {})
+    channel_data["watchstreaks"]["last_stream"] = state.last_stream
+    channel_data["watchstreaks"]["current_stream"] = state.current_stream
+    channel_data["watchstreaks"]["stream_ordinal"] = state.ordinal
+    data.update_data(channel_id, channel_data)
+
+    document_ids = data.get_documents_with_key(f"{_key(channel_id)}.watchstreak")
+    active_board = leaderboard.get(f"{_key(channel_id)}.watchstreak")
+    broken = {}
+
+    for document_id, document in data.get_data_many(document_ids).items():
+        if document[_key(channel_id)].get("latest_stream") not in [state.last_stream, state.current_stream]:
+            del document[_key(channel_id)]["watchstreak"]
+            active_board.remove(document_id)
+            broken[document_id] = document
+
+    if broken:
+        data.update_data_many(broken)
+
+
+def commit(channel_id):
+    """
+    Write the pending attendees of a channel's current stream to the database in one transaction.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+
+    Returns:
+        int: The number of user documents written.
+    """
+    state = _channels.get(str(channel_id))
+    if state is None or not state.pending:
+        return 0
+
+    pending, state.pending = state.pending, {}
+    key = _key(channel_id)
+    active_board = leaderboard.get(f"{key}.watchstreak")
+    record_board = leaderboard.get(f"{key}.watchstreak_record")
+
+    try:
+        with metrics.timer("luminbot_storage_seconds", operation="commit_attendance"):
+            documents = data.get_data_many(pending)
+            changed = {}
+            announcements = []
+
+            for user_id, (user_name, display_name) in pending.items():
+                user_data = documents[user_id]
+                watchstreak_data = user_data.get(key)
+
+                # Stored so leaderboards can show names without asking Helix
+                ids.remember_name(user_id, display_name)
+                if user_data.get("name") != display_name:
+                    user_data["name"] = display_name
+                    changed[user_id] = user_data
+
+                if watchstreak_data is None:
+                    user_data[key] = {
+                        "latest_stream": state.current_stream,
+                        "watchstreak": 1,
+                        "watchstreak_record": 1,
+                        "attendance": "1",
+                        "attendance_ordinal": state.ordinal,
+                    }
+                    changed[user_id] = user_data
+                    continue
+
+                latest_stream = watchstreak_data.get("latest_stream")
+
+                # Nothing to do if the user's last stream is already this stream
+                if latest_stream == state.current_stream:
+                    continue
+
+                # The watchstreak continues if the user's last stream is the previous stream, otherwise it restarts
+                if latest_stream == state.last_stream:
+                    watchstreak = watchstreak_data.get("watchstreak", 0) + 1
+                else:
+                    watchstreak = 1
+
+                # Users from before attendance was kept start with the streams of their active watchstreak
+                if "attendance" not in watchstreak_data and latest_stream == state.last_stream:
+                    watchstreak_data["attendance"] = format((1 << min(watchstreak - 1, ATTENDANCE_HISTORY)) - 1, "x")
+                    watchstreak_data["attendance_ordinal"] = state.ordinal - 1
+
+                watchstreak_data["attendance"] = format(attendance_bits(watchstreak_data, state.ordinal) | 1, "x")
+                watchstreak_data["attendance_ordinal"] = state.ordinal
+
+                if watchstreak > 1 and watchstreak % ANNOUNCE_EVERY == 0:
+                    announcements.append((str(channel_id), state.channel_name, user_name, watchstreak))
+
+                watchstreak_data["latest_stream"] = state.current_stream
+                watchstreak_data["watchstreak"] = watchstreak
+                if watchstreak_data.get("watchstreak_record", 0) < watchstreak:
+                    watchstreak_data["watchstreak_record"] = watchstreak
+
+                changed[user_id] = user_data
+
+            if changed:
+                data.update_data_many(changed)
+
+            for user_id, user_data in changed.items():
+                active_board.set(user_id, user_data[key].get("watchstreak"))
+                record_board.set(user_id, user_data[key].get("watchstreak_record"))
+    except Exception:
+        # Keep the attendees for the next commit
+        state.pending.update(pending)
+        raise
+
+    _announcements.extend(announcements)
+    return len(changed)
+
+
+def attendance_bits(watchstreak_data, ordinal):
+    """
+    Get a user's attendance of a channel's recent streams as bits.
+
+    Bit i is set if the user attended stream number ordinal - i, so bit 0 is
+    the stream numbered ordinal. Only the last ATTENDANCE_HISTORY streams are kept.
+
+    Parameters:
+        watchstreak_data (dict): The user's watchstreak data for the channel.
+        ordinal (int): The number of the stream the bits are relative to.
+
+    Returns:
+        int: The attendance bits.
+    """
+    bits = int(watchstreak_data.get("attendance", "0"), 16)
+    shift = ordinal - watchstreak_data.get("attendance_ordinal", ordinal)
+
+    if shift >= ATTENDANCE_HISTORY:
+        return 0
+
+    # The channel's stream ordinal can go back when an older copy of its document is written back,
+    # the streams recorded after that ordinal are then dropped
+    if shift < 0:
+        return bits >> -shift
+
+    return (bits << shift) & ((1 << ATTENDANCE_HISTORY) - 1)
+
+
+def count_attended(bits, streams):
+    """
+    Count the streams attended among the most recent ones.
+
+    Parameters:
+        bits (int): Attendance bits, as returned by attendance_bits.
+        streams (int): The number of most recent streams to look at.
+
+    Returns:
+        int: The number of those streams attended.
+    """
+    return bin(bits & ((1 << streams) - 1)).count("1")
+
+
+def grace_streak(bits):
+    """
+    Get the watchstreak a user would have if every single missed stream was forgiven.
+
+    The streak counts the attended streams back from the most recent one and
+    ends at the first two streams missed in a row. Missing the most recent
+    stream only counts as the start of such a gap once it is over, so a stream
+    in progress does not end the streak.
+
+    Parameters:
+        bits (int): Attendance bits, as returned by attendance_bits.
+
+    Returns:
+        int: The number of attended streams in the streak.
+    """
+    # Bit i of gaps is set when both stream i and the stream before it were missed
+    gaps = ~bits & ~(bits >> 1) & ((1 << (ATTENDANCE_HISTORY - 1)) - 1) & ~1
+
+    if gaps == 0:
+        return count_attended(bits, ATTENDANCE_HISTORY)
+
+    # Only the streams after the most recent gap belong to the streak
+    return count_attended(bits, (gaps & -gaps).bit_length() - 1)
+
+
+def commit_all():
+    """
+    Write the pending attendees of every channel to the database.
+
+    Channels that fail to be written keep their attendees for the next commit.
+
+    Returns:
+        int: The number of user documents written.
+    """
+    written = 0
+
+    for channel_id in list(_channels):
+        try:
+            written += commit(channel_id)
+        except Exception as error:
+            print(f"[watchstreak] Failed to commit attendance of channel {channel_id}: {error!r}")
+
+    return written
+
+
+def pop_announcements():
+    """
+    Take the watchstreak milestones reached since the last call.
+
+    Returns:
+        list: The (channel ID, channel name, user name, watchstreak) tuples to announce.
+    """
+    announcements = _announcements[:]
+    _announcements.clear()
+    return announcements
@@ -0,0 +1,106 @@
+import dataclasses
+import time
+
+from bot.utilities import metrics, osu_api
+from bot.utilities.lru_cache import LRUCache
+from data import data
+
+# Number of beatmaps kept in memory, on top of the ones stored in the database
+BEATMAP_CACHE_SIZE = 2000
+
+# Number of most recently fetched beatmaps loaded from the database into memory at startup
+BEATMAP_WARM_UP = 500
+
+# Seconds a beatmap is reused before it is fetched again, by approval status.
+# Ranked, approved and loved beatmaps can no longer change, so they never expire.
+BEATMAP_TTLS = {
+    4: None,  # Loved
+    3: 60 * 60,  # Qualified
+    2: None,  # Approved
+    1: None,  # Ranked
+}
+
+# Seconds pending, work in progress and graveyard beatmaps are reused, as their mapper can still update them
+BEATMAP_DEFAULT_TTL = 10 * 60
+
+# Mods that change a beatmap's star rating. Nightcore always comes with the Double Time bit set.
+DIFFICULTY_MODS = 2 | 16 | 64 | 256 | 1024  # EZ, HR, DT, HT, FL
+
+# (Beatmap, fetched_at) keyed by (beatmap_id, mods)
+_cache = LRUCache(BEATMAP_CACHE_SIZE)
+
+
+def _is_fresh(beatmap, fetched_at):
+    ttl = BEATMAP_TTLS.get(beatmap.approved, BEATMAP_DEFAULT_TTL)
+    return ttl is None or time.time() - fetched_at < ttl
+
+
+def warm_up(limit=BEATMAP_WARM_UP):
+    """
+    Load the most recently fetched beatmaps from the database into memory.
+
+    Parameters:
+        limit (int): The maximum number of beatmaps to load.
+
+    Returns:
+        int: The number of beatmaps loaded.
+    """
+    rows = data.get_recent_beatmaps(limit)
+
+    # Least recent first, so the most recent ones end up as the most recently used
+    for beatmap_id, mods, beatmap_data, fetched_at in reversed(rows):
+        _cache.set((beatmap_id, mods), (osu_api.Beatmap(**beatmap_data), fetched_at))
+
+    return len(rows)
+
+
+async def get_beatmap(beatmap_id, mods=0):
+    """
+    Get a beatmap difficulty, from memory, then the database, then the osu! API.
+
+    When the osu! API fails, an expired beatmap is still returned if one is cached.
+
+    Parameters:
+        beatmap_id (int): The beatmap ID.
+        mods (int): The mods of the play as a bitmask, only the difficulty changing ones are used.
+
+    Returns:
+        Beatmap or None: The beatmap, or None if there is no such beatmap.
+
+    Raises:
+        OsuApiError: If the beatmap had to be fetched and the osu! API failed.
+    """
+    key = (int(beatmap_id), int(mods) & DIFFICULTY_MODS)
+
+    cached = _cache.get(key)
+    if cached is not None and _is_fresh(*cached):
+        metrics.increment("luminbot_beatmap_cache_total", result="memory")
+        return cached[0]
+
+    if cached is None:
+        stored = data.get_beatmap(*key)
+        if stored is not None:
+            cached = (osu_api.Beatmap(**stored[0]), stored[1])
+            _cache.set(key, cached)
+
+            if _is_fresh(*cached):
+                metrics.increment("luminbot_beatmap_cache_total", result="disk")
+                return cached[0]
+
+    metrics.increment("luminbot_beatmap_cache_total", result="miss")
+
+    try:
+        beatmap = await osu_api.client.get_beatmap(*key)
+    except osu_api.OsuApiError:
+        if cached is not None:
+            return cached[0]
+        raise
+
+    if beatmap is None:
+        return None
+
+    fetched_at = time.time()
+    _cache.set(key, (beatmap, fetched_at))
+    data.update_beatmap(key[0], key[1], dataclasses.asdict(beatmap), fetched_at)
+
+    return beatmap
@@ -0,0 +1,160 @@
+from bot.utilities import metrics
+from data import data
+
+# Seconds between flushes of the command runtime state to the database,
+# which bounds how much usage is lost if the bot crashes
+COMMAND_STATE_FLUSH_INTERVAL = 10
+
+# Number of unflushed command uses after which the state is flushed right away
+COMMAND_STATE_MAX_PENDING = 500
+
+
+class CommandState:
+    """
+    Runtime state of a custom command, kept in memory between flushes.
+    """
+
+    __slots__ = ("usage_count", "last_used")
+
+    def __init__(self, usage_count, last_used):
+        """
+        Initializes the command state.
+
+        Parameters:
+            usage_count (int): The number of times the command was used.
+            last_used (int): The Unix timestamp of the command's last use.
+        """
+        self.usage_count = usage_count
+        self.last_used = last_used
+
+
+# Runtime state of every used command, keyed by channel ID and then by command name
+_states = {}
+
+# IDs of the channels with state that has not been written to the database yet
+_dirty = set()
+
+# Number of command uses since the last flush
+_pending = 0
+
+
+def get_state(channel_id, command, command_data):
+    """
+    Get the runtime state of a command, loading it from the command data on first use.
+
+    The in-memory state is authoritative afterwards, as the stored usage count
+    and last used timestamp lag behind it until the next flush.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        command (str): The command name.
+        command_data (dict): The stored data of the command.
+
+    Returns:
+        CommandState: The command's runtime state.
+    """
+    channel_states = _states.setdefault(str(channel_id), {})
+
+    state = channel_states.get(command)
+    if state is None:
+        state = channel_states[command] = CommandState(command_data.get("usage_count", 0),
+                                                       command_data.get("last_used", 0))
+
+    return state
+
+
+def record_use(channel_id, command, command_data, timestamp):
+    """
+    Record a use of a command, to be written to the database with the next flush.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        command (str): The command name.
+        command_data (dict): The stored data of the command.
+        timestamp (int): The Unix timestamp of the use.
+
+    Returns:
+        CommandState: The command's updated runtime state.
+    """
+    global _pending
+
+    state = get_state(channel_id, command, command_data)
+    state.usage_count += 1
+    state.last_used = timestamp
+
+    _dirty.add(str(channel_id))
+    _pending += 1
+
+    if _pending >= COMMAND_STATE_MAX_PENDING:
+        flush()
+
+    return state
+
+
+def forget(channel_id, command):
+    """
+    Drop the runtime state of a command, such as when it is removed.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        command (str): The command name.
+    """
+    _states.get(str(channel_id), {}).pop(command, None)
+
+
+def apply(channel_id, channel_data):
+    """
+    Copy the runtime state of a channel's commands into its channel document.
+
+    Anything writing a channel document it loaded earlier should apply the
+    state first, so that it does not write back outdated usage counts.
+
+    Parameters:
+        channel_id: The ID of the Twitch channel.
+        channel_data (dict): The channel document.
+
+    Returns:
+        dict: The updated channel document.
+    """
+    channel_commands = channel_data.get("commands", {})
+
+    for command, state in _states.get(str(channel_id), {}).items():
+        # Commands removed since their last use are not written back
+        if command in channel_commands:
+            channel_commands[command]["usage_count"] = state.usage_count
+            channel_commands[command]["last_used"] = state.last_used
+
+    return channel_data
+
+
+def flush():
+    """
+    Write the runtime state of every channel with unflushed command uses to the database.
+
+    Each channel document is written once, however many uses it had since
+    the last flush. Channels that fail to be written are retried on the
+    next flush.
+
+    Returns:
+        int: The number of channel documents written.
+    """
+    global _pending
+
+    if not _dirty:
+        return 0
+
+    channel_ids = list(_dirty)
+    _dirty.clear()
+    _pending = 0
+    written = 0
+
+    with metrics.timer("luminbot_storage_seconds", operation="flush_command_state"):
+        for channel_id in channel_ids:
+            try:
+                data.update_data(channel_id, apply(channel_id, data.get_data(channel_id)))
+                written += 1
+            except Exception as error:
+                _dirty.add(channel_id)
+                print(f"[Custom Commands] Failed to flush command state of channel {channel_id}: {error!r}")
+
+    return written
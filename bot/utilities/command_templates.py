@@ -0,0 +1,337 @@
+import asyncio
+import datetime
+import functools
+import inspect
+import random
+
+from bot.utilities import metrics, live_streams
+
+# Registered placeholder resolvers, keyed by placeholder name
+PLACEHOLDERS = {}
+
+# Names of placeholders whose result is reused for identical arguments within one render
+SHARED_PLACEHOLDERS = set()
+
+# Maximum number of parsed templates kept in memory
+TEMPLATE_CACHE_SIZE = 4096
+
+# Maximum number of async placeholders of one message resolved at the same time
+RENDER_MAX_CONCURRENCY = 4
+
+
+class Placeholder:
+    """
+    A placeholder segment of a parsed template, such as {user} or {urlfetch <url> json <key>}.
+    """
+
+    __slots__ = ("name", "args", "source", "is_async")
+
+    def __init__(self, name, args, source):
+        """
+        Initializes a placeholder segment.
+
+        Parameters:
+            name (str): The placeholder name.
+            args (tuple): The parsed argument template (may contain nested placeholders).
+            source (str): The placeholder as written in the template.
+        """
+        self.name = name
+        self.args = args
+        self.source = source
+        # Whether resolving the placeholder, or any placeholder nested in its arguments, has to wait
+        self.is_async = inspect.iscoroutinefunction(PLACEHOLDERS[name]) \
+            or any(isinstance(arg, Placeholder) and arg.is_async for arg in args)
+
+
+class RenderContext:
+    """
+    Everything a placeholder may need when rendering a custom command.
+
+    Values that need network calls, such as the live stream, are only fetched
+    when a placeholder asks for them and are shared between placeholders.
+    """
+
+    def __init__(self, bot, message, channel_id, command_data):
+        """
+        Initializes the render context.
+
+        Parameters:
+            bot: The Twitch bot instance.
+            message: The Twitch message that triggered the command.
+            channel_id (str): The ID of the channel.
+            command_data (dict): The data associated with the command.
+        """
+        self.bot = bot
+        self.message = message
+        self.channel_id = channel_id
+        self.command_data = command_data
+        self._stream = None
+        self._stream_fetched = False
+
+        # State placeholder resolvers share within one render, such as a download used by several placeholders
+        self.shared = {}
+
+        self._shared = {}
+        self._slots = asyncio.Semaphore(RENDER_MAX_CONCURRENCY)
+
+    async def get_stream(self):
+        """
+        Get the channel's live stream, looked up at most once per render.
+
+        Returns:
+            twitchio.Stream or None: The live stream, or None when offline.
+        """
+        if not self._stream_fetched:
+            self._stream = await live_streams.get_stream(self.bot, self.message.channel.name)
+            self._stream_fetched = True
+        return self._stream
+
+
+def placeholder(name, shared=False):
+    """
+    Decorator registering a placeholder resolver.
+
+    The resolver is called as resolver(context, args) with the RenderContext and
+    the placeholder's rendered argument string, and may be a regular or async
+    function returning the replacement text.
+
+    Parameters:
+    - name (str): The placeholder name, as written between the braces.
+    - shared (bool): Resolve identical arguments only once per render and reuse the result.
+    """
+
+    def decorator(function):
+        PLACEHOLDERS[name] = function
+        if shared:
+            SHARED_PLACEHOLDERS.add(name)
+        else:
+            SHARED_PLACEHOLDERS.discard(name)
+        parse.cache_clear()
+        return function
+
+    return decorator
+
+
+def _read_name(template, start):
+    end = start
+    while end < len(template) and (template[end].isalnum() or template[end] == "_"):
+        end += 1
+    return template[start:end], end
+
+
+def _parse_segments(template, position, nested):
+    segments = []
+    literal = []
+
+    while position < len(template):
+        char = template[position]
+
+        if nested and char == "}":
+            break
+
+        if char == "{":
+            parsed = _parse_placeholder(template, position)
+            if parsed is not None:
+                segment, position = parsed
+                if literal:
+                    segments.append("".join(literal))
+                    literal = []
+                segments.append(segment)
+                continue
+
+        literal.append(char)
+        position += 1
+
+    if literal:
+        segments.append("".join(literal))
+
+    return tuple(segments), position
+
+
+def _parse_placeholder(template, start):
+    name, position = _read_name(template, start + 1)
+
+    # Braces that are not a known placeholder are kept as written
+    if name not in PLACEHOLDERS or position >= len(template):
+        return None
+
+    if template[position] == "}":
+        return Placeholder(name, (), template[start:position + 1]), position + 1
+
+    if not template[position].isspace():
+        return None
+
+    args, end = _parse_segments(template, position + 1, nested=True)
+    if end >= len(template):
+        return None  # Unterminated placeholder
+
+    # Surrounding whitespace of the arguments is not significant
+    if args and isinstance(args[0], str):
+        args = (args[0].lstrip(),) + args[1:]
+    if args and isinstance(args[-1], str):
+        args = args[:-1] + (args[-1].rstrip(),)
+
+    return Placeholder(name, tuple(arg for arg in args if arg != ""), template[start:end + 1]), end + 1
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def parse(template):
+    """
+    Parse a command message into literal and placeholder segments.
+
+    Results are cached, so a message is only parsed the first time it is used
+    (or when it is added or edited through !cmd).
+
+    Parameters:
+    - template (str): The command message.
+
+    Returns:
+    - tuple: The segments, each either a literal str or a Placeholder.
+    """
+    segments, _ = _parse_segments(template, 0, nested=False)
+    return segments
+
+
+async def _resolve_async(segment, context):
+    args = await render_segments(segment.args, context) if segment.args else ""
+    resolver = PLACEHOLDERS[segment.name]
+
+    if segment.name not in SHARED_PLACEHOLDERS:
+        return await _call_async(resolver, context, args)
+
+    key = (segment.name, args)
+    task = context._shared.get(key)
+    if task is None:
+        task = context._shared[key] = asyncio.ensure_future(_call_async(resolver, context, args))
+    return await task
+
+
+async def _call_async(resolver, context, args):
+    # Only the resolver itself holds a slot, so nested placeholders in its arguments can never deadlock
+    async with context._slots:
+        value = resolver(context, args)
+        if inspect.isawaitable(value):
+            value = await value
+    return str(value)
+
+
+async def render_segments(segments, context):
+    """
+    Render parsed segments in a single pass.
+
+    Placeholders that have to wait, such as {urlfetch}, are all started at
+    once and resolved concurrently (at most RENDER_MAX_CONCURRENCY at a time),
+    so a message costs the latency of its slowest placeholder rather than the
+    sum of them. Results are substituted in their original order.
+
+    Parameters:
+    - segments (tuple): The parsed segments.
+    - context (RenderContext): The render context.
+
+    Returns:
+    - str: The rendered text.
+    """
+    parts = []
+    pending = []
+
+    for segment in segments:
+        if isinstance(segment, str):
+            parts.append(segment)
+        elif segment.is_async:
+            pending.append(len(parts))
+            parts.append(segment)
+        else:
+            args = await render_segments(segment.args, context) if segment.args else ""
+            parts.append(str(PLACEHOLDERS[segment.name](context, args)))
+
+    if len(pending) == 1:
+        parts[pending[0]] = await _resolve_async(parts[pending[0]], context)
+    elif pending:
+        values = await asyncio.gather(*(_resolve_async(parts[index], context) for index in pending))
+        for index, value in zip(pending, values):
+            parts[index] = value
+
+    return "".join(parts)
+
+
+async def render(template, context):
+    """
+    Render a command message.
+
+    Parameters:
+    - template (str): The command message.
+    - context (RenderContext): The render context.
+
+    Returns:
+    - str: The message with every placeholder resolved.
+    """
+    return await render_segments(parse(template), context)
+
+
+@placeholder("count")
+def resolve_count(context, args):
+    return context.command_data["usage_count"]
+
+
+@placeholder("user")
+def resolve_user(context, args):
+    return f"@{context.message.author.name}"
+
+
+@placeholder("touser")
+def resolve_touser(context, args):
+    # Remove invisible characters from the message
+    message_content = context.message.content.replace(" 󠀀", "")
+    return message_content.split(' ', 1)[1].strip() if ' ' in message_content else f"@{context.message.author.name}"
+
+
+@placeholder("channel")
+def resolve_channel(context, args):
+    return context.message.channel.name
+
+
+@placeholder("random")
+def resolve_random(context, args):
+    """
+    {random} gives a number from 1 to 100, {random <min> <max>} a number in that
+    range and {random a, b, c} one of the listed choices.
+    """
+    bounds = args.split()
+    if len(bounds) == 2 and all(bound.lstrip("-").isdigit() for bound in bounds):
+        low, high = sorted(int(bound) for bound in bounds)
+        return random.randint(low, high)
+
+    choices = [choice.strip() for choice in args.split(",") if choice.strip()]
+    if choices:
+        return random.choice(choices)
+
+    return random.randint(1, 100)
+
+
+@placeholder("uptime")
+async def resolve_uptime(context, args):
+    stream = await context.get_stream()
+    if stream is None:
+        return f"{context.message.channel.name} is offline"
+
+    elapsed = datetime.datetime.now(datetime.timezone.utc) - stream.started_at
+    hours, remainder = divmod(int(elapsed.total_seconds()), 3600)
+    minutes = remainder // 60
+    return f"{hours}h {minutes}m" if hours else f"{minutes}m"
+
+
+@placeholder("game")
+async def resolve_game(context, args):
+    stream = await context.get_stream()
+    if stream is not None:
+        return stream.game_name
+
+    # A failed lookup falls back like a missing channel, so the rest of the message is still sent
+    try:
+        with metrics.timer("luminbot_external_api_seconds", service="helix", endpoint="channels"):
+            channel_info = await context.bot.fetch_channel(str(context.channel_id))
+    except Exception as error:
+        print(f"[customcommands] Failed to fetch the game of channel {context.channel_id}: {error}")
+        return "Unknown"
+
+    return channel_info.game_name if channel_info else "Unknown"
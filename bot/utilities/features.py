@@ -0,0 +1,106 @@
+from data import data
+
+# Every feature that can be toggled with !ft, in bit order.
+# New features must be appended so that existing bits keep their meaning.
+FEATURES = [
+    "customcommands",  # Entire custom commands feature
+    "watchstreaks",  # Entire watchstreaks feature
+    "firsts",  # Entire firsts feature
+    "rank",  # Global rank command
+
+    "osu.map",  # osu related
+    "osu.profile",  # osu related
+    "osu.recent",  # osu related
+
+    "valorant.radiant",  # valorant related
+    "valorant.record",  # valorant related
+    "valorant.winlossnoti",  # valorant related
+    "valorant.lastgame",  # valorant related
+]
+
+FEATURE_BITS = {feature: 1 << index for index, feature in enumerate(FEATURES)}
+
+# Features that run on every chat message through the global event handler
+MESSAGE_FEATURES_MASK = FEATURE_BITS["customcommands"] | FEATURE_BITS["watchstreaks"] | FEATURE_BITS["firsts"]
+
+# Compiled disabled-feature bitmask for each channel, keyed by channel ID
+_disabled_masks = {}
+
+
+def compile_mask(disabled_features):
+    """
+    Compile a list of disabled feature names into a bitmask.
+
+    Parameters:
+    - disabled_features (list): The feature names stored in a channel's 'disabled_features'.
+
+    Returns:
+    - int: The bitmask with one bit set for every disabled feature.
+    """
+    mask = 0
+    for feature in disabled_features:
+        mask |= FEATURE_BITS.get(feature, 0)
+    return mask
+
+
+def get_disabled_mask(channel_id, channel_data=None):
+    """
+    Get the compiled disabled-feature bitmask for a channel.
+
+    The channel document is only read the first time a channel is seen or
+    after its entry has been invalidated.
+
+    Parameters:
+    - channel_id (str): The Twitch channel ID.
+    - channel_data (dict): Already loaded channel data, used instead of reading the document.
+
+    Returns:
+    - int: The disabled-feature bitmask.
+    """
+    channel_id = str(channel_id)
+
+    mask = _disabled_masks.get(channel_id)
+    if mask is None:
+        if channel_data is None:
+            channel_data = data.get_data(channel_id)
+        mask = compile_mask(channel_data.get("disabled_features", []))
+        _disabled_masks[channel_id] = mask
+
+    return mask
+
+
+def is_disabled(channel_id, feature):
+    """
+    Check if a feature is disabled for a channel.
+
+    Parameters:
+    - channel_id (str): The Twitch channel ID.
+    - feature (str): The feature name, as listed in FEATURES.
+
+    Returns:
+    - bool: True if the feature is disabled.
+    """
+    return bool(get_disabled_mask(channel_id) & FEATURE_BITS[feature])
+
+
+def message_pipeline_disabled(channel_id):
+    """
+    Check if every feature handled by the global message pipeline is disabled for a channel.
+
+    Parameters:
+    - channel_id (str): The Twitch channel ID.
+
+    Returns:
+    - bool: True if chat messages in the channel need no processing.
+    """
+    return get_disabled_mask(channel_id) & MESSAGE_FEATURES_MASK == MESSAGE_FEATURES_MASK
+
+
+def invalidate(channel_id):
+    """
+    Drop the cached bitmask for a channel so it is rebuilt on next use.
+
+    Parameters:
+    - channel_id (str): The Twitch channel ID.
+    """
+    _disabled_masks.pop(str(channel_id), None)
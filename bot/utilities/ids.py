@@ -3,11 +3,34 @@ import json
 import os
 from dotenv import load_dotenv
 
+from bot.utilities import metrics
+from bot.utilities.lru_cache import LRUCache
+
 load_dotenv()
 
 TWITCH_CLIENTID = os.getenv("TWITCH_CLIENTID")
 TWITCH_TOKEN = os.getenv("TWITCH_TOKEN")
 
+# Number of user IDs and of display names kept in memory, evicted ones are looked up again when needed
+IDS_CACHE_SIZE = 50000
+
+# Cache of resolved user IDs, keyed by lowercase login name
+_id_cache = LRUCache(IDS_CACHE_SIZE)
+
+# Cache of resolved display names, keyed by user ID
+_name_cache = LRUCache(IDS_CACHE_SIZE)
+
+
+def remember_name(user_id, name):
+    """
+    Cache the display name of a user that is already known, such as from a chat message.
+
+    Parameters:
+    - user_id (str): The user ID.
+    - name (str): The user's display name.
+    """
+    _name_cache.set(str(user_id), name)
+
 
 def get_name_from_id(user_id):
     """
@@ -19,6 +42,10 @@ def get_name_from_id(user_id):
     Returns:
     - str: The broadcaster name.
     """
+    broadcaster_name = _name_cache.get(str(user_id))
+    if broadcaster_name is not None:
+        return broadcaster_name
+
     headers = {
         'Client-Id': str(TWITCH_CLIENTID),
         'Authorization': str(f'Bearer {TWITCH_TOKEN}')
@@ -26,10 +53,12 @@ def get_name_from_id(user_id):
 
     url = f'https://api.twitch.tv/helix/channels?broadcaster_id={user_id}'
 
-    response = requests.get(url, headers=headers)
+    with metrics.timer("luminbot_external_api_seconds", service="helix", endpoint="channels"):
+        response = requests.get(url, headers=headers)
 
     json_response = json.loads(response.text)
     broadcaster_name = json_response['data'][0]['broadcaster_name']
+    _name_cache.set(str(user_id), broadcaster_name)
 
     return broadcaster_name
 
@@ -47,6 +76,10 @@ def get_id_from_name(name):
     if not name:
         return -1
 
+    broadcaster_id = _id_cache.get(name.lower())
+    if broadcaster_id is not None:
+        return broadcaster_id
+
     headers = {
         'Client-Id': str(TWITCH_CLIENTID),
         'Authorization': str(f'Bearer {TWITCH_TOKEN}')
@@ -54,12 +87,14 @@ def get_id_from_name(name):
 
     url = f'https://api.twitch.tv/helix/users?login={name}'
 
-    response = requests.get(url, headers=headers)
+    with metrics.timer("luminbot_external_api_seconds", service="helix", endpoint="users"):
+        response = requests.get(url, headers=headers)
 
     json_response = json.loads(response.text)
 
     if 'data' in json_response and json_response['data']:
         broadcaster_id = json_response['data'][0]['id']
+        _id_cache.set(name.lower(), broadcaster_id)
         return broadcaster_id
     else:
         return -1
\ No newline at end of file
@@ -0,0 +1,239 @@
+import functools
+import json
+import re
+
+# Maximum number of compiled paths kept in memory
+JSON_PATH_CACHE_SIZE = 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+_segment = re.compile(r"([^.\[\]]*)((?:\[[^\]]*\])*)")
+
+
+class KeyStep:
+    """
+    A path step selecting an object member, or a list item when the key is an integer.
+    """
+
+    __slots__ = ("key", "index")
+
+    def __init__(self, key):
+        self.key = key
+        self.index = int(key) if re.fullmatch(r"-?\d+", key) else None
+
+
+class SliceStep:
+    """
+    A path step selecting a range of list items, such as [1:3] or [::2].
+    """
+
+    __slots__ = ("slice",)
+
+    def __init__(self, start=None, stop=None, step=None):
+        self.slice = slice(start, stop, step)
+
+
+class WildcardStep:
+    """
+    A path step selecting every member of an object or item of a list.
+    """
+
+    __slots__ = ()
+
+
+def _parse_bracket(content):
+    content = content.strip()
+    if content == "*":
+        return WildcardStep()
+    if ":" in content:
+        bounds = content.split(":")
+        if len(bounds) > 3 or not all(re.fullmatch(r"\s*(-?\d+)?\s*", bound) for bound in bounds) \
+                or (len(bounds) == 3 and bounds[2].strip() in ("0", "-0")):
+            raise ValueError(f"Invalid slice [{content}] in JSON path")
+        return SliceStep(*(int(bound) if bound.strip() else None for bound in bounds))
+    return KeyStep(content.strip("'\""))
+
+
+@functools.lru_cache(maxsize=JSON_PATH_CACHE_SIZE)
+def compile_path(path):
+    """
+    Compile a JSON path into its steps.
+
+    Paths are dot-separated keys, such as data.items.0.name. A number selects
+    a list item (negative numbers count from the end), * selects every member
+    or item, and brackets select items or slices, as in items[0], items[-1],
+    items[1:3] and items[*]. Compiled paths are cached.
+
+    Parameters:
+    - path (str): The JSON path.
+
+    Returns:
+    - tuple: The compiled steps.
+
+    Raises:
+    - ValueError: If the path is invalid.
+    """
+    steps = []
+
+    for part in path.split("."):
+        match = _segment.fullmatch(part)
+        if match is None:
+            raise ValueError(f"Invalid JSON path '{path}'")
+
+        name, brackets = match.groups()
+        if name == "*":
+            steps.append(WildcardStep())
+        elif name:
+            steps.append(KeyStep(name))
+
+        for bracket in re.findall(r"\[([^\]]*)\]", brackets):
+            steps.append(_parse_bracket(bracket))
+
+    if not steps:
+        raise ValueError(f"Invalid JSON path '{path}'")
+
+    return tuple(steps)
+
+
+def is_multiple(steps):
+    """
+    Check whether compiled steps can select more than one value.
+
+    Parameters:
+    - steps (tuple): The compiled steps.
+
+    Returns:
+    - bool: True if the path contains a wildcard or a slice.
+    """
+    return any(not isinstance(step, KeyStep) for step in steps)
+
+
+def _skip_whitespace(text, position):
+    return _whitespace.match(text, position).end()
+
+
+def _skip_value(text, position):
+    # Values off the path are decoded one at a time by the C scanner and dropped right away,
+    # which is several times faster than matching their brackets in Python
+    return _decoder.raw_decode(text, position)[1]
+
+
+def _members(text, position):
+    # Yields (key, value position) for each object member, the caller advances past the values
+    position = _skip_whitespace(text, position + 1)
+    if text[position] == "}":
+        return
+
+    while True:
+        key, position = _decoder.raw_decode(text, position)
+        position = _skip_whitespace(text, position)
+        if text[position] != ":":
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, position)
+
+        position = yield key, _skip_whitespace(text, position + 1)
+
+        position = _skip_whitespace(text, position)
+        if text[position] == "}":
+            return
+        if text[position] != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, position)
+        position = _skip_whitespace(text, position + 1)
+
+
+def _item_positions(text, position):
+    # Positions of every list item, found without decoding the items
+    positions = []
+    position = _skip_whitespace(text, position + 1)
+    if text[position] == "]":
+        return positions
+
+    while True:
+        positions.append(position)
+        position = _skip_whitespace(text, _skip_value(text, position))
+        if text[position] == "]":
+            return positions
+        if text[position] != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, position)
+        position = _skip_whitespace(text, position + 1)
+
+
+def _walk(text, position, steps, results):
+    if not steps:
+        value, _ = _decoder.raw_decode(text, position)
+        results.append(value)
+        return
+
+    step, remaining = steps[0], steps[1:]
+    char = text[position]
+
+    if char == "{":
+        if isinstance(step, SliceStep):
+            return
+
+        members = _members(text, position)
+        try:
+            key, value_position = next(members)
+            while True:
+                if isinstance(step, WildcardStep) or key == step.key:
+                    _walk(text, value_position, remaining, results)
+                    if isinstance(step, KeyStep):
+                        return  # Found, the rest of the object is never read
+                key, value_position = members.send(_skip_value(text, value_position))
+        except StopIteration:
+            return
+
+    elif char == "[":
+        if isinstance(step, KeyStep) and step.index is None:
+            return
+
+        if isinstance(step, KeyStep) and step.index >= 0:
+            # Non-negative indexes stop at the selected item without looking at the rest of the list
+            position = _skip_whitespace(text, position + 1)
+            for _ in range(step.index):
+                if text[position] == "]":
+                    return
+                position = _skip_whitespace(text, _skip_value(text, position))
+                if text[position] != ",":
+                    return
+                position = _skip_whitespace(text, position + 1)
+            if text[position] != "]":
+                _walk(text, position, remaining, results)
+            return
+
+        positions = _item_positions(text, position)
+        if isinstance(step, KeyStep):
+            selected = positions[step.index:step.index + 1 or None]
+        elif isinstance(step, SliceStep):
+            selected = positions[step.slice]
+        else:
+            selected = positions
+
+        for item_position in selected:
+            _walk(text, item_position, remaining, results)
+
+
+def extract(text, steps):
+    """
+    Extract the values selected by a compiled path from a JSON document.
+
+    The document is walked along the path one member or item at a time
+    instead of being decoded as a whole: values off the path are only
+    scanned past and dropped, and the walk stops as soon as a path without
+    wildcards or slices is found, leaving the rest of the document unread.
+
+    Parameters:
+    - text (str): The JSON document.
+    - steps (tuple): The compiled steps.
+
+    Returns:
+    - list: The selected values, in document order.
+
+    Raises:
+    - json.JSONDecodeError: If the document is not valid JSON along the path.
+    """
+    results = []
+    try:
+        _walk(text, _skip_whitespace(text, 0), steps, results)
+    except IndexError as error:
+        raise json.JSONDecodeError("Unexpected end of document", text, len(text)) from error
+    return results
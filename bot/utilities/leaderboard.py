@@ -0,0 +1,171 @@
+import bisect
+import re
+
+from bot.utilities import ids, metrics
+from data import data
+
+
+class Leaderboard:
+    """
+    Members ranked by score, kept sorted as scores change.
+
+    Entries are stored as (-score, member) in a sorted list, so the top N
+    is a slice of the first N entries and a member's rank is a binary search.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty leaderboard.
+        """
+        self._entries = []
+        self._scores = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, member):
+        return member in self._scores
+
+    def get(self, member):
+        """
+        Get a member's score.
+
+        Parameters:
+            member (str): The member, such as a user ID.
+
+        Returns:
+            int or None: The score, or None if the member is not ranked.
+        """
+        return self._scores.get(member)
+
+    def set(self, member, score):
+        """
+        Set a member's score, moving it to its new position.
+
+        Parameters:
+            member (str): The member, such as a user ID.
+            score (int): The new score, or None to remove the member.
+        """
+        previous = self._scores.get(member)
+        if previous == score:
+            return
+
+        if previous is not None:
+            del self._entries[bisect.bisect_left(self._entries, (-previous, member))]
+            del self._scores[member]
+
+        if score is not None:
+            bisect.insort(self._entries, (-score, member))
+            self._scores[member] = score
+
+    def remove(self, member):
+        """
+        Remove a member from the leaderboard.
+
+        Parameters:
+            member (str): The member.
+        """
+        self.set(member, None)
+
+    def top(self, count):
+        """
+        Get the highest ranked members.
+
+        Parameters:
+            count (int): The number of members.
+
+        Returns:
+            list: (member, score) tuples, highest score first.
+        """
+        return [(member, -negative_score) for negative_score, member in self._entries[:count]]
+
+    def rank(self, member):
+        """
+        Get a member's rank, where members with equal scores share a rank.
+
+        Parameters:
+            member (str): The member.
+
+        Returns:
+            int or None: The 1-based rank, or None if the member is not ranked.
+        """
+        score = self._scores.get(member)
+        if score is None:
+            return None
+
+        # Every entry before the member's score group has a strictly higher score
+        return bisect.bisect_left(self._entries, (-score,)) + 1
+
+
+# Leaderboards keyed by the document path of their score, such as streamer_<id>_watchstreaks.watchstreak
+_leaderboards = {}
+
+
+def get(name):
+    """
+    Get a leaderboard, creating it empty if it does not exist.
+
+    Parameters:
+        name (str): The leaderboard name, the document path of its score.
+
+    Returns:
+        Leaderboard: The leaderboard.
+    """
+    board = _leaderboards.get(name)
+    if board is None:
+        board = _leaderboards[name] = Leaderboard()
+    return board
+
+
+def format_top(title, board, count=10):
+    """
+    Format the top entries of a leaderboard of users as a chat message.
+
+    Parameters:
+        title (str): The text before the entries.
+        board (Leaderboard): The leaderboard, with user IDs as members.
+        count (int): The number of entries.
+
+    Returns:
+        str: The message.
+    """
+    message = title
+
+    for index, (user_id, score) in enumerate(board.top(count)):
+        message = message + f"{index + 1}. {ids.get_name_from_id(user_id)} ({score}), "
+
+    return message + "PogChamp"
+
+
+def load(key_pattern, fields):
+    """
+    Fill leaderboards from the database with a single pass over every document.
+
+    For every top-level key of a document matching key_pattern, each of the
+    fields present is added to the leaderboard named "<key>.<field>". Display
+    names stored in the documents are cached in ids along the way.
+
+    Parameters:
+        key_pattern (str): Regular expression matching the document keys holding the scores.
+        fields (list): The score fields within those keys.
+
+    Returns:
+        int: The number of scores loaded.
+    """
+    pattern = re.compile(key_pattern)
+    loaded = 0
+
+    with metrics.timer("luminbot_storage_seconds", operation="load_leaderboards"):
+        for document_id, document in data.iter_documents():
+            if "name" in document:
+                ids.remember_name(document_id, document["name"])
+
+            for key, value in document.items():
+                if not isinstance(value, dict) or not pattern.fullmatch(key):
+                    continue
+                for field in fields:
+                    if value.get(field) is not None:
+                        get(f"{key}.{field}").set(document_id, value[field])
+                        loaded += 1
+
+    return loaded
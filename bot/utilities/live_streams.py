@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from bot.utilities import metrics
+
+# Seconds a channel's live stream is reused before asking Helix again
+LIVE_STREAM_TTL = 30
+
+# Seconds an offline channel is reused, shorter so that a stream going live is noticed quickly
+OFFLINE_STREAM_TTL = 10
+
+# Live stream (or None when offline) and the time it was fetched, keyed by lowercase channel login
+_streams = {}
+
+# Helix requests in progress, keyed by lowercase channel login
+_inflight = {}
+
+
+def update(user_logins, streams):
+    """
+    Store the result of a Helix streams request covering several channels.
+
+    Channels in user_logins without a stream in streams are stored as offline.
+
+    Parameters:
+        user_logins (list): The channel logins the streams were fetched for.
+        streams (list): The live streams returned by Helix.
+    """
+    now = time.monotonic()
+    live = {stream.user.name.lower(): stream for stream in streams}
+
+    for login in user_logins:
+        login = login.lower()
+        _streams[login] = (live.get(login), now)
+
+
+async def get_stream(bot, channel_name):
+    """
+    Get a channel's live stream, reusing recent results.
+
+    Concurrent calls for the same channel share a single Helix request.
+
+    Parameters:
+        bot: The Twitch bot instance.
+        channel_name (str): The channel login.
+
+    Returns:
+        twitchio.Stream or None: The live stream, or None when the channel is offline.
+    """
+    login = channel_name.lower()
+
+    cached = _streams.get(login)
+    if cached is not None:
+        stream, fetched_at = cached
+        if time.monotonic() - fetched_at < (LIVE_STREAM_TTL if stream is not None else OFFLINE_STREAM_TTL):
+            return stream
+
+    task = _inflight.get(login)
+    if task is None:
+        task = _inflight[login] = asyncio.ensure_future(_fetch(bot, login))
+        task.add_done_callback(lambda _: _inflight.pop(login, None))
+
+    # Shield the shared request so one cancelled caller does not cancel it for the others
+    return await asyncio.shield(task)
+
+
+async def _fetch(bot, login):
+    with metrics.timer("luminbot_external_api_seconds", service="helix", endpoint="streams"):
+        streams = await bot.fetch_streams(user_logins=[login], type="live")
+
+    stream = streams[0] if streams else None
+    _streams[login] = (stream, time.monotonic())
+    return stream
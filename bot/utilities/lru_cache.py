@@ -0,0 +1,95 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A least-recently-used cache bounded by total weight.
+
+    By default every entry weighs 1, so max_weight is the maximum number of
+    entries. A weigher function can be given to bound the cache by another
+    measure, such as the size in bytes of the cached values.
+    """
+
+    def __init__(self, max_weight, weigher=None):
+        """
+        Initializes the cache.
+
+        Parameters:
+            max_weight (int): The maximum total weight of the cached entries.
+            weigher (callable): Optional function returning the weight of a value.
+        """
+        self.max_weight = max_weight
+        self.weigher = weigher or (lambda value: 1)
+        self.weight = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Get a cached value and mark it as recently used.
+
+        Parameters:
+            key: The cache key.
+            default: The value returned when the key is not cached.
+
+        Returns:
+            The cached value, or default.
+        """
+        value = self._entries.get(key, default)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """
+        Cache a value, evicting the least recently used entries if needed.
+
+        Values heavier than the whole cache are not stored.
+
+        Parameters:
+            key: The cache key.
+            value: The value to cache.
+        """
+        self.pop(key)
+
+        weight = self.weigher(value)
+        if weight > self.max_weight:
+            return
+
+        self._entries[key] = value
+        self.weight += weight
+
+        while self.weight > self.max_weight:
+            _, evicted = self._entries.popitem(last=False)
+            self.weight -= self.weigher(evicted)
+
+    def pop(self, key, default=None):
+        """
+        Remove a value from the cache.
+
+        Parameters:
+            key: The cache key.
+            default: The value returned when the key is not cached.
+
+        Returns:
+            The removed value, or default.
+        """
+        if key not in self._entries:
+            return default
+        value = self._entries.pop(key)
+        self.weight -= self.weigher(value)
+        return value
+
+    def items(self):
+        """
+        Get the cached entries, from least to most recently used.
+
+        Returns:
+            list: The (key, value) pairs.
+        """
+        return list(self._entries.items())
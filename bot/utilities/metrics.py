@@ -0,0 +1,266 @@
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# Local address the Prometheus endpoint listens on, a port of 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9184"))
+
+# Quantiles exported for every histogram
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+# Registered histograms and counters, keyed by (metric name, sorted label items)
+_histograms = {}
+_counters = {}
+
+# The aiohttp runner of the metrics server, once started
+_runner = None
+
+
+class Histogram:
+    """
+    A latency histogram using HDR-style log-linear buckets.
+
+    Values are recorded in microseconds. Every power of two is split into
+    SUB_BUCKETS linear buckets, so any recorded value is reproduced within
+    roughly 1 / SUB_BUCKETS of its true value, from 1 microsecond up to MAX_VALUE.
+    """
+
+    SUB_BUCKETS = 32
+    SUB_BUCKET_BITS = 5  # log2(SUB_BUCKETS)
+    MAX_VALUE = 1 << 37  # Roughly 38 hours in microseconds
+
+    def __init__(self):
+        """
+        Initializes an empty histogram.
+        """
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+
+    def bucket_index(self, value):
+        """
+        Get the bucket index for a value in microseconds.
+
+        Parameters:
+            value (int): The value in microseconds.
+
+        Returns:
+            int: The bucket index.
+        """
+        if value < self.SUB_BUCKETS:
+            return value
+
+        shift = value.bit_length() - self.SUB_BUCKET_BITS - 1
+        return self.SUB_BUCKETS * (shift + 1) + (value >> shift) - self.SUB_BUCKETS
+
+    def bucket_value(self, index):
+        """
+        Get the representative (middle) value of a bucket in microseconds.
+
+        Parameters:
+            index (int): The bucket index.
+
+        Returns:
+            float: The value represented by the bucket.
+        """
+        if index < self.SUB_BUCKETS:
+            return float(index)
+
+        shift = index // self.SUB_BUCKETS - 1
+        lowest = (self.SUB_BUCKETS + index % self.SUB_BUCKETS) << shift
+        return lowest + ((1 << shift) - 1) / 2
+
+    def record(self, seconds):
+        """
+        Record a duration.
+
+        Parameters:
+            seconds (float): The duration in seconds.
+        """
+        value = min(max(int(seconds * 1_000_000), 0), self.MAX_VALUE)
+        index = self.bucket_index(value)
+
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """
+        Get the value at a quantile.
+
+        Parameters:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The value at the quantile in seconds, or 0 if nothing was recorded.
+        """
+        if self.count == 0:
+            return 0.0
+
+        target = max(1, round(q * self.count))
+        seen = 0
+
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return self.bucket_value(index) / 1_000_000
+
+        return self.bucket_value(max(self.counts)) / 1_000_000
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """
+    Record a duration in a histogram.
+
+    Parameters:
+    - name (str): The metric name.
+    - seconds (float): The duration in seconds.
+    - labels: The metric labels.
+    """
+    key = _key(name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = Histogram()
+    histogram.record(seconds)
+
+
+def increment(name, amount=1, **labels):
+    """
+    Increment a counter.
+
+    Parameters:
+    - name (str): The metric name.
+    - amount (int): The amount to add.
+    - labels: The metric labels.
+    """
+    key = _key(name, labels)
+    _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Context manager recording the duration of its body in a histogram.
+
+    Errors raised inside the body are counted in '<name>_errors_total', with a
+    '_seconds' unit suffix left out of the name, such as 'luminbot_storage_errors_total'.
+
+    Parameters:
+    - name (str): The metric name.
+    - labels: The metric labels.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        increment(f"{name.removesuffix('_seconds')}_errors_total", **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - start_time, **labels)
+
+
+def timed(name, **labels):
+    """
+    Decorator recording the duration of every call of a function in a histogram.
+
+    Works with both regular and async functions.
+
+    Parameters:
+    - name (str): The metric name.
+    - labels: The metric labels.
+    """
+
+    def decorator(function):
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with timer(name, **labels):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + [(key, str(value)) for key, value in extra.items()]
+    if not items:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+def render():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Histograms are exported as summaries with the quantiles in QUANTILES.
+
+    Returns:
+    - str: The metrics text.
+    """
+    lines = []
+
+    for name in sorted({name for name, _ in _histograms}):
+        lines.append(f"# TYPE {name} summary")
+        for (metric_name, labels), histogram in sorted(_histograms.items()):
+            if metric_name != name:
+                continue
+            for q in QUANTILES:
+                lines.append(f"{name}{_format_labels(labels, quantile=q)} {histogram.quantile(q):.6f}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+    for name in sorted({name for name, _ in _counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (metric_name, labels), value in sorted(_counters.items()):
+            if metric_name == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics_request(request):
+    """
+    aiohttp handler serving the /metrics endpoint.
+    """
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Start the local HTTP server exposing /metrics, if it is not already running.
+
+    Parameters:
+    - host (str): The address to listen on.
+    - port (int): The port to listen on, 0 disables the server.
+    """
+    global _runner
+
+    if _runner is not None or not port:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics_request)
+
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+
+    print(f"[metrics] Serving Prometheus metrics on http://{host}:{port}/metrics")
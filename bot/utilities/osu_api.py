@@ -0,0 +1,371 @@
+import asyncio
+import os
+import random
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+from bot.utilities import metrics
+
+load_dotenv()
+
+OSU_V1_APIKEY = os.getenv("OSU_V1_APIKEY")
+PP_ADDICT_APIKEY = os.getenv("PP_ADDICT_APIKEY")
+
+OSU_API_URL = "https://osu.ppy.sh/api"
+OSU_FILE_URL = "https://osu.ppy.sh/osu"
+TILLERINO_URL = "https://api.tillerino.org/beatmapinfo"
+PP_CALCULATOR_URL = "https://pp-api.huismetbenen.nl/calculate-score"
+
+# Timeouts in seconds for connecting, for each read, and for the whole request
+OSU_API_CONNECT_TIMEOUT = 3
+OSU_API_READ_TIMEOUT = 5
+OSU_API_TOTAL_TIMEOUT = 10
+
+# Connection pool limits of the shared session
+OSU_API_MAX_CONNECTIONS = 20
+OSU_API_MAX_CONNECTIONS_PER_HOST = 4
+
+# Attempts after the first for requests that failed on the network, timed out or got a 429 or 5xx response,
+# waiting OSU_API_BACKOFF * 2 ** attempt seconds (with jitter) before each one
+OSU_API_RETRIES = 2
+OSU_API_BACKOFF = 0.5
+
+
+class OsuApiError(Exception):
+    """
+    Raised when an osu! API request fails after every retry.
+    """
+
+
+@dataclass
+class User:
+    """
+    An osu! player, from get_user.
+    """
+
+    user_id: int
+    username: str
+    pp_rank: Optional[int]
+    pp_country_rank: Optional[int]
+    pp_raw: float
+    accuracy: float
+    country: str
+
+
+@dataclass
+class RecentPlay:
+    """
+    A recently submitted play, from get_user_recent.
+    """
+
+    beatmap_id: int
+    enabled_mods: int
+    max_combo: int
+    count300: int
+    count100: int
+    count50: int
+    count_miss: int
+    rank: str
+
+
+@dataclass
+class Beatmap:
+    """
+    A beatmap difficulty, from get_beatmaps.
+    """
+
+    beatmap_id: int
+    title: str
+    version: str
+    max_combo: Optional[int]
+    difficulty_rating: float
+    approved: int
+
+
+@dataclass
+class PpValues:
+    """
+    The PP of a beatmap at several accuracies, from Tillerino or the local calculator.
+    """
+
+    beatmap_id: int
+    mods: int
+
+    # PP keyed by accuracy between 0 and 1
+    pp_for_accuracy: dict
+
+    # Whether the PP comes from the local calculator rather than osu!'s live values
+    approximate: bool = False
+
+
+@dataclass
+class ScoreCalculation:
+    """
+    The PP of a single play, from the huismetbenen calculator or the local calculator.
+    """
+
+    accuracy: float
+    max_combo: int
+    miss: int
+    pp: float
+    star_rating: float
+
+    # Whether the PP and star rating come from the local calculator rather than osu!'s live values
+    approximate: bool = False
+
+
+def _optional_int(value):
+    return int(value) if value is not None else None
+
+
+@contextmanager
+def _unexpected_response(service, endpoint):
+    # Error payloads and changed schemas miss fields or hold values of the wrong type
+    try:
+        yield
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError) as error:
+        raise OsuApiError(f"{service} {endpoint} returned an unexpected response: {error!r}") from error
+
+
+class OsuClient:
+    """
+    Client for the osu! API v1 and the PP services used by the osu cog.
+
+    Every request goes through one keep-alive session with timeouts, and is
+    retried with exponential backoff when the failure is likely temporary.
+    """
+
+    def __init__(self, api_key, tillerino_key):
+        """
+        Initializes the client. The session is opened on first use.
+
+        Parameters:
+            api_key (str): The osu! API v1 key.
+            tillerino_key (str): The Tillerino API key.
+        """
+        self.api_key = api_key
+        self.tillerino_key = tillerino_key
+        self._session = None
+
+    def get_session(self):
+        """
+        Get the client's session, creating it on first use.
+
+        Returns:
+            aiohttp.ClientSession: The shared session.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=OSU_API_MAX_CONNECTIONS,
+                                               limit_per_host=OSU_API_MAX_CONNECTIONS_PER_HOST),
+                timeout=aiohttp.ClientTimeout(total=OSU_API_TOTAL_TIMEOUT,
+                                              connect=OSU_API_CONNECT_TIMEOUT,
+                                              sock_read=OSU_API_READ_TIMEOUT),
+            )
+
+        return self._session
+
+    async def close(self):
+        """
+        Close the client's session, if it was opened.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _request(self, method, url, service, endpoint, text=False, **kwargs):
+        """
+        Send a request and parse its JSON response, retrying temporary failures.
+
+        Parameters:
+            method (str): The HTTP method.
+            url (str): The URL.
+            service (str): The service name, for metrics.
+            endpoint (str): The endpoint name, for metrics.
+            text (bool): Return the response body as text instead of parsing it.
+            **kwargs: Passed on to aiohttp, such as params or json.
+
+        Returns:
+            The parsed JSON response, or the response text.
+
+        Raises:
+            OsuApiError: If the request failed after every retry or got a non-retryable error response.
+        """
+        # Unset parameters, such as a missing API key, are left out like requests did
+        if "params" in kwargs:
+            kwargs["params"] = {key: value for key, value in kwargs["params"].items() if value is not None}
+
+        for attempt in range(OSU_API_RETRIES + 1):
+            if attempt:
+                metrics.increment("luminbot_external_api_retries_total", service=service, endpoint=endpoint)
+                await asyncio.sleep(OSU_API_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+            try:
+                with metrics.timer("luminbot_external_api_seconds", service=service, endpoint=endpoint):
+                    async with self.get_session().request(method, url, **kwargs) as response:
+                        if response.status == 429 or response.status >= 500:
+                            error = OsuApiError(f"{service} {endpoint} responded with {response.status}")
+                            continue
+
+                        if response.status >= 400:
+                            raise OsuApiError(f"{service} {endpoint} responded with {response.status}")
+
+                        if text:
+                            return await response.text()
+
+                        try:
+                            return await response.json(content_type=None)
+                        except ValueError as decode_error:
+                            # Such as an HTML error page served with a 200 status, which retrying will not fix
+                            raise OsuApiError(f"{service} {endpoint} returned invalid JSON: {decode_error}") from decode_error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as request_error:
+                error = OsuApiError(f"{service} {endpoint} failed: {request_error!r}")
+
+        raise error
+
+    async def get_user(self, user):
+        """
+        Get an osu! player by username or user ID.
+
+        Parameters:
+            user (str): The username or user ID.
+
+        Returns:
+            User or None: The player, or None if there is no such player.
+        """
+        users = await self._request("GET", f"{OSU_API_URL}/get_user", "osu", "get_user",
+                                    params={"k": self.api_key, "u": user})
+        if not users:
+            return None
+
+        with _unexpected_response("osu", "get_user"):
+            user_data = users[0]
+            return User(user_id=int(user_data["user_id"]),
+                        username=user_data["username"],
+                        pp_rank=_optional_int(user_data.get("pp_rank")),
+                        pp_country_rank=_optional_int(user_data.get("pp_country_rank")),
+                        pp_raw=float(user_data.get("pp_raw") or 0),
+                        accuracy=float(user_data.get("accuracy") or 0),
+                        country=user_data.get("country", ""))
+
+    async def get_recent(self, user_id):
+        """
+        Get a player's most recent play.
+
+        Parameters:
+            user_id (str): The osu! user ID.
+
+        Returns:
+            RecentPlay or None: The play, or None if the player has not played recently.
+        """
+        plays = await self._request("GET", f"{OSU_API_URL}/get_user_recent", "osu", "get_user_recent",
+                                    params={"k": self.api_key, "u": user_id, "limit": 1})
+        if not plays:
+            return None
+
+        with _unexpected_response("osu", "get_user_recent"):
+            play = plays[0]
+            return RecentPlay(beatmap_id=int(play["beatmap_id"]),
+                              enabled_mods=int(play["enabled_mods"]),
+                              max_combo=int(play["maxcombo"]),
+                              count300=int(play["count300"]),
+                              count100=int(play["count100"]),
+                              count50=int(play["count50"]),
+                              count_miss=int(play["countmiss"]),
+                              rank=play["rank"])
+
+    async def get_beatmap(self, beatmap_id, mods=0):
+        """
+        Get a beatmap difficulty.
+
+        Parameters:
+            beatmap_id (int): The beatmap ID.
+            mods (int): Difficulty changing mods to apply to the star rating, as a bitmask.
+
+        Returns:
+            Beatmap or None: The beatmap, or None if there is no such beatmap.
+        """
+        beatmaps = await self._request("GET", f"{OSU_API_URL}/get_beatmaps", "osu", "get_beatmaps",
+                                       params={"k": self.api_key, "b": beatmap_id, "mods": mods or None})
+        if not beatmaps:
+            return None
+
+        with _unexpected_response("osu", "get_beatmaps"):
+            beatmap = beatmaps[0]
+            return Beatmap(beatmap_id=int(beatmap["beatmap_id"]),
+                           title=beatmap["title"],
+                           version=beatmap["version"],
+                           max_combo=_optional_int(beatmap.get("max_combo")),
+                           difficulty_rating=float(beatmap["difficultyrating"]),
+                           approved=int(beatmap["approved"]))
+
+    async def get_beatmap_file(self, beatmap_id):
+        """
+        Download a beatmap's .osu file.
+
+        Parameters:
+            beatmap_id (int): The beatmap ID.
+
+        Returns:
+            str: The contents of the file, empty if there is no such beatmap.
+        """
+        return await self._request("GET", f"{OSU_FILE_URL}/{beatmap_id}", "osu", "osu_file", text=True)
+
+    async def get_pp_values(self, beatmap_id, mods):
+        """
+        Get the PP of a beatmap at several accuracies from Tillerino.
+
+        Parameters:
+            beatmap_id (int): The beatmap ID.
+            mods (int): The mods as a bitmask.
+
+        Returns:
+            PpValues: The PP values.
+        """
+        response = await self._request("GET", TILLERINO_URL, "tillerino", "beatmapinfo",
+                                       params={"k": self.tillerino_key, "beatmapid": beatmap_id, "mods": mods})
+
+        with _unexpected_response("tillerino", "beatmapinfo"):
+            return PpValues(beatmap_id=int(beatmap_id), mods=int(mods),
+                            pp_for_accuracy={float(accuracy): pp for accuracy, pp in response["ppForAcc"].items()})
+
+    async def calculate_score(self, beatmap_id, mods, good, ok, meh, miss, combo):
+        """
+        Calculate the PP of a single play.
+
+        Parameters:
+            beatmap_id (int): The beatmap ID.
+            mods (list): The mod acronyms, as returned by convert_osu_mods_to_readable.
+            good (int): The number of 300s.
+            ok (int): The number of 100s.
+            meh (int): The number of 50s.
+            miss (int): The number of misses.
+            combo (int): The maximum combo.
+
+        Returns:
+            ScoreCalculation: The calculated play.
+        """
+        response = await self._request("PATCH", PP_CALCULATOR_URL, "huismetbenen", "calculate-score", json={
+            "map_id": beatmap_id,
+            "mods": mods,
+            "good": good,
+            "ok": ok,
+            "meh": meh,
+            "miss": miss,
+            "combo": combo,
+            "rework": "live",
+        })
+
+        with _unexpected_response("huismetbenen", "calculate-score"):
+            return ScoreCalculation(accuracy=float(response["accuracy"]),
+                                    max_combo=int(response["max_combo"]),
+                                    miss=int(response["miss"]),
+                                    pp=float(response["local_pp"]),
+                                    star_rating=float(response["newSR"]))
+
+
+# The client shared by every osu command
+client = OsuClient(OSU_V1_APIKEY, PP_ADDICT_APIKEY)
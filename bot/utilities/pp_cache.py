@@ -0,0 +1,117 @@
+import dataclasses
+import time
+
+from bot.utilities import metrics, osu_api
+from bot.utilities.lru_cache import LRUCache
+from data import data
+
+# Number of results of each kind kept in memory, on top of the ones stored in the database
+PP_CACHE_SIZE = 5000
+
+# Seconds a PP result is reused. Results only change when a beatmap is updated or PP is reworked.
+PP_RESULT_TTL = 24 * 60 * 60
+
+# Mods that change the PP of a play. Nightcore always comes with the Double Time bit set.
+PP_MODS = 1 | 2 | 8 | 16 | 64 | 256 | 1024 | 4096  # NF, EZ, HD, HR, DT, HT, FL, SO
+
+# (result, fetched_at) keyed by the string key of the result, one cache per kind of result
+_caches = {
+    "score": LRUCache(PP_CACHE_SIZE),
+    "pp_values": LRUCache(PP_CACHE_SIZE),
+}
+
+
+async def _get(cache, key, from_data, fetch):
+    """
+    Get a result from memory, then the database, then by fetching it.
+
+    When fetching fails, an expired result is still returned if one is cached.
+
+    Parameters:
+        cache (str): The kind of result, a key of _caches.
+        key (str): The key of the result.
+        from_data (callable): Rebuilds a result from its stored data.
+        fetch (callable): Returns a coroutine fetching the result.
+
+    Returns:
+        The result.
+    """
+    cached = _caches[cache].get(key)
+
+    if cached is None:
+        stored = data.get_pp_result(cache, key)
+        if stored is not None:
+            cached = (from_data(stored[0]), stored[1])
+            _caches[cache].set(key, cached)
+
+    if cached is not None and time.time() - cached[1] < PP_RESULT_TTL:
+        metrics.increment("luminbot_pp_cache_total", cache=cache, result="hit")
+        return cached[0]
+
+    metrics.increment("luminbot_pp_cache_total", cache=cache, result="miss")
+
+    try:
+        result = await fetch()
+    except osu_api.OsuApiError:
+        if cached is not None:
+            return cached[0]
+        raise
+
+    fetched_at = time.time()
+
+    _caches[cache].set(key, (result, fetched_at))
+    data.update_pp_result(cache, key, dataclasses.asdict(result), fetched_at)
+
+    return result
+
+
+async def calculate_score(beatmap_id, mods, good, ok, meh, miss, combo):
+    """
+    Calculate the PP of a single play, reusing the result for identical plays.
+
+    Parameters:
+        beatmap_id (int): The beatmap ID.
+        mods (list): The mod acronyms, as returned by convert_osu_mods_to_readable.
+        good (int): The number of 300s.
+        ok (int): The number of 100s.
+        meh (int): The number of 50s.
+        miss (int): The number of misses.
+        combo (int): The maximum combo.
+
+    Returns:
+        ScoreCalculation: The calculated play.
+
+    Raises:
+        OsuApiError: If the play had to be calculated, the calculator failed and no earlier result is stored.
+    """
+    key = f"{beatmap_id}:{','.join(sorted(mods))}:{good}:{ok}:{meh}:{miss}:{combo}"
+
+    return await _get("score", key, lambda score_data: osu_api.ScoreCalculation(**score_data),
+                      lambda: osu_api.client.calculate_score(beatmap_id=beatmap_id, mods=mods, good=good, ok=ok,
+                                                             meh=meh, miss=miss, combo=combo))
+
+
+async def get_pp_values(beatmap_id, mods):
+    """
+    Get the PP of a beatmap at several accuracies, reusing the result for the same beatmap and mods.
+
+    Parameters:
+        beatmap_id (int): The beatmap ID.
+        mods (int): The mods as a bitmask, only the ones that change PP are used.
+
+    Returns:
+        PpValues: The PP values.
+
+    Raises:
+        OsuApiError: If the values had to be fetched, Tillerino failed and no earlier values are stored.
+    """
+    beatmap_id, mods = int(beatmap_id), int(mods) & PP_MODS
+
+    def from_data(pp_values_data):
+        # JSON object keys are strings, the accuracies are floats again once loaded
+        pp_values_data["pp_for_accuracy"] = {float(accuracy): pp
+                                             for accuracy, pp in pp_values_data["pp_for_accuracy"].items()}
+        return osu_api.PpValues(**pp_values_data)
+
+    return await _get("pp_values", f"{beatmap_id}:{mods}", from_data,
+                      lambda: osu_api.client.get_pp_values(beatmap_id, mods))
@@ -0,0 +1,819 @@
+import asyncio
+import math
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from bot.utilities import beatmap_cache, osu_api
+from bot.utilities.lru_cache import LRUCache
+
+# Directory the downloaded .osu files are stored in
+OSU_FILE_DIR = "osu_files"
+
+# Number of parsed beatmaps and of computed difficulties kept in memory
+PP_CALCULATOR_CACHE_SIZE = 200
+
+# Approval statuses whose .osu file can no longer change (ranked, approved, loved)
+FROZEN_STATUSES = {1, 2, 4}
+
+# Mod bits used by the calculator
+MOD_NF, MOD_EZ, MOD_TD, MOD_HD, MOD_HR = 1, 2, 4, 8, 16
+MOD_DT, MOD_HT, MOD_FL, MOD_SO = 64, 256, 1024, 4096
+
+# Hit object kinds in ParsedBeatmap.kinds
+CIRCLE, SLIDER, SPINNER = 0, 1, 2
+
+PLAYFIELD_CENTER = (256.0, 192.0)
+
+# Difficulty model constants, as used by osu!standard star rating and PP from 2019 until 2021
+STRAIN_SECTION_LENGTH = 400
+STRAIN_DECAY_WEIGHT = 0.9
+STAR_SCALING_FACTOR = 0.0675
+MIN_DELTA_TIME = 50
+
+AIM_SKILL_MULTIPLIER = 26.25
+AIM_STRAIN_DECAY_BASE = 0.15
+AIM_ANGLE_BONUS_BEGIN = math.pi / 3
+AIM_TIMING_THRESHOLD = 107
+
+SPEED_SKILL_MULTIPLIER = 1400
+SPEED_STRAIN_DECAY_BASE = 0.3
+SPEED_ANGLE_BONUS_BEGIN = 5 * math.pi / 6
+SINGLE_SPACING_THRESHOLD = 125
+MIN_SPEED_BONUS = 75
+MAX_SPEED_BONUS = 45
+SPEED_BALANCING_FACTOR = 40
+ANGLE_BONUS_SCALE = 90
+
+# Sliders end this many milliseconds early for scoring, as in osu!stable
+LEGACY_LAST_TICK_OFFSET = 36
+
+# Bounds on the points sampled along slider paths. A Bezier segment gets at most
+# BEZIER_SEGMENT_STEPS steps whatever its number of control points, and a slider
+# at most SLIDER_MAX_SAMPLES samples in total, however many segments it has.
+BEZIER_SEGMENT_STEPS = 50
+SLIDER_MAX_SAMPLES = 1000
+
+# Bezier segments with more control points than this are approximated by their control polygon,
+# as their Bernstein weights would underflow
+BEZIER_MAX_POINTS = 1000
+
+
+class ParsedBeatmap:
+    """
+    The parts of a .osu file needed for difficulty calculation, with hit objects stored as compact arrays.
+    """
+
+    __slots__ = ("hp", "cs", "od", "ar", "kinds", "times", "xs", "ys", "nested", "max_combo", "circles")
+
+    def __init__(self, hp, cs, od, ar):
+        """
+        Initializes a beatmap without hit objects.
+
+        Parameters:
+            hp (float): The HP drain rate.
+            cs (float): The circle size.
+            od (float): The overall difficulty.
+            ar (float): The approach rate.
+        """
+        self.hp = hp
+        self.cs = cs
+        self.od = od
+        self.ar = ar
+
+        # One entry per hit object, in time order
+        self.kinds = array("b")
+        self.times = array("d")
+        self.xs = array("d")
+        self.ys = array("d")
+
+        # Slider ticks, repeats and tail as (time, x, y) triples, keyed by hit object index
+        self.nested = {}
+
+        self.max_combo = 0
+        self.circles = 0
+
+
+class Difficulty:
+    """
+    The difficulty of a beatmap with a set of mods.
+    """
+
+    __slots__ = ("aim", "speed", "stars", "ar", "od", "objects", "circles", "max_combo")
+
+    def __init__(self, aim, speed, ar, od, objects, circles, max_combo):
+        """
+        Initializes the difficulty.
+
+        Parameters:
+            aim (float): The aim star rating.
+            speed (float): The speed star rating.
+            ar (float): The approach rate with mods.
+            od (float): The overall difficulty with mods.
+            objects (int): The number of hit objects.
+            circles (int): The number of hit circles.
+            max_combo (int): The maximum combo.
+        """
+        self.aim = aim
+        self.speed = speed
+        self.stars = aim + speed + abs(aim - speed) / 2
+        self.ar = ar
+        self.od = od
+        self.objects = objects
+        self.circles = circles
+        self.max_combo = max_combo
+
+
+# ParsedBeatmap keyed by beatmap ID, and Difficulty keyed by (beatmap ID, difficulty mods)
+_beatmaps = LRUCache(PP_CALCULATOR_CACHE_SIZE)
+_difficulties = LRUCache(PP_CALCULATOR_CACHE_SIZE)
+
+
+def _bezier(points, max_steps):
+    # Samples spaced a few osu!pixels apart along the control polygon are precise enough for slider positions
+    polygon_length = sum(math.dist(points[i], points[i + 1]) for i in range(len(points) - 1))
+    steps = max(2, min(int(polygon_length / 4), max_steps))
+
+    degree = len(points) - 1
+    if degree > BEZIER_MAX_POINTS:
+        return list(points)
+
+    samples = []
+    for step in range(steps + 1):
+        t = step / steps
+
+        # Evaluated from the nearer end, so the first Bernstein weight (1 - t) ** degree does not underflow
+        ordered, u = (points, t) if t <= 0.5 else (points[::-1], 1 - t)
+        weight = (1 - u) ** degree
+        ratio = u / (1 - u)
+        x = y = 0.0
+        for k, (point_x, point_y) in enumerate(ordered):
+            x += weight * point_x
+            y += weight * point_y
+            weight *= ratio * (degree - k) / (k + 1)
+        samples.append((x, y))
+
+    return samples
+
+
+def _perfect_circle(a, b, c):
+    ax, ay = a
+    bx, by = b
+    cx, cy = c
+
+    d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(d) < 1e-3:
+        return None
+
+    a_sq, b_sq, c_sq = ax * ax + ay * ay, bx * bx + by * by, cx * cx + cy * cy
+    center_x = (a_sq * (by - cy) + b_sq * (cy - ay) + c_sq * (ay - by)) / d
+    center_y = (a_sq * (cx - bx) + b_sq * (ax - cx) + c_sq * (bx - ax)) / d
+    radius = math.dist(a, (center_x, center_y))
+
+    start = math.atan2(ay - center_y, ax - center_x)
+    end = math.atan2(cy - center_y, cx - center_x)
+    while end < start:
+        end += 2 * math.pi
+
+    # Go the other way around if the middle point is not on the arc from start to end
+    direction = 1
+    arc = end - start
+    if (bx - ax) * (cy - ay) - (by - ay) * (cx - ax) < 0:
+        direction = -1
+        arc = 2 * math.pi - arc
+
+    steps = max(2, min(int(radius * arc / 4), 500))
+    return [(center_x + radius * math.cos(start + direction * arc * step / steps),
+             center_y + radius * math.sin(start + direction * arc * step / steps)) for step in range(steps + 1)]
+
+
+def _slider_path(curve_type, points, length):
+    """
+    Sample a slider's path into a polyline of the slider's length.
+
+    Catmull curves, which only old beatmaps use, are approximated by their control polygon.
+
+    Parameters:
+        curve_type (str): The curve type letter, L, P, B or C.
+        points (list): The control points, starting with the slider's position.
+        length (float): The slider's length in osu!pixels.
+
+    Returns:
+        tuple: The sampled points and the distance along the path of each.
+    """
+    samples = None
+
+    if curve_type == "P" and len(points) == 3:
+        samples = _perfect_circle(*points)
+
+    if samples is None and curve_type in ("B", "P"):
+        # Repeated control points split a Bezier curve into separate segments
+        segments = [[points[0]]]
+        for point in points[1:]:
+            if point == segments[-1][-1]:
+                segments.append([point])
+            else:
+                segments[-1].append(point)
+
+        # The samples are shared out between the segments, so a slider never exceeds SLIDER_MAX_SAMPLES
+        max_steps = max(2, min(BEZIER_SEGMENT_STEPS, SLIDER_MAX_SAMPLES // len(segments)))
+        samples = [points[0]]
+        distances = [0.0]
+        for segment in segments:
+            for sample in (_bezier(segment, max_steps) if len(segment) > 1 else segment):
+                distances.append(distances[-1] + math.dist(samples[-1], sample))
+                samples.append(sample)
+
+            # Segments past the slider's length are cut off anyway
+            if distances[-1] >= length:
+                break
+    else:
+        if samples is None:
+            samples = list(points)
+
+        distances = [0.0]
+        for previous, point in zip(samples, samples[1:]):
+            distances.append(distances[-1] + math.dist(previous, point))
+
+    # Cut the path at the slider's length, or extend its last segment to reach it
+    if distances[-1] > length:
+        end = bisect_left(distances, length)
+        samples, distances = samples[:end + 1], distances[:end + 1]
+
+    if len(samples) > 1 and distances[-1] != length:
+        (x1, y1), (x2, y2) = samples[-2], samples[-1]
+        segment_length = distances[-1] - distances[-2]
+        if segment_length > 0:
+            scale = (length - distances[-2]) / segment_length
+            samples[-1] = (x1 + (x2 - x1) * scale, y1 + (y2 - y1) * scale)
+            distances[-1] = length
+
+    return samples, distances
+
+
+def _position_at(samples, distances, distance):
+    if len(samples) == 1 or distance <= 0:
+        return samples[0]
+    if distance >= distances[-1]:
+        return samples[-1]
+
+    index = bisect_right(distances, distance)
+    (x1, y1), (x2, y2) = samples[index - 1], samples[index]
+    segment_length = distances[index] - distances[index - 1]
+    t = (distance - distances[index - 1]) / segment_length if segment_length else 0
+    return x1 + (x2 - x1) * t, y1 + (y2 - y1) * t
+
+
+def parse_beatmap(text):
+    """
+    Parse an osu!standard .osu file.
+
+    Parameters:
+        text (str): The contents of the .osu file.
+
+    Returns:
+        ParsedBeatmap: The parsed beatmap.
+
+    Raises:
+        ValueError: If the file is not a valid osu!standard beatmap.
+    """
+    # Malformed lines can fail anywhere in the parser, every failure is reported as an invalid beatmap
+    try:
+        return _parse_beatmap(text)
+    except (IndexError, KeyError, ZeroDivisionError, OverflowError) as error:
+        raise ValueError(f"Invalid beatmap: {error!r}") from error
+
+
+def _parse_beatmap(text):
+    section = None
+    values = {}
+    timing_points = []
+    hit_object_lines = []
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("//"):
+            continue
+
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1]
+        elif section in ("General", "Difficulty"):
+            key, _, value = line.partition(":")
+            values[key.strip()] = value.strip()
+        elif section == "TimingPoints":
+            fields = line.split(",")
+            if len(fields) < 2:
+                raise ValueError(f"Invalid timing point: {line}")
+
+            point_beat_length = float(fields[1])
+            uninherited = fields[6] == "1" if len(fields) > 6 else point_beat_length > 0
+            if uninherited and not point_beat_length > 0:
+                raise ValueError(f"Invalid beat length: {line}")
+
+            timing_points.append((float(fields[0]), point_beat_length, uninherited))
+        elif section == "HitObjects":
+            hit_object_lines.append(line)
+
+    if values.get("Mode", "0") != "0":
+        raise ValueError("Only osu!standard beatmaps are supported")
+    if not hit_object_lines:
+        raise ValueError("The beatmap has no hit objects")
+
+    od = float(values.get("OverallDifficulty", 5))
+    beatmap = ParsedBeatmap(hp=float(values.get("HPDrainRate", 5)), cs=float(values.get("CircleSize", 5)),
+                            od=od, ar=float(values.get("ApproachRate", od)))
+    slider_multiplier = float(values.get("SliderMultiplier", 1.4))
+    tick_rate = float(values.get("SliderTickRate", 1))
+
+    # The beat length of the last uninherited timing point and the velocity of the last inherited one,
+    # as of each timing point
+    timing_points.sort(key=lambda point: point[0])
+    timing_times = []
+    timing_states = []
+    beat_length = next((point[1] for point in timing_points if point[2]), 1000.0)
+    velocity_multiplier = 1.0
+    for point_time, point_beat_length, uninherited in timing_points:
+        if uninherited:
+            beat_length, velocity_multiplier = point_beat_length, 1.0
+        elif point_beat_length < 0:
+            velocity_multiplier = min(max(-100 / point_beat_length, 0.1), 10)
+        timing_times.append(point_time)
+        timing_states.append((beat_length, velocity_multiplier))
+
+    for line in hit_object_lines:
+        fields = line.split(",")
+        if len(fields) < 4:
+            raise ValueError(f"Invalid hit object: {line}")
+
+        x, y, start_time, object_type = float(fields[0]), float(fields[1]), float(fields[2]), int(fields[3])
+
+        if object_type & 2:
+            kind = SLIDER
+        elif object_type & 8:
+            kind = SPINNER
+            x, y = PLAYFIELD_CENTER
+        else:
+            kind = CIRCLE
+
+        index = len(beatmap.kinds)
+        beatmap.kinds.append(kind)
+        beatmap.times.append(start_time)
+        beatmap.xs.append(x)
+        beatmap.ys.append(y)
+        beatmap.max_combo += 1
+
+        if kind == CIRCLE:
+            beatmap.circles += 1
+        if kind != SLIDER:
+            continue
+
+        if len(fields) < 7:
+            raise ValueError(f"Invalid slider: {line}")
+
+        curve = fields[5].split("|")
+        points = [(x, y)] + [(float(point.split(":")[0]), float(point.split(":")[1])) for point in curve[1:]]
+        spans = max(1, int(fields[6]))
+        length = float(fields[7]) if len(fields) > 7 else 0.0
+        if not math.isfinite(length):
+            raise ValueError(f"Invalid slider length: {line}")
+
+        timing_index = bisect_right(timing_times, start_time) - 1
+        beat_length, velocity_multiplier = timing_states[max(timing_index, 0)] if timing_states else (1000.0, 1.0)
+
+        scoring_distance = 100 * slider_multiplier * velocity_multiplier
+        velocity = scoring_distance / beat_length
+        samples, distances = _slider_path(curve[0], points, length) if length > 0 else ([(x, y)], [0.0])
+        length = distances[-1]
+        span_duration = length / velocity if velocity > 0 else 0
+        end_time = start_time + span_duration * spans
+
+        # Tick distances along one span, skipping ticks too close to the end of the span
+        tick_distance = scoring_distance / tick_rate if tick_rate > 0 else 0
+        ticks = []
+        if tick_distance > 0 and length / tick_distance < 1000:
+            distance = tick_distance
+            while distance < length - velocity * 10:
+                ticks.append(distance)
+                distance += tick_distance
+
+        nested = []
+        for span in range(spans):
+            span_start = start_time + span * span_duration
+            reversed_span = span % 2 == 1
+            for distance in (reversed(ticks) if reversed_span else ticks):
+                tick_time = span_start + span_duration * distance / length
+                nested.append((tick_time,) + _position_at(samples, distances,
+                                                          length - distance if reversed_span else distance))
+            if span < spans - 1:
+                nested.append((span_start + span_duration,) + _position_at(samples, distances,
+                                                                           0 if reversed_span else length))
+
+        tail_time = max(start_time + (end_time - start_time) / 2, end_time - LEGACY_LAST_TICK_OFFSET)
+        nested.append((tail_time,) + _position_at(samples, distances, 0 if spans % 2 == 0 else length))
+
+        beatmap.nested[index] = nested
+        beatmap.max_combo += len(nested)
+
+    return beatmap
+
+
+def _apply_mods(beatmap, mods):
+    """
+    Get the clock rate and the circle size, approach rate and overall difficulty with mods.
+    """
+    rate = 1.5 if mods & MOD_DT else 0.75 if mods & MOD_HT else 1.0
+    scale = 1.4 if mods & MOD_HR else 0.5 if mods & MOD_EZ else 1.0
+
+    cs = min(beatmap.cs * (1.3 if mods & MOD_HR else 0.5 if mods & MOD_EZ else 1.0), 10)
+    ar = min(beatmap.ar * scale, 10)
+    od = min(beatmap.od * scale, 10)
+
+    # Approach rate and overall difficulty are timings, so they change with the clock rate
+    preempt = (1800 - 120 * ar if ar <= 5 else 1950 - 150 * ar) / rate
+    ar = (1800 - preempt) / 120 if preempt > 1200 else (1950 - preempt) / 150
+    od = (80 - (80 - 6 * od) / rate) / 6
+
+    return rate, cs, ar, od
+
+
+def calculate_difficulty(beatmap, mods):
+    """
+    Calculate the aim, speed and total star rating of a beatmap.
+
+    Parameters:
+        beatmap (ParsedBeatmap): The beatmap.
+        mods (int): The mods as a bitmask.
+
+    Returns:
+        Difficulty: The difficulty.
+    """
+    rate, cs, ar, od = _apply_mods(beatmap, mods)
+
+    # Distances are normalized to a circle radius of 52, with a bonus for very small circles
+    radius = 32 * (1 - 0.7 * (cs - 5) / 5)
+    scaling_factor = 52 / radius
+    if radius < 30:
+        scaling_factor *= 1 + min(30 - radius, 5) / 50
+    follow_radius = radius * 3
+
+    kinds, times, xs, ys = beatmap.kinds, beatmap.times, beatmap.xs, beatmap.ys
+
+    # The cursor position at the end of each hit object and the distance travelled on it, following sliders lazily
+    end_xs, end_ys = array("d", xs), array("d", ys)
+    travel = array("d", bytes(8 * len(kinds)))
+    for index, nested in beatmap.nested.items():
+        lazy_x, lazy_y = xs[index], ys[index]
+        travelled = 0.0
+        for _, x, y in nested:
+            distance = math.hypot(x - lazy_x, y - lazy_y)
+            if distance > follow_radius:
+                moved = (distance - follow_radius) / distance
+                lazy_x += (x - lazy_x) * moved
+                lazy_y += (y - lazy_y) * moved
+                travelled += distance - follow_radius
+        end_xs[index], end_ys[index], travel[index] = lazy_x, lazy_y, travelled * scaling_factor
+
+    section_length = STRAIN_SECTION_LENGTH * rate
+    section_end = math.ceil(times[0] / section_length) * section_length if len(times) else 0
+    aim_strain = speed_strain = aim_peak = speed_peak = 0.0
+    aim_peaks, speed_peaks = [], []
+    previous_jump = previous_strain_time = 0.0
+
+    for index in range(1, len(kinds)):
+        start_time = times[index]
+
+        while start_time > section_end:
+            aim_peaks.append(aim_peak)
+            speed_peaks.append(speed_peak)
+            elapsed = section_end - times[index - 1]
+            aim_peak = aim_strain * AIM_STRAIN_DECAY_BASE ** (elapsed / 1000)
+            speed_peak = speed_strain * SPEED_STRAIN_DECAY_BASE ** (elapsed / 1000)
+            section_end += section_length
+
+        delta_time = (start_time - times[index - 1]) / rate
+        strain_time = max(delta_time, MIN_DELTA_TIME)
+
+        jump = travel_distance = 0.0
+        angle = None
+        if kinds[index] != SPINNER and kinds[index - 1] != SPINNER:
+            jump = math.hypot(xs[index] - end_xs[index - 1], ys[index] - end_ys[index - 1]) * scaling_factor
+            travel_distance = travel[index - 1]
+
+            if index > 1:
+                v1x, v1y = end_xs[index - 2] - xs[index - 1], end_ys[index - 2] - ys[index - 1]
+                v2x, v2y = xs[index] - end_xs[index - 1], ys[index] - end_ys[index - 1]
+                angle = abs(math.atan2(v1x * v2y - v1y * v2x, v1x * v2x + v1y * v2y))
+
+        aim_value = speed_value = 0.0
+        if kinds[index] != SPINNER:
+            # Aim rewards long jumps and sliders, with a bonus for wide angles between jumps
+            aim_bonus = 0.0
+            if angle is not None and angle > AIM_ANGLE_BONUS_BEGIN:
+                angle_bonus = math.sqrt(max(previous_jump - ANGLE_BONUS_SCALE, 0) *
+                                        math.sin(angle - AIM_ANGLE_BONUS_BEGIN) ** 2 *
+                                        max(jump - ANGLE_BONUS_SCALE, 0))
+                aim_bonus = 1.5 * angle_bonus ** 0.99 / max(AIM_TIMING_THRESHOLD, previous_strain_time)
+
+            jump_exp, travel_exp = jump ** 0.99, travel_distance ** 0.99
+            distance_exp = jump_exp + travel_exp + math.sqrt(jump_exp * travel_exp)
+            aim_value = max(aim_bonus + distance_exp / max(strain_time, AIM_TIMING_THRESHOLD),
+                            distance_exp / strain_time)
+
+            # Speed rewards short gaps between objects, with a bonus for sharp angles
+            distance = min(SINGLE_SPACING_THRESHOLD, jump + travel_distance)
+            speed_delta = max(MAX_SPEED_BONUS, delta_time)
+            speed_bonus = 1.0
+            if speed_delta < MIN_SPEED_BONUS:
+                speed_bonus += ((MIN_SPEED_BONUS - speed_delta) / SPEED_BALANCING_FACTOR) ** 2
+
+            angle_bonus = 1.0
+            if angle is not None and angle < SPEED_ANGLE_BONUS_BEGIN:
+                angle_bonus = 1 + math.sin(1.5 * (SPEED_ANGLE_BONUS_BEGIN - angle)) ** 2 / 3.57
+                if angle < math.pi / 2:
+                    angle_bonus = 1.28
+                    if distance < ANGLE_BONUS_SCALE and angle < math.pi / 4:
+                        angle_bonus += (1 - angle_bonus) * min((ANGLE_BONUS_SCALE - distance) / 10, 1)
+                    elif distance < ANGLE_BONUS_SCALE:
+                        angle_bonus += ((1 - angle_bonus) * min((ANGLE_BONUS_SCALE - distance) / 10, 1) *
+                                        math.sin((math.pi / 2 - angle) / (math.pi / 4)))
+
+            speed_value = ((1 + (speed_bonus - 1) * 0.75) * angle_bonus *
+                           (0.95 + speed_bonus * (distance / SINGLE_SPACING_THRESHOLD) ** 3.5) / strain_time)
+
+        aim_strain = aim_strain * AIM_STRAIN_DECAY_BASE ** (delta_time / 1000) + aim_value * AIM_SKILL_MULTIPLIER
+        speed_strain = (speed_strain * SPEED_STRAIN_DECAY_BASE ** (delta_time / 1000) +
+                        speed_value * SPEED_SKILL_MULTIPLIER)
+        aim_peak = max(aim_peak, aim_strain)
+        speed_peak = max(speed_peak, speed_strain)
+
+        previous_jump, previous_strain_time = jump, strain_time
+
+    aim_peaks.append(aim_peak)
+    speed_peaks.append(speed_peak)
+
+    def difficulty_value(peaks):
+        # The hardest sections count the most, every following one 10% less
+        total, weight = 0.0, 1.0
+        for peak in sorted(peaks, reverse=True):
+            total += peak * weight
+            weight *= STRAIN_DECAY_WEIGHT
+        return math.sqrt(total) * STAR_SCALING_FACTOR
+
+    return Difficulty(difficulty_value(aim_peaks), difficulty_value(speed_peaks), ar, od,
+                      len(kinds), beatmap.circles, beatmap.max_combo)
+
+
+def calculate_pp(difficulty, mods, n300, n100, n50, misses, combo):
+    """
+    Calculate the PP of a play.
+
+    Parameters:
+        difficulty (Difficulty): The difficulty of the beatmap with the play's mods.
+        mods (int): The mods as a bitmask.
+        n300 (int): The number of 300s.
+        n100 (int): The number of 100s.
+        n50 (int): The number of 50s.
+        misses (int): The number of misses.
+        combo (int): The maximum combo.
+
+    Returns:
+        float: The PP.
+    """
+    total_hits = n300 + n100 + n50 + misses
+    if total_hits == 0:
+        return 0.0
+
+    accuracy = (300 * n300 + 100 * n100 + 50 * n50) / (300 * total_hits)
+    ar, od = difficulty.ar, difficulty.od
+
+    length_bonus = 0.95 + 0.4 * min(1, total_hits / 2000)
+    if total_hits > 2000:
+        length_bonus += math.log10(total_hits / 2000) * 0.5
+
+    miss_penalty = 0.97 ** misses
+    combo_scaling = min(combo ** 0.8 / difficulty.max_combo ** 0.8, 1) if difficulty.max_combo > 0 else 1
+
+    # Aim
+    aim_rating = difficulty.aim ** 0.8 if mods & MOD_TD else difficulty.aim
+    aim = (5 * max(1, aim_rating / STAR_SCALING_FACTOR) - 4) ** 3 / 100000
+    aim *= length_bonus * miss_penalty * combo_scaling
+
+    approach_rate_factor = 1.0
+    if ar > 10.33:
+        approach_rate_factor += 0.3 * (ar - 10.33)
+    elif ar < 8:
+        approach_rate_factor += 0.01 * (8 - ar)
+    aim *= approach_rate_factor
+
+    if mods & MOD_HD:
+        aim *= 1 + 0.04 * (12 - ar)
+    if mods & MOD_FL:
+        flashlight_bonus = 1 + 0.35 * min(1, total_hits / 200)
+        if total_hits > 200:
+            flashlight_bonus += 0.3 * min(1, (total_hits - 200) / 300)
+            if total_hits > 500:
+                flashlight_bonus += (total_hits - 500) / 1200
+        aim *= flashlight_bonus
+
+    aim *= (0.5 + accuracy / 2) * (0.98 + od ** 2 / 2500)
+
+    # Speed
+    speed = (5 * max(1, difficulty.speed / STAR_SCALING_FACTOR) - 4) ** 3 / 100000
+    speed *= length_bonus * miss_penalty * combo_scaling
+    if ar > 10.33:
+        speed *= 1 + 0.3 * (ar - 10.33)
+    if mods & MOD_HD:
+        speed *= 1 + 0.04 * (12 - ar)
+    speed *= (0.02 + accuracy) * (0.96 + od ** 2 / 1600)
+
+    # Accuracy, judged on hit circles only as sliders and spinners are easy to hit perfectly
+    circles = difficulty.circles
+    better_accuracy = 0.0
+    if circles > 0:
+        better_accuracy = max(0.0, ((n300 - (total_hits - circles)) * 6 + n100 * 2 + n50) / (circles * 6))
+    accuracy_value = 1.52163 ** od * better_accuracy ** 24 * 2.83
+    accuracy_value *= min(1.15, (circles / 1000) ** 0.3)
+    if mods & MOD_HD:
+        accuracy_value *= 1.08
+    if mods & MOD_FL:
+        accuracy_value *= 1.02
+
+    multiplier = 1.12
+    if mods & MOD_NF:
+        multiplier *= 0.9
+    if mods & MOD_SO:
+        multiplier *= 0.95
+
+    return (aim ** 1.1 + speed ** 1.1 + accuracy_value ** 1.1) ** (1 / 1.1) * multiplier
+
+
+def hits_for_accuracy(objects, accuracy, misses=0):
+    """
+    Get hit counts reaching an accuracy, using 100s and only falling back to 50s if needed.
+
+    Parameters:
+        objects (int): The number of hit objects.
+        accuracy (float): The accuracy between 0 and 1.
+        misses (int): The number of misses.
+
+    Returns:
+        tuple: The number of 300s, 100s and 50s.
+    """
+    misses = min(objects, misses)
+    max300 = objects - misses
+
+    n100 = round(-3 * ((accuracy - 1) * objects + misses) * 0.5)
+    n50 = 0
+    if n100 > max300:
+        n100 = 0
+        n50 = min(max300, round(-6 * ((accuracy - 1) * objects + misses) * 0.5))
+
+    n100 = max(0, n100)
+    return objects - n100 - n50 - misses, n100, n50
+
+
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return None
+
+
+def _read_file(path):
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def _write_file(path, text):
+    os.makedirs(OSU_FILE_DIR, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(path + ".tmp", path)
+
+
+async def get_parsed_beatmap(beatmap):
+    """
+    Get a parsed beatmap, downloading its .osu file if it is not stored yet.
+
+    The file of an unranked beatmap is downloaded again once it is as old as its metadata may be.
+
+    Parameters:
+        beatmap (Beatmap): The beatmap's metadata.
+
+    Returns:
+        ParsedBeatmap: The parsed beatmap.
+
+    Raises:
+        OsuApiError: If the file had to be downloaded and the download failed.
+        ValueError: If the file is not a valid osu!standard beatmap.
+    """
+    path = os.path.join(OSU_FILE_DIR, f"{beatmap.beatmap_id}.osu")
+    stored = await asyncio.to_thread(_file_mtime, path)
+    stale = (beatmap.approved not in FROZEN_STATUSES and stored is not None and
+             time.time() - stored > beatmap_cache.BEATMAP_DEFAULT_TTL)
+
+    parsed = _beatmaps.get(beatmap.beatmap_id)
+    if parsed is not None and not stale:
+        return parsed
+
+    if stale or stored is None:
+        text = await osu_api.client.get_beatmap_file(beatmap.beatmap_id)
+        if not text:
+            raise ValueError(f"Beatmap {beatmap.beatmap_id} has no .osu file")
+
+        # Parsed before it is stored, so an invalid file is downloaded again next time instead of kept
+        parsed = await asyncio.to_thread(parse_beatmap, text)
+        await asyncio.to_thread(_write_file, path, text)
+
+        # Difficulties of the previous version of the file are outdated
+        for key, _ in _difficulties.items():
+            if key[0] == beatmap.beatmap_id:
+                _difficulties.pop(key)
+    else:
+        text = await asyncio.to_thread(_read_file, path)
+        try:
+            parsed = await asyncio.to_thread(parse_beatmap, text)
+        except ValueError:
+            await asyncio.to_thread(os.remove, path)
+            raise
+
+    _beatmaps.set(beatmap.beatmap_id, parsed)
+    return parsed
+
+
+async def get_difficulty(beatmap, mods):
+    """
+    Get the difficulty of a beatmap with a set of mods, reusing earlier calculations.
+
+    Parameters:
+        beatmap (Beatmap): The beatmap's metadata.
+        mods (int): The mods as a bitmask.
+
+    Returns:
+        Difficulty: The difficulty.
+    """
+    parsed = await get_parsed_beatmap(beatmap)
+
+    key = (beatmap.beatmap_id, mods & beatmap_cache.DIFFICULTY_MODS)
+    difficulty = _difficulties.get(key)
+    if difficulty is None:
+        # Like parsing, this takes long enough on large beatmaps to stall chat, so it runs in a worker thread
+        difficulty = await asyncio.to_thread(calculate_difficulty, parsed, mods)
+        _difficulties.set(key, difficulty)
+
+    return difficulty
+
+
+async def calculate_score(beatmap, mods, good, ok, meh, miss, combo):
+    """
+    Calculate the PP of a single play locally.
+
+    Objects the play did not reach, such as after a fail, are counted as 300s.
+
+    Parameters:
+        beatmap (Beatmap): The beatmap's metadata.
+        mods (int): The mods as a bitmask.
+        good (int): The number of 300s.
+        ok (int): The number of 100s.
+        meh (int): The number of 50s.
+        miss (int): The number of misses.
+        combo (int): The maximum combo.
+
+    Returns:
+        ScoreCalculation: The calculated play, like the remote calculator's.
+    """
+    difficulty = await get_difficulty(beatmap, mods)
+    good += max(0, difficulty.objects - good - ok - meh - miss)
+
+    total_hits = good + ok + meh + miss
+    accuracy = (300 * good + 100 * ok + 50 * meh) / (300 * total_hits) * 100 if total_hits else 0.0
+
+    return osu_api.ScoreCalculation(accuracy=round(accuracy, 2), max_combo=combo, miss=miss,
+                                    pp=calculate_pp(difficulty, mods, good, ok, meh, miss, combo),
+                                    star_rating=round(difficulty.stars, 2), approximate=True)
+
+
+async def get_pp_values(beatmap, mods, accuracies=(1.0, 0.99, 0.97, 0.95)):
+    """
+    Calculate the PP of full combos of a beatmap at several accuracies locally.
+
+    The difficulty is calculated once, after which every accuracy only costs the PP formula.
+
+    Parameters:
+        beatmap (Beatmap): The beatmap's metadata.
+        mods (int): The mods as a bitmask.
+        accuracies (tuple): The accuracies between 0 and 1.
+
+    Returns:
+        PpValues: The PP values, like Tillerino's.
+    """
+    difficulty = await get_difficulty(beatmap, mods)
+
+    pp_for_accuracy = {}
+    for accuracy in accuracies:
+        n300, n100, n50 = hits_for_accuracy(difficulty.objects, accuracy)
+        pp_for_accuracy[accuracy] = calculate_pp(difficulty, mods, n300, n100, n50, 0, difficulty.max_combo)
+
+    return osu_api.PpValues(beatmap_id=beatmap.beatmap_id, mods=mods, pp_for_accuracy=pp_for_accuracy,
+                            approximate=True)
@@ -0,0 +1,127 @@
+import time
+from collections import OrderedDict
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens, updated_at):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class RateLimiter:
+    """
+    A token bucket rate limiter with a bucket per key and an optional global bucket.
+
+    Buckets refill continuously at rate tokens per period seconds instead of
+    all at once. A bucket that has had time to refill completely holds no
+    information, so it is evicted, and memory only grows with the number of
+    recently limited keys.
+
+    Buckets are only updated synchronously and never across an await, so no
+    lock is needed when the limiter is used from the event loop.
+    """
+
+    def __init__(self, rate, period, burst=None, global_rate=None, global_period=None):
+        """
+        Initializes the rate limiter.
+
+        Parameters:
+            rate (float): Tokens added to each key's bucket per period.
+            period (float): The refill period in seconds.
+            burst (float): Capacity of each key's bucket, defaults to rate.
+            global_rate (float): Tokens added per global_period to the bucket shared by all keys, if any.
+            global_period (float): The global refill period in seconds, defaults to period.
+        """
+        self.capacity = burst if burst is not None else rate
+        self.refill_per_second = rate / period
+
+        # Seconds after which an untouched bucket is full again and can be forgotten
+        self.idle_timeout = self.capacity / self.refill_per_second
+
+        self.global_bucket = None
+        if global_rate is not None:
+            self.global_capacity = global_rate
+            self.global_refill_per_second = global_rate / (global_period or period)
+            self.global_bucket = _Bucket(global_rate, time.monotonic())
+
+        # Buckets keyed by key, ordered from least to most recently used
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _refill(self, bucket, capacity, refill_per_second, now):
+        bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * refill_per_second)
+        bucket.updated_at = now
+
+    def _evict_idle(self, now):
+        # Buckets are ordered by last use, so the sweep stops at the first one still refilling
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket.updated_at < self.idle_timeout:
+                break
+            self._buckets.popitem(last=False)
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.capacity, now)
+        else:
+            self._refill(bucket, self.capacity, self.refill_per_second, now)
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def try_acquire(self, key, tokens=1):
+        """
+        Take tokens for a key if both its bucket and the global bucket have enough.
+
+        Parameters:
+            key: The rate-limited key, such as a channel ID.
+            tokens (float): The number of tokens to take.
+
+        Returns:
+            bool: True if the tokens were taken, False if the key or the limiter is rate limited.
+        """
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        bucket = self._bucket(key, now)
+        if bucket.tokens < tokens:
+            return False
+
+        if self.global_bucket is not None:
+            self._refill(self.global_bucket, self.global_capacity, self.global_refill_per_second, now)
+            if self.global_bucket.tokens < tokens:
+                return False
+            self.global_bucket.tokens -= tokens
+
+        bucket.tokens -= tokens
+        return True
+
+    def retry_after(self, key, tokens=1):
+        """
+        Get the number of seconds until both a key's bucket and the global bucket have enough tokens again.
+
+        Parameters:
+            key: The rate-limited key.
+            tokens (float): The number of tokens needed.
+
+        Returns:
+            float: The seconds to wait, 0 if the tokens are available now.
+        """
+        now = time.monotonic()
+        wait = 0.0
+
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            available = min(self.capacity, bucket.tokens + (now - bucket.updated_at) * self.refill_per_second)
+            wait = max(wait, (tokens - available) / self.refill_per_second)
+
+        if self.global_bucket is not None:
+            available = min(self.global_capacity, self.global_bucket.tokens +
+                            (now - self.global_bucket.updated_at) * self.global_refill_per_second)
+            wait = max(wait, (tokens - available) / self.global_refill_per_second)
+
+        return wait
@@ -0,0 +1,94 @@
+import time
+
+
+class TimingWheel:
+    """
+    A set of keys that each expire after their own duration, backed by a hashed timing wheel.
+
+    Every key is filed in the wheel slot of the tick it expires in. Each
+    operation first advances the wheel to the current tick and drops the
+    expired keys of the slots it passes, so memory is bounded by the number
+    of keys that have not expired yet, at a cost proportional to the number
+    of keys expiring rather than to the number stored.
+    """
+
+    def __init__(self, resolution=1.0, slots=512):
+        """
+        Initializes the timing wheel.
+
+        Parameters:
+            resolution (float): Length of a tick in seconds.
+            slots (int): Number of slots in the wheel. Keys expiring more than
+                slots ticks ahead stay in their slot for several turns.
+        """
+        self.resolution = resolution
+        self._slots = [set() for _ in range(slots)]
+        self._expirations = {}
+        # The first tick whose slot has not been swept yet
+        self._tick = self._current_tick(time.monotonic())
+
+    def __len__(self):
+        self._advance(time.monotonic())
+        return len(self._expirations)
+
+    def __contains__(self, key):
+        return self.remaining(key) > 0
+
+    def _current_tick(self, now):
+        return int(now / self.resolution)
+
+    def _slot(self, expires_at):
+        return self._slots[self._current_tick(expires_at) % len(self._slots)]
+
+    def _advance(self, now):
+        tick = self._current_tick(now)
+
+        # Only ticks that have fully passed are swept, and passing more ticks
+        # than there are slots would only visit the same slots again
+        for passed in range(self._tick, min(tick, self._tick + len(self._slots))):
+            slot = self._slots[passed % len(self._slots)]
+            expired = [key for key in slot if self._expirations[key] <= now]
+            for key in expired:
+                slot.discard(key)
+                del self._expirations[key]
+
+        self._tick = max(self._tick, tick)
+
+    def add(self, key, duration):
+        """
+        Add a key that expires after a duration, replacing its previous expiry.
+
+        Parameters:
+            key: The key, such as a (channel ID, command, user ID) tuple.
+            duration (float): Seconds until the key expires.
+        """
+        now = time.monotonic()
+        self._advance(now)
+
+        previous = self._expirations.get(key)
+        if previous is not None:
+            self._slot(previous).discard(key)
+
+        if duration <= 0:
+            self._expirations.pop(key, None)
+            return
+
+        expires_at = now + duration
+        self._expirations[key] = expires_at
+        self._slot(expires_at).add(key)
+
+    def remaining(self, key):
+        """
+        Get the number of seconds until a key expires.
+
+        Parameters:
+            key: The key.
+
+        Returns:
+            float: The remaining seconds, 0 if the key is not in the wheel or has expired.
+        """
+        now = time.monotonic()
+        self._advance(now)
+
+        expires_at = self._expirations.get(key)
+        return max(0.0, expires_at - now) if expires_at is not None else 0.0
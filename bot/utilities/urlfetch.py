@@ -0,0 +1,380 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from bot.utilities import metrics
+from bot.utilities.lru_cache import LRUCache
+
+# Seconds a fetched response is served from the cache when the command sets no TTL
+URLFETCH_DEFAULT_TTL = 30
+
+# Seconds after expiry during which a stale response is still served while it is refreshed in the background
+URLFETCH_STALE_WINDOW = 300
+
+# Total memory budget of cached response bodies, in bytes
+URLFETCH_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Largest response body kept in the cache, in bytes. Line fetches of larger bodies are streamed instead.
+URLFETCH_CACHE_MAX_ENTRY_BYTES = 256 * 1024
+
+# Maximum number of bytes read from a single response
+URLFETCH_MAX_BYTES = 1024 * 1024
+
+# Timeouts in seconds for connecting, for each read, and for the whole request
+URLFETCH_CONNECT_TIMEOUT = 3
+URLFETCH_READ_TIMEOUT = 5
+URLFETCH_TOTAL_TIMEOUT = 10
+
+# Connection pool limits and DNS cache lifetime in seconds of the shared session
+URLFETCH_MAX_CONNECTIONS = 50
+URLFETCH_MAX_CONNECTIONS_PER_HOST = 4
+URLFETCH_DNS_CACHE_TTL = 300
+
+URLFETCH_CHUNK_SIZE = 16 * 1024
+
+
+class UrlFetchError(Exception):
+    """
+    Raised when a URL cannot be fetched.
+    """
+
+
+class CacheEntry:
+    """
+    A cached urlfetch response.
+    """
+
+    __slots__ = ("body", "size", "etag", "last_modified", "fetched_at")
+
+    def __init__(self, body, size, etag, last_modified):
+        """
+        Initializes a cache entry.
+
+        Parameters:
+            body (str): The decoded response body.
+            size (int): The size of the response body in bytes.
+            etag (str): The response's ETag header, if any.
+            last_modified (str): The response's Last-Modified header, if any.
+        """
+        self.body = body
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic()
+
+
+# Cached responses keyed by URL, evicted least recently used first once over budget
+_cache = LRUCache(URLFETCH_CACHE_MAX_BYTES, weigher=lambda entry: entry.size)
+
+# Fetches currently in progress, keyed by URL, so concurrent requests for a URL share one download
+_inflight = {}
+
+# Shared client session, created on first use
+_session = None
+
+
+def get_session():
+    """
+    Get the shared urlfetch client session, creating it on first use.
+
+    The session keeps connections alive between fetches, caches DNS lookups
+    and applies the URLFETCH_*_TIMEOUT timeouts to every request.
+
+    Returns:
+    - aiohttp.ClientSession: The shared session.
+    """
+    global _session
+
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=URLFETCH_MAX_CONNECTIONS,
+                                           limit_per_host=URLFETCH_MAX_CONNECTIONS_PER_HOST,
+                                           ttl_dns_cache=URLFETCH_DNS_CACHE_TTL),
+            timeout=aiohttp.ClientTimeout(total=URLFETCH_TOTAL_TIMEOUT,
+                                          connect=URLFETCH_CONNECT_TIMEOUT,
+                                          sock_read=URLFETCH_READ_TIMEOUT),
+        )
+
+    return _session
+
+
+async def close_session():
+    """
+    Close the shared urlfetch client session, if it was opened.
+    """
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+
+def _conditional_headers(entry):
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+def _decode(raw, response):
+    # The declared charset is used as is, since aiohttp can only guess one from a fully read body
+    try:
+        return raw.decode(response.charset or "utf-8", errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def _check_declared_size(response):
+    if response.content_length is not None and response.content_length > URLFETCH_MAX_BYTES:
+        raise UrlFetchError(f"Response is larger than {URLFETCH_MAX_BYTES} bytes.")
+
+
+def _store(url, ttl, response, body, size):
+    # Only successful responses are cached, error pages are returned once
+    if response.status != 200:
+        _cache.pop(url)
+    elif ttl > 0 and size <= URLFETCH_CACHE_MAX_ENTRY_BYTES:
+        _cache.set(url, CacheEntry(body, size, response.headers.get("ETag"), response.headers.get("Last-Modified")))
+
+
+def lookup(url, ttl=URLFETCH_DEFAULT_TTL):
+    """
+    Get a URL's body from the cache without making any request.
+
+    Fresh entries are returned as is. Entries that expired less than
+    URLFETCH_STALE_WINDOW seconds ago are returned too, and a conditional
+    refresh is started in the background.
+
+    Parameters:
+    - url (str): The URL.
+    - ttl (int): Seconds the response stays fresh, 0 disables caching.
+
+    Returns:
+    - str or None: The cached body, or None if the URL must be fetched.
+    """
+    if ttl <= 0:
+        return None
+
+    entry = _cache.get(url)
+    if entry is None:
+        metrics.increment("luminbot_urlfetch_cache_total", result="miss")
+        return None
+
+    age = time.monotonic() - entry.fetched_at
+
+    if age <= ttl:
+        metrics.increment("luminbot_urlfetch_cache_total", result="hit")
+        return entry.body
+
+    if age <= ttl + URLFETCH_STALE_WINDOW:
+        metrics.increment("luminbot_urlfetch_cache_total", result="stale")
+        if url not in _inflight:
+            task = asyncio.create_task(fetch(url, ttl))
+            # Background refreshes report their own errors, the stale body has already been served
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return entry.body
+
+    metrics.increment("luminbot_urlfetch_cache_total", result="expired")
+    return None
+
+
+async def fetch(url, ttl=URLFETCH_DEFAULT_TTL):
+    """
+    Fetch a URL's body, revalidating any cached copy with ETag/Last-Modified.
+
+    Concurrent fetches of the same URL share a single request.
+
+    Parameters:
+    - url (str): The URL.
+    - ttl (int): Seconds the response stays fresh, 0 disables caching.
+
+    Returns:
+    - str: The response body.
+
+    Raises:
+    - UrlFetchError: If the request fails.
+    """
+    task = _inflight.get(url)
+    if task is None:
+        task = _inflight[url] = asyncio.ensure_future(_download(url, ttl))
+        task.add_done_callback(lambda _: _inflight.pop(url, None))
+
+    # Shield the shared download so one cancelled caller does not cancel it for the others
+    return await asyncio.shield(task)
+
+
+async def _download(url, ttl):
+    entry = _cache.get(url)
+
+    try:
+        with metrics.timer("luminbot_external_api_seconds", service="urlfetch", endpoint="get"):
+            async with get_session().get(url, headers=_conditional_headers(entry)) as response:
+                if response.status == 304 and entry is not None:
+                    metrics.increment("luminbot_urlfetch_cache_total", result="revalidated")
+                    entry.fetched_at = time.monotonic()
+                    return entry.body
+
+                _check_declared_size(response)
+
+                # Read the body in chunks so an oversized response is rejected before it is fully downloaded
+                chunks = []
+                size = 0
+                async for chunk in response.content.iter_chunked(URLFETCH_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > URLFETCH_MAX_BYTES:
+                        raise UrlFetchError(f"Response is larger than {URLFETCH_MAX_BYTES} bytes.")
+                    chunks.append(chunk)
+
+                body = _decode(b"".join(chunks), response)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+        raise UrlFetchError(str(error) or "Request timed out.") from error
+
+    _store(url, ttl, response, body, size)
+    return body
+
+
+def split_lines(content):
+    """
+    Split a body into lines, ignoring the empty line after a trailing newline.
+
+    Parameters:
+    - content (str): The body.
+
+    Returns:
+    - list: The lines.
+    """
+    lines = content.split("\n")
+    if len(lines) > 1 and lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def select_line(lines, selector):
+    """
+    Select a line from an iterable of lines without keeping them all in memory.
+
+    Parameters:
+    - lines (iterable): The lines.
+    - selector (int or str): The 1-based line number, or 'random' for a uniformly random line.
+
+    Returns:
+    - str or None: The selected line, or None if there is no such line.
+    """
+    selected = None
+
+    for number, line in enumerate(lines, start=1):
+        if selector == "random":
+            # Reservoir sampling keeps every line equally likely in a single pass
+            if random.randrange(number) == 0:
+                selected = line
+        elif number == selector:
+            return line
+
+    return selected
+
+
+async def fetch_line(url, selector, ttl=URLFETCH_DEFAULT_TTL):
+    """
+    Fetch a single line of a URL's body.
+
+    Cached bodies and downloads of the URL in flight are used when available.
+    Otherwise the response is streamed in chunks: a line number stops reading
+    once the line is reached, and a random line is chosen by reservoir
+    sampling, so large bodies are never held in memory. Bodies up to URLFETCH_CACHE_MAX_ENTRY_BYTES are still
+    read completely so they can be cached. A random line needs the whole
+    body, so bodies over URLFETCH_MAX_BYTES are rejected like in fetch.
+
+    Parameters:
+    - url (str): The URL.
+    - selector (int or str): The 1-based line number, or 'random'.
+    - ttl (int): Seconds the response stays fresh, 0 disables caching.
+
+    Returns:
+    - str or None: The selected line, or None if the body has no such line.
+
+    Raises:
+    - UrlFetchError: If the request fails or the line is not within URLFETCH_MAX_BYTES.
+    """
+    # A whole body download of the URL already in flight is joined instead of downloading it again
+    task = _inflight.get(url)
+    if task is not None:
+        return select_line(split_lines(await asyncio.shield(task)), selector)
+
+    entry = _cache.get(url)
+
+    try:
+        with metrics.timer("luminbot_external_api_seconds", service="urlfetch", endpoint="get"):
+            async with get_session().get(url, headers=_conditional_headers(entry)) as response:
+                if response.status == 304 and entry is not None:
+                    metrics.increment("luminbot_urlfetch_cache_total", result="revalidated")
+                    entry.fetched_at = time.monotonic()
+                    return select_line(split_lines(entry.body), selector)
+
+                # Raw chunks kept while the body is still small enough to be cached
+                buffered = []
+                cacheable = True
+                selected = None
+                line_count = 0
+                size = 0
+
+                # Lines are split from fixed size chunks rather than read with the stream reader's
+                # readline, whose buffer limit would reject a single long line
+                pending = []
+                finished = False
+
+                async for chunk in response.content.iter_chunked(URLFETCH_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > URLFETCH_MAX_BYTES:
+                        raise UrlFetchError(f"Response is larger than {URLFETCH_MAX_BYTES} bytes.")
+
+                    if cacheable:
+                        if size <= URLFETCH_CACHE_MAX_ENTRY_BYTES:
+                            buffered.append(chunk)
+                        else:
+                            cacheable = False
+                            buffered = []
+
+                    if selector != "random" and selected is not None and not cacheable:
+                        finished = True
+                        break  # Found, and too large to cache: stop downloading
+
+                    parts = chunk.split(b"\n")
+                    if len(parts) == 1:
+                        pending.append(chunk)
+                        continue
+
+                    pending.append(parts[0])
+                    raw_lines = [b"".join(pending)] + parts[1:-1]
+                    pending = [parts[-1]]
+
+                    for raw_line in raw_lines:
+                        line_count += 1
+                        if selector == "random":
+                            if random.randrange(line_count) == 0:
+                                selected = _decode(raw_line, response)
+                        elif line_count == selector:
+                            selected = _decode(raw_line, response)
+                            break
+
+                    if selector != "random" and selected is not None and not cacheable:
+                        finished = True
+                        break
+
+                # The last line has no trailing newline
+                last_line = b"".join(pending)
+                if not finished and last_line:
+                    line_count += 1
+                    if selector == "random":
+                        if random.randrange(line_count) == 0:
+                            selected = _decode(last_line, response)
+                    elif line_count == selector and selected is None:
+                        selected = _decode(last_line, response)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+        raise UrlFetchError(str(error) or "Request timed out.") from error
+
+    if cacheable:
+        _store(url, ttl, response, _decode(b"".join(buffered), response), size)
+
+    return selected
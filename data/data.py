@@ -1,10 +1,48 @@
 import sqlite3
 import json
 import os
+import functools
 
 # Database file
 DB_FILE = 'data.db'
 
+# Context manager factory timing every storage operation, such as the bot's metrics.timer.
+# It is set with set_timer, so the data layer does not depend on the bot.
+_timer = None
+
+
+def set_timer(timer):
+    """
+    Set the timer recording the duration of storage operations.
+
+    Args:
+        timer (callable): Called with a metric name and labels, returns a context manager.
+    """
+    global _timer
+    _timer = timer
+
+
+def _timed(operation):
+    """
+    Decorator timing every call of a storage operation with the timer set by set_timer.
+
+    Args:
+        operation (str): The operation label.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _timer is None:
+                return function(*args, **kwargs)
+
+            with _timer("luminbot_storage_seconds", operation=operation):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
 
 def create_table():
     """
@@ -22,6 +60,7 @@ def create_table():
     conn.close()
 
 
+@_timed("get_data")
 def get_data(document_id):
     """
     Retrieve data associated with a specific document_id from the 'documents' table.
@@ -41,6 +80,7 @@ def get_data(document_id):
     return json.loads(result[0]) if result else {}
 
 
+@_timed("update_data")
 def update_data(document_id, new_data):
     """
     Update or insert data associated with a specific document_id into the 'documents' table.
@@ -59,6 +99,73 @@ def update_data(document_id, new_data):
     conn.close()
 
 
+@_timed("get_data_many")
+def get_data_many(document_ids):
+    """
+    Retrieve the data of several documents from the 'documents' table in a single query.
+
+    Args:
+        document_ids (list): The unique identifiers of the documents.
+
+    Returns:
+        dict: The data of each document_id, parsed from JSON. Documents that do not
+        exist are mapped to an empty dictionary.
+    """
+    document_ids = [str(document_id) for document_id in document_ids]
+    documents = {document_id: {} for document_id in document_ids}
+
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+
+    # Stay below SQLite's limit on the number of parameters of a single statement
+    for start in range(0, len(document_ids), 500):
+        chunk = document_ids[start:start + 500]
+        c.execute(f'SELECT document_id, data FROM documents WHERE document_id IN ({",".join("?" * len(chunk))})',
+                  chunk)
+        for document_id, document_data in c.fetchall():
+            documents[document_id] = json.loads(document_data)
+
+    conn.close()
+    return documents
+
+
+@_timed("update_data_many")
+def update_data_many(documents):
+    """
+    Update or insert the data of several documents into the 'documents' table in a single transaction.
+
+    Args:
+        documents (dict): The new data of each document_id.
+
+    Returns:
+        None
+    """
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.executemany('INSERT OR REPLACE INTO documents (document_id, data) VALUES (?, ?)',
+                  [(str(document_id), json.dumps(new_data)) for document_id, new_data in documents.items()])
+    conn.commit()
+    conn.close()
+
+
+def iter_documents():
+    """
+    Iterate over every document in the 'documents' table.
+
+    Documents are read and parsed one at a time, so the whole table is never held in memory.
+
+    Yields:
+        tuple: The document_id and its data, parsed from JSON.
+    """
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        for document_id, document_data in conn.execute('SELECT document_id, data FROM documents'):
+            yield document_id, json.loads(document_data)
+    finally:
+        conn.close()
+
+
+@_timed("delete_data")
 def delete_data(document_id):
     """
     Delete data associated with a specific document_id from the 'documents' table.
@@ -76,6 +183,7 @@ def delete_data(document_id):
     conn.close()
 
 
+@_timed("get_sorted_document_ids")
 def get_sorted_document_ids(sort_key):
     """
     Get a sorted list of document IDs based on a specified nested JSON value.
@@ -127,6 +235,7 @@ def get_sorted_document_ids(sort_key):
     return sorted_document_ids
 
 
+@_timed("get_documents_with_key")
 def get_documents_with_key(search_key):
     """
     Get a list of document IDs that contain a specific key within their JSON data.
@@ -174,6 +283,148 @@ def get_documents_with_key(search_key):
     return list_of_ids
 
 
+def create_beatmap_table():
+    """
+    Create the 'beatmaps' table if it doesn't exist in the database.
+    """
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS beatmaps (
+            beatmap_id INTEGER,
+            mods INTEGER,
+            data TEXT,
+            fetched_at REAL,
+            PRIMARY KEY (beatmap_id, mods)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+@_timed("get_beatmap")
+def get_beatmap(beatmap_id, mods):
+    """
+    Retrieve a cached beatmap from the 'beatmaps' table.
+
+    Args:
+        beatmap_id (int): The osu! beatmap ID.
+        mods (int): The difficulty changing mods the beatmap was fetched with.
+
+    Returns:
+        tuple: The beatmap data parsed from JSON and the time it was fetched, or None if it is not cached.
+    """
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute('SELECT data, fetched_at FROM beatmaps WHERE beatmap_id = ? AND mods = ?', (beatmap_id, mods))
+    result = c.fetchone()
+    conn.close()
+    return (json.loads(result[0]), result[1]) if result else None
+
+
+@_timed("update_beatmap")
+def update_beatmap(beatmap_id, mods, beatmap_data, fetched_at):
+    """
+    Update or insert a cached beatmap into the 'beatmaps' table.
+
+    Args:
+        beatmap_id (int): The osu! beatmap ID.
+        mods (int): The difficulty changing mods the beatmap was fetched with.
+        beatmap_data (dict): The beatmap data.
+        fetched_at (float): The time the beatmap was fetched, in seconds since the epoch.
+
+    Returns:
+        None
+    """
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute('INSERT OR REPLACE INTO beatmaps (beatmap_id, mods, data, fetched_at) VALUES (?, ?, ?, ?)',
+              (beatmap_id, mods, json.dumps(beatmap_data), fetched_at))
+    conn.commit()
+    conn.close()
+
+
+@_timed("get_recent_beatmaps")
+def get_recent_beatmaps(limit):
+    """
+    Retrieve the most recently fetched beatmaps from the 'beatmaps' table.
+
+    Args:
+        limit (int): The maximum number of beatmaps.
+
+    Returns:
+        list: (beatmap_id, mods, data, fetched_at) tuples with the data parsed from JSON, most recent first.
+    """
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute('SELECT beatmap_id, mods, data, fetched_at FROM beatmaps ORDER BY fetched_at DESC LIMIT ?', (limit,))
+    rows = c.fetchall()
+    conn.close()
+    return [(beatmap_id, mods, json.loads(beatmap_data), fetched_at)
+            for beatmap_id, mods, beatmap_data, fetched_at in rows]
+
+
+def create_pp_result_table():
+    """
+    Create the 'pp_results' table if it doesn't exist in the database.
+    """
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS pp_results (
+            cache TEXT,
+            key TEXT,
+            data TEXT,
+            fetched_at REAL,
+            PRIMARY KEY (cache, key)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+@_timed("get_pp_result")
+def get_pp_result(cache, key):
+    """
+    Retrieve a cached PP result from the 'pp_results' table.
+
+    Args:
+        cache (str): The name of the cache the result belongs to.
+        key (str): The key of the result within the cache.
+
+    Returns:
+        tuple: The result parsed from JSON and the time it was fetched, or None if it is not cached.
+    """
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute('SELECT data, fetched_at FROM pp_results WHERE cache = ? AND key = ?', (cache, key))
+    result = c.fetchone()
+    conn.close()
+    return (json.loads(result[0]), result[1]) if result else None
+
+
+@_timed("update_pp_result")
+def update_pp_result(cache, key, result_data, fetched_at):
+    """
+    Update or insert a cached PP result into the 'pp_results' table.
+
+    Args:
+        cache (str): The name of the cache the result belongs to.
+        key (str): The key of the result within the cache.
+        result_data (dict): The result.
+        fetched_at (float): The time the result was fetched, in seconds since the epoch.
+
+    Returns:
+        None
+    """
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute('INSERT OR REPLACE INTO pp_results (cache, key, data, fetched_at) VALUES (?, ?, ?, ?)',
+              (cache, key, json.dumps(result_data), fetched_at))
+    conn.commit()
+    conn.close()
+
+
 if not os.path.exists(DB_FILE):
     create_table()
 else:
@@ -184,3 +435,6 @@ else:
     conn.close()
     if not table_exists:
         create_table()
+
+create_beatmap_table()
+create_pp_result_table()